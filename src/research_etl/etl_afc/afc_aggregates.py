@@ -0,0 +1,102 @@
+import datetime
+from dataclasses import dataclass
+from typing import List
+
+import sqlalchemy as sa
+
+from research_etl.utils.util_rds import DatabaseManager
+from research_etl.utils.util_logging import ProcessLogger
+
+# half-hour of trxtime, as the timestamp the half-hour starts at
+HALF_HOUR = "date_trunc('hour', trxtime) + floor(date_part('minute', trxtime) / 30) * interval '30 minutes'"
+
+
+@dataclass
+class AggregateTable:
+    """daily summary table of an afc table, refreshed by service date after each load of the afc table"""
+
+    table: str
+    # afc table summarized
+    source_table: str
+    # grouping columns of summary table, as selected from source_table
+    group_columns: List[str]
+    # aggregate columns of summary table, as selected from source_table
+    aggregate_columns: List[str]
+    # extra filter of source_table rows
+    where: str = "TRUE"
+
+    def refresh_queries(self, first_date: datetime.date, last_date: datetime.date) -> List[str]:
+        """
+        DELETE and INSERT replacing rows of summary table for service dates from first_date to last_date
+        """
+        date_range = f"servicedate BETWEEN '{first_date}' AND '{last_date}'"
+        return [
+            f"DELETE FROM {self.table} WHERE {date_range}",
+            (
+                f"INSERT INTO {self.table} "
+                f"SELECT {', '.join(self.group_columns + self.aggregate_columns)} "
+                f"FROM {self.source_table} "
+                f"WHERE {date_range} AND {self.where} "
+                f"GROUP BY {', '.join(str(i + 1) for i in range(len(self.group_columns)))}"
+            ),
+        ]
+
+
+AFC_AGGREGATE_TABLES = [
+    AggregateTable(
+        "afc.faregate_halfhour",
+        "afc.faregate",
+        group_columns=["servicedate", f"{HALF_HOUR} AS halfhour", "tarifflocationid", "eventcode"],
+        aggregate_columns=["count(*) AS event_count"],
+    ),
+    AggregateTable(
+        "afc.ridership_daily",
+        "afc.ridership",
+        group_columns=["servicedate", "tariffversion", "articleno", "ticketstocktype"],
+        aggregate_columns=["count(*) AS transaction_count", "sum(fareoptamount) AS fareoptamount"],
+        where="testsaleflag IS DISTINCT FROM B'1'",
+    ),
+]
+
+
+def refresh_aggregates(
+    db_manager: DatabaseManager, source_table: str, first_date: datetime.date, last_date: datetime.date
+) -> int:
+    """
+    refresh every summary table of afc table for service dates from first_date to last_date, in one transaction
+
+    only the loaded service dates are aggregated, so summary tables stay
+    current without scanning the whole afc table
+
+    :param source_table: schema qualified afc table loaded
+    :param first_date: first service date loaded
+    :param last_date: last service date loaded
+
+    :return: number of summary tables refreshed
+    """
+    aggregates = [aggregate for aggregate in AFC_AGGREGATE_TABLES if aggregate.source_table == source_table]
+    if not aggregates:
+        return 0
+
+    refresh_log = ProcessLogger(
+        "afc_refresh_aggregates",
+        source_table=source_table,
+        first_date=first_date,
+        last_date=last_date,
+    )
+    refresh_log.log_start()
+
+    statements = []
+    for aggregate in aggregates:
+        statements += aggregate.refresh_queries(first_date, last_date)
+
+    try:
+        db_manager.execute_transaction([sa.text(statement) for statement in statements])
+    except Exception as exception:
+        refresh_log.log_failure(exception)
+        raise exception
+
+    refresh_log.add_metadata(tables=" | ".join(aggregate.table for aggregate in aggregates))
+    refresh_log.log_complete()
+
+    return len(aggregates)
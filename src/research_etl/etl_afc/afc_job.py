@@ -1,65 +1,39 @@
 import os
 import re
 import datetime
-import tarfile
-import shutil
+import time
 import tempfile
-from typing import List
-from typing import Optional
+from functools import partial
+from typing import Dict, List, Optional, Tuple
 
 import sqlalchemy as sa
 
 from research_etl.utils.util_rds import DatabaseManager
 from research_etl.utils.util_rds import afc_copy
 from research_etl.utils.util_logging import ProcessLogger
-from research_etl.etl_afc.lookup_tables import deviceclass
-from research_etl.etl_afc.lookup_tables import event
-from research_etl.etl_afc.lookup_tables import eventgroup
-from research_etl.etl_afc.lookup_tables import holiday
-from research_etl.etl_afc.lookup_tables import mbta_weekend_service
-from research_etl.etl_afc.lookup_tables import routes
-from research_etl.etl_afc.lookup_tables import tariffversions
-from research_etl.etl_afc.lookup_tables import tickettype
-from research_etl.etl_afc.lookup_tables import tvmstation
-from research_etl.etl_afc.lookup_tables import tvmtable
-from research_etl.etl_afc.lookup_tables import LookupTables
+from research_etl.utils.util_partitions import PartitionManager
+from research_etl.utils.util_partitions import PartitionedTable
+from research_etl.utils.util_partitions import partition_months
+from research_etl.utils.util_partitions import partition_table_name
+from research_etl.utils.util_scheduler import JobScheduler
+from research_etl.utils.util_scheduler import ScheduledJob
+from research_etl.etl_afc.afc_split import split_by_month
+from research_etl.etl_afc.afc_lookups import load_lookups
+from research_etl.etl_afc.afc_aggregates import refresh_aggregates
+from research_etl.etl_afc.afc_ledger import LedgerEntry
+from research_etl.etl_afc.afc_ledger import is_loaded
+from research_etl.etl_afc.afc_ledger import record_load
 from research_etl.utils.util_aws import file_list_from_s3
 from research_etl.utils.util_aws import rename_s3_object
 from research_etl.utils.util_aws import delete_object
-from research_etl.utils.util_aws import download_file
+from research_etl.utils.util_aws import object_etag
 
 
-def verify_partition(date: datetime.date, table: str, db_manager: DatabaseManager) -> None:
-    """
-    check if table partition exists for afc table and date
-    if does not exist, create partition
-    """
-    partition_table = f"{table}_y{date.strftime('%Y')}m{date.strftime('%m')}"
-    check_query = (
-        "SELECT EXISTS ( "
-        "    SELECT FROM pg_tables WHERE "
-        "       schemaname = 'afc' "
-        f"       AND tablename = '{partition_table}'"
-        ");"
-    )
-    check_bool = db_manager.select_as_list(sa.text(check_query))[0]["exists"]
-
-    if check_bool:
-        # table already exists, do nothing
-        return
-
-    # create new partition table
-    from_month = datetime.date(date.year, date.month, 1)
-    if date.month == 12:
-        to_month = datetime.date(date.year + 1, 1, 1)
-    else:
-        to_month = datetime.date(date.year, date.month + 1, 1)
-
-    create_query = (
-        f"CREATE TABLE afc.{partition_table} PARTITION OF afc.{table} "
-        f"FOR VALUES FROM ('{from_month}') TO ('{to_month}');"
-    )
-    db_manager.execute(sa.text(create_query))
+# afc tables partitioned by month of servicedate
+AFC_PARTITIONED_TABLES = [
+    PartitionedTable("afc", "faregate", "servicedate", brin_indexes=[["trxtime"]]),
+    PartitionedTable("afc", "ridership", "servicedate", brin_indexes=[["trxtime"]]),
+]
 
 
 def get_afc_headers(afc_type: str) -> Optional[List[str]]:
@@ -108,9 +82,76 @@ def get_afc_headers(afc_type: str) -> Optional[List[str]]:
     return afc_headers.get(afc_type)
 
 
-def load_afc_data(s3_object: str, db_manager: DatabaseManager, afc_type: str) -> None:
+def afc_load_type(object_name: str) -> Optional[str]:
+    """
+    load type of afc file, "ridership", "faregate" or "lookups", None if file has no load process
+    """
+    if "_ridership_" in object_name.lower():
+        return "ridership"
+    if "_faregate_" in object_name.lower():
+        return "faregate"
+    if "afc_lookups_" in object_name.lower():
+        return "lookups"
+    return None
+
+
+def service_date_range(file_name: str) -> Tuple[datetime.date, datetime.date]:
+    """
+    first and last service date loaded from fargate or ridership file
+
+    bulk import files cover the range of dates in their name, other files
+    cover the one service date their name starts with
+    """
+    if "bulk_import" in file_name:
+        start_date, end_date = re.findall(r"(\d{8})", file_name)[:2]
+        return (
+            datetime.datetime.strptime(start_date, "%Y%m%d").date(),
+            datetime.datetime.strptime(end_date, "%Y%m%d").date(),
+        )
+
+    service_date = datetime.datetime.strptime(file_name[:8], "%Y%m%d").date()
+    return service_date, service_date
+
+
+def file_partitions(object_name: str) -> Dict[str, List[datetime.date]]:
+    """
+    afc table -> months of partitions loaded by fargate or ridership file
+
+    empty for other files, and for files without service dates in their
+    name, whose load fails and is logged by load_afc_file
+    """
+    afc_type = afc_load_type(object_name)
+    if afc_type not in ("faregate", "ridership"):
+        return {}
+
+    try:
+        return {f"afc.{afc_type}": partition_months(*service_date_range(object_name))}
+    except ValueError:
+        return {}
+
+
+def create_pending_partitions(s3_objects: List[str], partition_manager: PartitionManager) -> None:
+    """
+    create partitions needed by every file to load, and partitions of this month and next month, in one batch
+    """
+    pending_months = partition_manager.months_ahead(datetime.date.today())
+    for s3_object in s3_objects:
+        for table, months in file_partitions(s3_object.split("/")[-1]).items():
+            pending_months.setdefault(table, []).extend(months)
+
+    partition_manager.ensure_partitions(pending_months)
+
+
+def load_afc_data(
+    s3_object: str, db_manager: DatabaseManager, afc_type: str, partition_manager: PartitionManager
+) -> int:
     """
     load fargate or ridership data into RDS from csv.gz file
+
+    partitions are usually created ahead by run, missing partitions are
+    created by partition_manager
+
+    :return: number of rows loaded
     """
     headers = get_afc_headers(afc_type)
     if headers is None:
@@ -118,74 +159,209 @@ def load_afc_data(s3_object: str, db_manager: DatabaseManager, afc_type: str) ->
 
     file_name = s3_object.split("/")[-1]
 
-    # handle bulk import that could cover many monthly table partitions
+    # handle bulk import
     if "bulk_import" in file_name:
-        start_date, end_date = re.findall(r"(\d{8})", file_name)[:2]
+        return load_afc_bulk(s3_object, db_manager, afc_type, partition_manager)
 
-        start_date_dt = datetime.datetime.strptime(start_date, "%Y%m%d").date()
-        end_date_dt = datetime.datetime.strptime(end_date, "%Y%m%d").date()
+    # handle import for one service_date
+    service_date, _ = service_date_range(file_name)
+    partition_manager.ensure_partitions({f"afc.{afc_type}": [service_date]})
+
+    delete_query = f"DELETE FROM afc.{afc_type} WHERE servicedate = '{service_date}';"
+    db_manager.execute(sa.text(delete_query))
+
+    return afc_copy(s3_object, f"afc.{afc_type}", headers, db_manager, null_as=False)
 
-        partition_date = start_date_dt.replace(day=1)
 
-        while partition_date <= end_date_dt:
-            verify_partition(partition_date, afc_type, db_manager)
-            if partition_date.month == 12:
-                partition_date = partition_date.replace(year=partition_date.year + 1, month=1)
-            else:
-                partition_date = partition_date.replace(month=partition_date.month + 1)
+def load_afc_bulk(
+    s3_object: str, db_manager: DatabaseManager, afc_type: str, partition_manager: PartitionManager
+) -> int:
+    """
+    load fargate or ridership bulk import, that could cover many monthly table partitions, by partition swap
+
+    file is split into one csv file per month of servicedate in one pass,
+    and files whose servicedate range is outside of the date range in
+    their name are rejected. each month of the file name date range is
+    then swapped in for its monthly partition by partition_manager,
+    COPYing the month file straight into the new partition table, with
+    rows of the month outside of the date range kept. months are loaded
+    in parallel by AFC_BULK_WORKERS workers, within each of the
+    AFC_MAX_WORKERS file loads. no rows are deleted from partitions, and
+    readers never see a partly loaded month.
+
+    :return: number of rows loaded
+    """
+    headers = get_afc_headers(afc_type)
+    if headers is None:
+        raise IndexError(f"{afc_type} is not a supported AFC data load type")
 
-        delete_query = (
-            f"DELETE FROM afc.{afc_type} WHERE servicedate >= '{start_date_dt}' AND servicedate <= '{end_date_dt}';"
+    start_date_dt, end_date_dt = service_date_range(s3_object.split("/")[-1])
+
+    with tempfile.TemporaryDirectory() as split_dir:
+        split = split_by_month(s3_object, headers, split_dir)
+        if split.first_date is not None and (split.first_date < start_date_dt or split.last_date > end_date_dt):
+            raise ValueError(
+                f"{s3_object} has servicedate from {split.first_date} to {split.last_date}, "
+                f"outside of file name range {start_date_dt} to {end_date_dt}"
+            )
+
+        def fill_month(month_file: Optional[str], swap_table: str) -> int:
+            if month_file is None:
+                return 0
+            return afc_copy(month_file, swap_table, headers, db_manager, null_as=False)
+
+        jobs = [
+            ScheduledJob(
+                name=str(month),
+                func=partial(
+                    partition_manager.swap_partition,
+                    f"afc.{afc_type}",
+                    month,
+                    partial(fill_month, split.month_files.get(month)),
+                    (start_date_dt, end_date_dt),
+                ),
+            )
+            for month in partition_months(start_date_dt, end_date_dt)
+        ]
+        scheduler = JobScheduler(
+            max_workers=int(os.getenv("AFC_BULK_WORKERS", "2")),
+            scheduler_name="afc_bulk_month_load",
         )
-        db_manager.execute(sa.text(delete_query))
+        results = scheduler.run(jobs)
+        scheduler.raise_for_failures()
 
-    # handle import for one service_date
-    else:
-        service_date = datetime.datetime.strptime(file_name[:8], "%Y%m%d").date()
+    return sum(result.result for result in results.values())
 
-        verify_partition(service_date, afc_type, db_manager)
 
-        delete_query = f"DELETE FROM afc.{afc_type} WHERE servicedate = '{service_date}';"
-        db_manager.execute(sa.text(delete_query))
+def ledger_entry(s3_object: str) -> LedgerEntry:
+    """
+    load ledger entry of afc file, with ETag and size of s3 object and service dates from file name
+    """
+    object_name = s3_object.split("/")[-1]
+    afc_type = afc_load_type(object_name)
+    if afc_type is None:
+        raise NotImplementedError(f"No AFC load process for: {s3_object}")
+
+    etag, object_size = object_etag(s3_object)
+    entry = LedgerEntry(s3_object=s3_object, etag=etag, object_size=object_size, afc_type=afc_type)
+    if afc_type != "lookups":
+        entry.first_service_date, entry.last_service_date = service_date_range(object_name)
 
-    afc_copy(s3_object, f"afc.{afc_type}", headers, null_as=False)
+    return entry
 
 
-def load_lookups(s3_object: str, db_manager: DatabaseManager) -> None:
+def load_afc_file(
+    s3_object: str, db_manager: DatabaseManager, partition_manager: PartitionManager, s3_error_prefix: str
+) -> int:
     """
-    load afc_lookups_.csv.tar.gz file into RDS
+    load one afc file from s3, delete file if loaded, otherwise move file to s3_error_prefix
+
+    files with the same ETag and size as the most recent load of their
+    service dates are not loaded again, and are deleted. every load is
+    recorded in the load ledger, with its row count and duration. summary
+    tables of the loaded afc table are refreshed for the service dates of
+    the file after its load is recorded complete. a failed refresh is logged
+    and does not fail the file, so the file is not loaded again.
+
+    failures are logged and not raised, so a failed file does not stop
+    files scheduled after it
+
+    :return: number of rows loaded, 0 if load failed or was skipped
     """
-    # download lookup file to temp directory
-    temp_dir = tempfile.mkdtemp()
     object_name = s3_object.split("/")[-1]
-    full_local_path = os.path.join(temp_dir, object_name)
-    download_file(s3_object, full_local_path)
-
-    # extract csv files from tar archive
-    afc_folder = os.path.join(temp_dir, "afc_lookups/")
-    with tarfile.open(full_local_path) as afc_tar:
-        afc_tar.extractall(afc_folder)
-
-    afc_tables: List[LookupTables] = [
-        deviceclass,
-        event,
-        eventgroup,
-        holiday,
-        mbta_weekend_service,
-        routes,
-        tariffversions,
-        tickettype,
-        tvmstation,
-        tvmtable,
-    ]
-
-    for table in afc_tables:
-        full_path = os.path.join(afc_folder, table["file_name"])
-        table_name = f"afc.{table['file_name'].lower().replace('.csv','')}"
-        db_manager.truncate_table(table_name, restart_identity=True)
-        afc_copy(full_path, table_name, table["columns"])
-
-    shutil.rmtree(temp_dir, ignore_errors=True)
+
+    afc_log = ProcessLogger("afc_load_file", s3_object=s3_object)
+    afc_log.log_start()
+
+    start = time.monotonic()
+    entry: Optional[LedgerEntry] = None
+    try:
+        entry = ledger_entry(s3_object)
+        afc_log.add_metadata(etag=entry.etag, object_size=entry.object_size)
+
+        if is_loaded(db_manager, entry):
+            record_load(db_manager, entry, "skipped", 0, time.monotonic() - start)
+            delete_object(s3_object)
+            afc_log.add_metadata(skipped=True)
+            afc_log.log_complete()
+            return 0
+
+        if entry.afc_type == "lookups":
+            row_count = load_lookups(s3_object, db_manager)
+        else:
+            row_count = load_afc_data(s3_object, db_manager, entry.afc_type, partition_manager)
+
+        record_load(db_manager, entry, "complete", row_count, time.monotonic() - start)
+
+    except Exception as exception:
+        rename_s3_object(s3_object, os.path.join(s3_error_prefix, object_name))
+        if entry is not None:
+            try:
+                record_load(db_manager, entry, "failed", 0, time.monotonic() - start)
+            except Exception as ledger_exception:
+                afc_log.add_metadata(ledger_exception=ledger_exception)
+        afc_log.log_failure(exception)
+        return 0
+
+    delete_object(s3_object)
+    afc_log.add_metadata(row_count=row_count)
+
+    if entry.afc_type != "lookups":
+        try:
+            refresh_aggregates(db_manager, f"afc.{entry.afc_type}", entry.first_service_date, entry.last_service_date)
+        except Exception as aggregate_exception:
+            # loaded rows are committed, summary rows of these dates stay stale until the dates are loaded again
+            afc_log.add_metadata(aggregate_exception=aggregate_exception)
+
+    afc_log.log_complete()
+
+    return row_count
+
+
+def afc_load_jobs(
+    s3_objects: List[str], db_manager: DatabaseManager, partition_manager: PartitionManager, s3_error_prefix: str
+) -> List[ScheduledJob]:
+    """
+    create scheduler jobs to load afc files, in file name order
+
+    files loading into the same monthly partition run one at a time, in
+    file name order, so deletes and loads of a partition do not interleave.
+    lookup loads run alone: they start after every earlier file is loaded
+    and every later file starts after them.
+    """
+    jobs: List[ScheduledJob] = []
+    # monthly partition -> name of last job loading into partition
+    partition_jobs: Dict[str, str] = {}
+    lookup_job: Optional[str] = None
+
+    for s3_object in sorted(s3_objects):
+        object_name = s3_object.split("/")[-1]
+        afc_type = afc_load_type(object_name)
+
+        if afc_type == "lookups":
+            depends_on = [job.name for job in jobs]
+            partition_jobs = {}
+            lookup_job = s3_object
+        else:
+            partitions = [
+                partition_table_name(month, table)
+                for table, months in file_partitions(object_name).items()
+                for month in months
+            ]
+            depends_on = sorted({partition_jobs[p] for p in partitions if p in partition_jobs})
+            if lookup_job is not None:
+                depends_on.append(lookup_job)
+            partition_jobs.update({partition: s3_object for partition in partitions})
+
+        jobs.append(
+            ScheduledJob(
+                name=s3_object,
+                func=partial(load_afc_file, s3_object, db_manager, partition_manager, s3_error_prefix),
+                depends_on=depends_on,
+            )
+        )
+
+    return jobs
 
 
 def run(db_manager: DatabaseManager) -> None:
@@ -196,6 +372,12 @@ def run(db_manager: DatabaseManager) -> None:
 
     each found file should temporarily downoladed locally for processsing and
     then deleted
+
+    files are loaded concurrently by AFC_MAX_WORKERS workers, each running
+    load holds its own connection from the DatabaseManager pool
+
+    partitions needed by every found file, and partitions of this month and
+    next month, are created in one batch before any file is loaded
     """
     s3_in_path = "afc_oracle_db"
     s3_error_path = "afc_oracle_db_error"
@@ -204,29 +386,27 @@ def run(db_manager: DatabaseManager) -> None:
     process_log = ProcessLogger("afc_etl_job")
     process_log.log_start()
 
-    for s3_object in sorted(file_list_from_s3(s3_in_bucket, s3_in_path)):
-        object_name = s3_object.split("/")[-1]
+    start = time.monotonic()
+    s3_objects = file_list_from_s3(s3_in_bucket, s3_in_path)
 
-        afc_log = ProcessLogger("afc_load_file", s3_object=s3_object)
-        afc_log.log_start()
+    partition_manager = PartitionManager(db_manager, AFC_PARTITIONED_TABLES)
+    create_pending_partitions(s3_objects, partition_manager)
 
-        try:
-            if "_ridership_" in object_name.lower():
-                load_afc_data(s3_object, db_manager, "ridership")
-            elif "_faregate_" in object_name.lower():
-                load_afc_data(s3_object, db_manager, "faregate")
-            elif "afc_lookups_" in object_name.lower():
-                load_lookups(s3_object, db_manager)
-            else:
-                raise NotImplementedError(f"No AFC load process for: {s3_object}")
-
-        except Exception as exception:
-            rename_s3_object(s3_object, os.path.join(s3_in_bucket, s3_error_path, object_name))
-            afc_log.log_failure(exception)
-        else:
-            delete_object(s3_object)
-            afc_log.log_complete()
+    jobs = afc_load_jobs(s3_objects, db_manager, partition_manager, os.path.join(s3_in_bucket, s3_error_path))
 
+    scheduler = JobScheduler(
+        max_workers=int(os.getenv("AFC_MAX_WORKERS", "4")),
+        scheduler_name="afc_file_load",
+    )
+    results = scheduler.run(jobs)
+
+    row_count = sum(result.result for result in results.values() if result.result is not None)
+    duration = time.monotonic() - start
+    process_log.add_metadata(
+        file_count=len(jobs),
+        row_count=row_count,
+        rows_per_second=f"{row_count / duration:.0f}",
+    )
     process_log.log_complete()
 
 
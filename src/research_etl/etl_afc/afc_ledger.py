@@ -0,0 +1,77 @@
+import datetime
+from dataclasses import dataclass
+from typing import Optional
+
+import sqlalchemy as sa
+
+from research_etl.utils.util_rds import DatabaseManager
+
+LEDGER_TABLE = "afc.load_ledger"
+
+
+@dataclass
+class LedgerEntry:
+    """AFC file load recorded in load ledger"""
+
+    s3_object: str
+    etag: str
+    object_size: int
+    afc_type: str
+    # service dates covered by file, None for lookup files
+    first_service_date: Optional[datetime.date] = None
+    last_service_date: Optional[datetime.date] = None
+
+
+def sql_value(value: Optional[object]) -> str:
+    """
+    SQL literal of ledger column value
+    """
+    if value is None:
+        return "NULL"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def is_loaded(db_manager: DatabaseManager, entry: LedgerEntry) -> bool:
+    """
+    True if the most recent complete load of the same afc type and service dates loaded an object with the same
+    ETag and size
+
+    only the most recent load is compared, so a file delivered again after
+    a different version of its service dates was loaded is loaded again
+    """
+    last_load_query = (
+        "SELECT etag, object_size "
+        f"FROM {LEDGER_TABLE} "
+        "WHERE status = 'complete' "
+        f"AND afc_type = {sql_value(entry.afc_type)} "
+        f"AND first_service_date IS NOT DISTINCT FROM {sql_value(entry.first_service_date)}::date "
+        f"AND last_service_date IS NOT DISTINCT FROM {sql_value(entry.last_service_date)}::date "
+        "ORDER BY loaded_at DESC "
+        "LIMIT 1"
+    )
+    last_loads = db_manager.select_as_list(sa.text(last_load_query))
+
+    if not last_loads:
+        return False
+    return last_loads[0]["etag"] == entry.etag and last_loads[0]["object_size"] == entry.object_size
+
+
+def record_load(
+    db_manager: DatabaseManager, entry: LedgerEntry, status: str, row_count: int, load_seconds: float
+) -> None:
+    """
+    add load of AFC file to load ledger
+
+    :param status: "complete", "skipped" or "failed"
+    :param row_count: number of rows loaded
+    :param load_seconds: wall time of load
+    """
+    insert_query = (
+        f"INSERT INTO {LEDGER_TABLE} "
+        "(s3_object, etag, object_size, afc_type, first_service_date, last_service_date, "
+        "status, row_count, load_seconds) "
+        f"VALUES ({sql_value(entry.s3_object)}, {sql_value(entry.etag)}, {entry.object_size}, "
+        f"{sql_value(entry.afc_type)}, {sql_value(entry.first_service_date)}, "
+        f"{sql_value(entry.last_service_date)}, {sql_value(status)}, {row_count}, {load_seconds:.3f})"
+    )
+    db_manager.execute(sa.text(insert_query))
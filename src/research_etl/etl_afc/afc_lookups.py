@@ -0,0 +1,188 @@
+import os
+import hashlib
+import tarfile
+from io import BytesIO
+from functools import partial
+from typing import Dict, List, Tuple
+
+import sqlalchemy as sa
+
+from research_etl.utils.util_rds import DatabaseManager
+from research_etl.utils.util_rds import afc_copy_options
+from research_etl.utils.util_rds import open_copy_source
+from research_etl.utils.util_rds import run_copy_with_retry
+from research_etl.utils.util_logging import ProcessLogger
+from research_etl.utils.util_scheduler import JobScheduler
+from research_etl.utils.util_scheduler import ScheduledJob
+from research_etl.etl_afc.lookup_tables import deviceclass
+from research_etl.etl_afc.lookup_tables import event
+from research_etl.etl_afc.lookup_tables import eventgroup
+from research_etl.etl_afc.lookup_tables import holiday
+from research_etl.etl_afc.lookup_tables import mbta_weekend_service
+from research_etl.etl_afc.lookup_tables import routes
+from research_etl.etl_afc.lookup_tables import tariffversions
+from research_etl.etl_afc.lookup_tables import tickettype
+from research_etl.etl_afc.lookup_tables import tvmstation
+from research_etl.etl_afc.lookup_tables import tvmtable
+from research_etl.etl_afc.lookup_tables import LookupTables
+
+AFC_LOOKUP_TABLES: List[LookupTables] = [
+    deviceclass,
+    event,
+    eventgroup,
+    holiday,
+    mbta_weekend_service,
+    routes,
+    tariffversions,
+    tickettype,
+    tvmstation,
+    tvmtable,
+]
+
+LOOKUP_HASH_TABLE = "afc.lookup_hash"
+
+
+def lookup_table_name(table: LookupTables) -> str:
+    """
+    schema qualified table name of afc lookup table
+    """
+    return f"afc.{table['file_name'].lower().replace('.csv','')}"
+
+
+def read_lookup_members(obj_path: str) -> Dict[str, bytes]:
+    """
+    read csv file of every lookup table from local or S3 afc_lookups_.csv.tar.gz file
+
+    tar archive is streamed, members are read in memory and not extracted
+    to disk
+
+    :return: lookup file name -> contents of csv file
+    """
+    file_names = {table["file_name"] for table in AFC_LOOKUP_TABLES}
+
+    members: Dict[str, bytes] = {}
+    with open_copy_source(obj_path) as tar_stream, tarfile.open(fileobj=tar_stream, mode="r|") as lookup_tar:
+        for member in lookup_tar:
+            file_name = os.path.basename(member.name)
+            if not member.isfile() or file_name not in file_names:
+                continue
+            member_file = lookup_tar.extractfile(member)
+            if member_file is not None:
+                members[file_name] = member_file.read()
+
+    missing = sorted(file_names - set(members))
+    if missing:
+        raise FileNotFoundError(f"{obj_path} is missing lookup files: {', '.join(missing)}")
+
+    return members
+
+
+def lookup_hash(table: LookupTables, contents: bytes) -> str:
+    """
+    content hash of lookup csv file, salted with the columns it is loaded into
+    """
+    content_hash = hashlib.sha256(contents)
+    content_hash.update(f"|{','.join(table['columns'])}".encode())
+    return content_hash.hexdigest()
+
+
+def loaded_hashes(db_manager: DatabaseManager) -> Dict[str, str]:
+    """
+    lookup table name -> content hash of csv file last loaded into table
+    """
+    hash_query = f"SELECT table_name, content_hash FROM {LOOKUP_HASH_TABLE}"
+    return {row["table_name"]: row["content_hash"] for row in db_manager.select_as_list(sa.text(hash_query))}
+
+
+def reload_lookup_table(db_manager: DatabaseManager, table: LookupTables, contents: bytes, content_hash: str) -> int:
+    """
+    replace rows of lookup table with rows of csv file, swapped in place
+
+    csv file is copied into an UNLOGGED load table. rows of lookup table are
+    then replaced from the load table and its content hash recorded in one
+    transaction, so readers wait on the swap and see the whole old or the
+    whole new table, never an empty one. the lookup table keeps its oid, so
+    views and grants on it are unchanged.
+
+    :return: number of rows loaded
+    """
+    table_name = lookup_table_name(table)
+    load_table = f"{table_name}_load"
+
+    copy_log = ProcessLogger("afc_lookup_copy", table_name=table_name, content_hash=content_hash)
+    copy_log.log_start()
+
+    def copy_lookup() -> Tuple[int, int]:
+        db_manager.execute(sa.text(f"DROP TABLE IF EXISTS {load_table}"))
+        db_manager.execute(sa.text(f"CREATE UNLOGGED TABLE {load_table} (LIKE {table_name})"))
+        return db_manager.copy_from_stream(load_table, table["columns"], BytesIO(contents), afc_copy_options())
+
+    try:
+        row_count = run_copy_with_retry(copy_lookup, copy_log)
+
+        db_manager.execute_transaction(
+            [
+                sa.text(f"TRUNCATE {table_name}"),
+                sa.text(f"INSERT INTO {table_name} SELECT * FROM {load_table}"),
+                sa.text(
+                    f"INSERT INTO {LOOKUP_HASH_TABLE} (table_name, content_hash, row_count) "
+                    f"VALUES ('{table_name}', '{content_hash}', {row_count}) "
+                    "ON CONFLICT (table_name) DO UPDATE SET "
+                    "content_hash = EXCLUDED.content_hash, row_count = EXCLUDED.row_count, loaded_at = now()"
+                ),
+            ]
+        )
+    finally:
+        db_manager.execute(sa.text(f"DROP TABLE IF EXISTS {load_table}"))
+    db_manager.execute(sa.text(f"ANALYZE {table_name}"))
+
+    return row_count
+
+
+def load_lookups(s3_object: str, db_manager: DatabaseManager) -> int:
+    """
+    load afc_lookups_.csv.tar.gz file into RDS
+
+    only lookup tables whose csv file changed since the last load are
+    reloaded, in parallel by AFC_MAX_WORKERS workers
+
+    :return: number of rows loaded
+    """
+    lookup_log = ProcessLogger("afc_load_lookups", s3_object=s3_object)
+    lookup_log.log_start()
+
+    members = read_lookup_members(s3_object)
+    last_hashes = loaded_hashes(db_manager)
+
+    jobs = []
+    for table in AFC_LOOKUP_TABLES:
+        content_hash = lookup_hash(table, members[table["file_name"]])
+        if last_hashes.get(lookup_table_name(table)) == content_hash:
+            continue
+        jobs.append(
+            ScheduledJob(
+                name=lookup_table_name(table),
+                func=partial(reload_lookup_table, db_manager, table, members[table["file_name"]], content_hash),
+            )
+        )
+
+    scheduler = JobScheduler(
+        max_workers=int(os.getenv("AFC_MAX_WORKERS", "4")),
+        scheduler_name="afc_lookup_load",
+    )
+    results = scheduler.run(jobs)
+    try:
+        scheduler.raise_for_failures()
+    except Exception as exception:
+        lookup_log.log_failure(exception)
+        raise exception
+
+    row_count = sum(result.result for result in results.values())
+    lookup_log.add_metadata(
+        changed_tables=" | ".join(job.name for job in jobs),
+        unchanged_count=len(AFC_LOOKUP_TABLES) - len(jobs),
+        row_count=row_count,
+    )
+    lookup_log.log_complete()
+
+    return row_count
@@ -0,0 +1,122 @@
+import os
+import datetime
+from dataclasses import dataclass, field
+from typing import IO, Any, Dict, List, Optional
+
+import polars
+import pyarrow
+import pyarrow.csv
+
+from research_etl.utils.util_rds import open_copy_source
+from research_etl.utils.util_logging import ProcessLogger
+
+# bytes of decompressed csv parsed at a time when splitting a file by month
+SPLIT_BATCH_BYTES = 16 * 1024 * 1024
+
+
+@dataclass
+class MonthSplit:
+    """afc csv file split into one csv file per month of servicedate"""
+
+    # first day of month -> path of csv file with rows of month, without header
+    month_files: Dict[datetime.date, str] = field(default_factory=dict)
+    # first day of month -> number of rows of month
+    row_counts: Dict[datetime.date, int] = field(default_factory=dict)
+    first_date: Optional[datetime.date] = None
+    last_date: Optional[datetime.date] = None
+
+
+def append_month_rows(
+    batch: polars.DataFrame, split: MonthSplit, month_handles: Dict[datetime.date, IO[bytes]], output_dir: str
+) -> None:
+    """
+    append rows of batch, with service_date column parsed from servicedate, to csv file of their month
+    """
+    batch = batch.with_columns(polars.col("service_date").dt.truncate("1mo").alias("month"))
+    for month_df in batch.partition_by("month"):
+        month: datetime.date = month_df["month"][0]
+        if month not in month_handles:
+            split.month_files[month] = os.path.join(output_dir, f"{month.strftime('%Y%m')}.csv")
+            month_handles[month] = open(split.month_files[month], "wb")  # pylint: disable=consider-using-with
+        month_df.drop("service_date", "month").write_csv(month_handles[month], include_header=False)
+        split.row_counts[month] = split.row_counts.get(month, 0) + month_df.height
+
+
+def text_batch_reader(copy_source: IO[bytes], headers: List[str]) -> Optional[pyarrow.csv.CSVStreamingReader]:
+    """
+    open streaming csv reader of csv stream without header, reading every column as text
+
+    unquoted empty fields are NULL, quoted empty fields are empty strings,
+    so batches are written back as they were read
+
+    :return: reader of record batches of about SPLIT_BATCH_BYTES bytes of csv, None if stream has no rows
+    """
+    convert_options = pyarrow.csv.ConvertOptions(
+        column_types={column: pyarrow.string() for column in headers},
+        null_values=[""],
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=False,
+    )
+
+    try:
+        return pyarrow.csv.open_csv(
+            copy_source,
+            read_options=pyarrow.csv.ReadOptions(column_names=headers, block_size=SPLIT_BATCH_BYTES),
+            convert_options=convert_options,
+        )
+    except pyarrow.ArrowInvalid as parse_error:
+        if "Empty CSV file" in str(parse_error):
+            return None
+        raise parse_error
+
+
+def split_by_month(obj_path: str, headers: List[str], output_dir: str) -> MonthSplit:
+    """
+    split local or S3 csv or csv.gz afc file into one csv file per month of servicedate, in one pass
+
+    file is streamed, decompressed in-process and parsed in batches of
+    SPLIT_BATCH_BYTES bytes of csv, so only the month files are written to
+    output_dir. every column is read as text so values are written back
+    unchanged, unquoted empty fields stay NULL. servicedate values must
+    start with an ISO date.
+
+    :param obj_path: local path or s3 path of file, without header
+    :param headers: columns of file, in file order
+    :param output_dir: directory month files are written to
+
+    :return: month files and actual servicedate range of file
+    """
+    split_log = ProcessLogger("afc_split_by_month", obj_path=obj_path)
+    split_log.log_start()
+
+    split = MonthSplit()
+    service_dates: List[Any] = []
+    month_handles: Dict[datetime.date, IO[bytes]] = {}
+    try:
+        with open_copy_source(obj_path) as copy_source:
+            reader = text_batch_reader(copy_source, headers)
+            for record_batch in reader if reader is not None else []:
+                batch = polars.DataFrame(polars.from_arrow(record_batch)).with_columns(
+                    polars.col("servicedate").str.slice(0, 10).str.to_date("%Y-%m-%d").alias("service_date")
+                )
+                if batch["service_date"].null_count() > 0:
+                    raise ValueError(f"{obj_path} has rows without servicedate")
+
+                service_dates += [batch["service_date"].min(), batch["service_date"].max()]
+                append_month_rows(batch, split, month_handles, output_dir)
+    finally:
+        for month_handle in month_handles.values():
+            month_handle.close()
+
+    if service_dates:
+        split.first_date, split.last_date = min(service_dates), max(service_dates)
+
+    split_log.add_metadata(
+        first_date=split.first_date,
+        last_date=split.last_date,
+        month_count=len(split.month_files),
+        row_count=sum(split.row_counts.values()),
+    )
+    split_log.log_complete()
+
+    return split
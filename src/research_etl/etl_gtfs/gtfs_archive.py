@@ -0,0 +1,144 @@
+import hashlib
+import threading
+import zipfile
+from io import BytesIO
+from types import TracebackType
+from typing import IO, Any, Dict, Iterator, Optional, Protocol, Type, Union
+
+import polars
+import pyarrow.csv
+
+
+class GTFSSource(Protocol):
+    """GTFS tables of a single feed, read by table name"""
+
+    def has_table(self, table_name: str) -> bool:
+        """True if feed contains table"""
+
+    def table_hash(self, table_name: str) -> str:
+        """content hash of table"""
+
+    def read_csv(self, table_name: str, schema: Dict[str, Any]) -> polars.DataFrame:
+        """read schema columns of table"""
+
+    def iter_csv_batches(self, table_name: str, schema: Dict[str, Any], block_size: int) -> Iterator[polars.DataFrame]:
+        """read schema columns of table in batches"""
+
+
+def frame_batches(table_df: polars.DataFrame, block_size: int) -> Iterator[polars.DataFrame]:
+    """
+    slice DataFrame into zero-copy batches of about block_size bytes
+    """
+    batch_rows = max(1, int(table_df.height * block_size / max(table_df.estimated_size(), 1)))
+    for offset in range(0, table_df.height, batch_rows):
+        yield table_df.slice(offset, batch_rows)
+
+
+class GTFSArchive:
+    """
+    GTFS zip file opened once and shared by table readers
+
+    members can be opened and read from multiple threads at the same time
+    """
+
+    def __init__(self, source: Union[str, BytesIO]) -> None:
+        """
+        :param source: path to GTFS zip file or GTFS zip file bytes in memory
+        """
+        self.zip_file = zipfile.ZipFile(source)  # pylint: disable=consider-using-with
+        # ZipFile reads are locked per read, but open is not thread safe
+        self.open_lock = threading.Lock()
+
+    def __enter__(self) -> "GTFSArchive":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """close underlying zip file"""
+        self.zip_file.close()
+
+    def has_table(self, table_name: str) -> bool:
+        """True if archive contains {table_name}.txt"""
+        return f"{table_name}.txt" in self.zip_file.namelist()
+
+    def open_table(self, table_name: str) -> IO[bytes]:
+        """
+        open {table_name}.txt member of archive as a stream
+        """
+        with self.open_lock:
+            return self.zip_file.open(f"{table_name}.txt")
+
+    def table_hash(self, table_name: str) -> str:
+        """
+        sha256 hex digest of {table_name}.txt member of archive
+        """
+        table_hash = hashlib.sha256()
+        with self.open_table(table_name) as table_file:
+            for chunk in iter(lambda: table_file.read(1024 * 1024), b""):
+                table_hash.update(chunk)
+        return table_hash.hexdigest()
+
+    def read_csv(self, table_name: str, schema: Dict[str, Any]) -> polars.DataFrame:
+        """
+        read {table_name}.txt member of archive with polars, loading only schema columns
+
+        schema columns missing from the member, such as columns added to the
+        GTFS spec after the feed was published, are read as NULL, the same as
+        iter_csv_batches
+
+        :param table_name: GTFS table name
+        :param schema: column name -> polars type of columns to read
+        """
+        with self.open_table(table_name) as table_file:
+            csv_bytes = table_file.read()
+
+        header = polars.read_csv(csv_bytes, n_rows=0, infer_schema=False).columns
+        present_schema = {column: dtype for column, dtype in schema.items() if column in header}
+        table_df = polars.read_csv(csv_bytes, schema_overrides=present_schema, columns=list(present_schema.keys()))
+
+        # python types of schema resolved to polars types
+        column_types = polars.DataFrame(schema=schema).schema
+        return table_df.with_columns(
+            polars.lit(None, dtype=column_types[column]).alias(column) for column in schema if column not in header
+        ).select(schema.keys())
+
+    def iter_csv_batches(self, table_name: str, schema: Dict[str, Any], block_size: int) -> Iterator[polars.DataFrame]:
+        """
+        stream {table_name}.txt member of archive as polars DataFrames of about block_size bytes of csv each
+
+        member is decompressed and parsed incrementally, memory used grows with
+        block_size (csv reader reads a number of blocks ahead) and not with
+        member size. values are parsed the same way as read_csv, empty fields
+        and schema columns missing from the member are NULL.
+
+        :param table_name: GTFS table name
+        :param schema: column name -> polars type of columns to read
+        :param block_size: bytes of csv text parsed per batch
+        """
+        arrow_schema = polars.DataFrame(schema=schema).to_arrow().schema
+        convert_options = pyarrow.csv.ConvertOptions(
+            column_types=arrow_schema,
+            include_columns=list(schema.keys()),
+            include_missing_columns=True,
+            null_values=[""],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        )
+
+        with self.open_table(table_name) as table_file:
+            reader = pyarrow.csv.open_csv(
+                table_file,
+                read_options=pyarrow.csv.ReadOptions(block_size=block_size),
+                convert_options=convert_options,
+            )
+            for batch in reader:
+                batch_df = polars.from_arrow(batch)
+                assert isinstance(batch_df, polars.DataFrame)
+                yield batch_df
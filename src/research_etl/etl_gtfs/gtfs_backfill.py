@@ -0,0 +1,272 @@
+import os
+import glob
+import time
+import datetime
+import multiprocessing
+from io import BytesIO
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterator, List, Tuple
+
+import polars
+import sqlalchemy as sa
+
+from research_etl.utils.util_rds import DatabaseManager
+from research_etl.utils.util_logging import ProcessLogger
+
+from research_etl.etl_gtfs.gtfs_archive import GTFSArchive
+from research_etl.etl_gtfs.gtfs_archive import frame_batches
+from research_etl.etl_gtfs.gtfs_schema import DB_GTFS_SCHEMA
+from research_etl.etl_gtfs.gtfs_schema import feed_info_schema
+from research_etl.etl_gtfs.gtfs_job import TABLES_TO_LOAD
+from research_etl.etl_gtfs.gtfs_job import cached_gtfs_source
+from research_etl.etl_gtfs.gtfs_job import feed_tables
+from research_etl.etl_gtfs.gtfs_job import load_feed
+from research_etl.etl_gtfs.gtfs_job import read_feed_info
+from research_etl.etl_gtfs.gtfs_validate import validate_feed
+
+
+@dataclass
+class FeedFile:
+    """GTFS zip file found for backfill"""
+
+    path: str
+    feed_version: str
+    creation_timestamp: datetime.datetime
+    valid_start_date: datetime.date
+    valid_end_date: datetime.date
+
+
+class ParsedGTFSFeed:
+    """
+    GTFS feed parsed in a worker process, with tables held as Arrow IPC buffers
+
+    implements GTFSSource, so a parsed feed is loaded the same way as an
+    open GTFS zip file
+    """
+
+    def __init__(
+        self,
+        tables: Dict[str, bytes],
+        table_hashes: Dict[str, str],
+        violations: List[str],
+        parse_seconds: float,
+    ) -> None:
+        """
+        :param tables: table name -> Arrow IPC buffer of parsed table
+        :param table_hashes: table name -> content hash of table zip member
+        :param violations: feed validation violations, tables are not parsed if any
+        :param parse_seconds: wall time of validating and parsing feed
+        """
+        self.tables = tables
+        self.table_hashes = table_hashes
+        self.violations = violations
+        self.parse_seconds = parse_seconds
+
+    def has_table(self, table_name: str) -> bool:
+        """True if feed contains table"""
+        return table_name in self.tables
+
+    def table_hash(self, table_name: str) -> str:
+        """content hash of table zip member"""
+        return self.table_hashes[table_name]
+
+    def read_csv(self, table_name: str, schema: Dict[str, Any]) -> polars.DataFrame:
+        """read schema columns of parsed table"""
+        return polars.read_ipc(BytesIO(self.tables[table_name]), columns=list(schema.keys()), memory_map=False)
+
+    def iter_csv_batches(self, table_name: str, schema: Dict[str, Any], block_size: int) -> Iterator[polars.DataFrame]:
+        """read schema columns of parsed table in slices of about block_size bytes"""
+        yield from frame_batches(self.read_csv(table_name, schema), block_size)
+
+    @property
+    def byte_count(self) -> int:
+        """size of all Arrow IPC buffers"""
+        return sum(len(table) for table in self.tables.values())
+
+
+def parse_feed(path: str) -> ParsedGTFSFeed:
+    """
+    validate feed and parse every table of GTFS zip file to Arrow IPC, run in worker process
+
+    optional tables missing from older feeds are allowed, feeds are only
+    skipped for missing required tables, key, date or foreign key violations
+
+    tables already in the GTFS_CACHE_DIR cache are read from the cache
+    instead of parsed
+    """
+    start = time.monotonic()
+    tables: Dict[str, bytes] = {}
+    table_hashes: Dict[str, str] = {}
+
+    with GTFSArchive(path) as gtfs_archive:
+        gtfs_source = cached_gtfs_source(gtfs_archive)
+        violations = validate_feed(gtfs_source, TABLES_TO_LOAD)
+        if not violations:
+            table_schemas = [("feed_info", feed_info_schema)] + [
+                (t.table_name, t.schema) for t in feed_tables(gtfs_source)
+            ]
+            for table_name, schema in table_schemas:
+                tables[table_name] = gtfs_source.read_csv(table_name, schema).write_ipc(None).getvalue()
+                table_hashes[table_name] = gtfs_source.table_hash(table_name)
+
+    return ParsedGTFSFeed(tables, table_hashes, violations, time.monotonic() - start)
+
+
+def find_feed_files(directory: str) -> List[FeedFile]:
+    """
+    read feed_info of every GTFS zip file in directory
+
+    files that can not be read, or have no feed_info or an unparsable
+    feed_version, are logged and skipped
+    """
+    feed_files = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.zip"))):
+        try:
+            with GTFSArchive(path) as gtfs_archive:
+                if not gtfs_archive.has_table("feed_info"):
+                    continue
+                feed_info_df = read_feed_info(gtfs_archive)
+        except Exception as exception:
+            skip_log = ProcessLogger("backfill_read_feed_info", path=path, skipped=True)
+            skip_log.log_start()
+            skip_log.log_failure(exception)
+            continue
+
+        feed_files.append(
+            FeedFile(
+                path=path,
+                feed_version=feed_info_df["feed_version"][0],
+                creation_timestamp=feed_info_df["creation_timestamp"][0],
+                valid_start_date=feed_info_df["valid_start_date"][0],
+                valid_end_date=feed_info_df["valid_end_date"][0],
+            )
+        )
+
+    return feed_files
+
+
+def feeds_to_backfill(db_manager: DatabaseManager, feed_files: List[FeedFile]) -> List[FeedFile]:
+    """
+    dedupe feed files and remove feeds already loaded, in chronological order
+
+    feeds are deduped by feed_version. feed partitions are named by valid
+    dates, so when several feed versions share valid dates only the most
+    recently created one is kept.
+    """
+    loaded_query = f"SELECT feed_version, valid_start_date, valid_end_date FROM {DB_GTFS_SCHEMA}.feed_info"
+    loaded_feeds = db_manager.select_as_list(sa.text(loaded_query))
+    loaded_versions = {feed["feed_version"] for feed in loaded_feeds}
+    loaded_dates = {(feed["valid_start_date"], feed["valid_end_date"]) for feed in loaded_feeds}
+
+    feeds_by_dates: Dict[Tuple[datetime.date, datetime.date], FeedFile] = {}
+    for feed_file in sorted(feed_files, key=lambda f: f.creation_timestamp):
+        if feed_file.feed_version in loaded_versions:
+            continue
+        feeds_by_dates[(feed_file.valid_start_date, feed_file.valid_end_date)] = feed_file
+
+    return sorted(
+        (feed for dates, feed in feeds_by_dates.items() if dates not in loaded_dates),
+        key=lambda f: f.creation_timestamp,
+    )
+
+
+def load_parsed_feed(db_manager: DatabaseManager, feed_file: FeedFile, parsed_feed: ParsedGTFSFeed) -> None:
+    """
+    load parsed feed and log its parse and load throughput, feeds that failed validation are skipped
+    """
+    feed_log = ProcessLogger(
+        "backfill_gtfs_feed",
+        feed_version=feed_file.feed_version,
+        path=feed_file.path,
+        parse_seconds=f"{parsed_feed.parse_seconds:.2f}",
+        violation_count=len(parsed_feed.violations),
+    )
+    feed_log.log_start()
+
+    if parsed_feed.violations:
+        feed_log.add_metadata(skipped=True)
+        feed_log.log_failure(ValueError("GTFS feed failed validation:\n" + "\n".join(parsed_feed.violations)))
+        return
+
+    start = time.monotonic()
+    try:
+        row_counts = load_feed(db_manager, parsed_feed)
+    except Exception as exception:
+        feed_log.log_failure(exception)
+        raise exception
+    load_seconds = time.monotonic() - start
+
+    feed_log.add_metadata(
+        load_seconds=f"{load_seconds:.2f}",
+        row_count=sum(row_counts.values()),
+        ipc_bytes=parsed_feed.byte_count,
+        rows_per_second=f"{sum(row_counts.values()) / load_seconds:.0f}",
+        ipc_megabytes_per_second=f"{parsed_feed.byte_count / load_seconds / 1024 / 1024:.1f}",
+    )
+    feed_log.log_complete()
+
+
+def run_backfill(db_manager: DatabaseManager, directory: str, parse_workers: int = 2) -> None:
+    """
+    load every new GTFS feed zip file in directory
+
+    feeds are parsed ahead in a process pool and loaded one at a time in
+    chronological order, so feed_info rows are added in the order feeds
+    were created. at most parse_workers parsed feeds are held in memory
+    while a feed is loading. tables of each feed are loaded with the same
+    bounded database concurrency as the live GTFS job (GTFS_MAX_WORKERS).
+    feeds that fail to parse are logged and skipped, the backfill continues.
+
+    :param db_manager: database to load feeds into
+    :param directory: directory of GTFS zip files
+    :param parse_workers: number of feeds parsed at the same time
+    """
+    process_log = ProcessLogger("gtfs_backfill", directory=directory, parse_workers=parse_workers)
+    process_log.log_start()
+
+    try:
+        feeds = feeds_to_backfill(db_manager, find_feed_files(directory))
+        process_log.add_metadata(feed_count=len(feeds))
+
+        # spawn workers, polars thread pools are not fork safe
+        with ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            feed_iter = iter(feeds)
+            pending: Deque[Tuple[FeedFile, Future]] = deque()
+            for feed_file in feed_iter:
+                pending.append((feed_file, pool.submit(parse_feed, feed_file.path)))
+                if len(pending) == parse_workers:
+                    break
+
+            while pending:
+                feed_file, parse_future = pending.popleft()
+
+                next_feed = next(feed_iter, None)
+                if next_feed is not None:
+                    pending.append((next_feed, pool.submit(parse_feed, next_feed.path)))
+
+                try:
+                    parsed_feed = parse_future.result()
+                except Exception as exception:
+                    # feed that can not be parsed is skipped, like a feed that failed validation
+                    skip_log = ProcessLogger(
+                        "backfill_gtfs_feed", feed_version=feed_file.feed_version, path=feed_file.path, skipped=True
+                    )
+                    skip_log.log_start()
+                    skip_log.log_failure(exception)
+                    continue
+
+                load_parsed_feed(db_manager, feed_file, parsed_feed)
+
+    except Exception as exception:
+        process_log.log_failure(exception)
+        raise exception
+
+    process_log.log_complete()
+
+
+if __name__ == "__main__":
+    local_db = DatabaseManager()
+    run_backfill(local_db, os.environ["GTFS_BACKFILL_DIR"], int(os.getenv("GTFS_BACKFILL_WORKERS", "2")))
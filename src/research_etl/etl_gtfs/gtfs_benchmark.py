@@ -0,0 +1,279 @@
+import os
+import time
+import tempfile
+import datetime
+from typing import Callable, Dict, List, Tuple
+
+import sqlalchemy as sa
+
+from research_etl.utils.util_rds import DatabaseManager
+from research_etl.utils.util_rds import create_db_connection_string
+from research_etl.utils.util_logging import ProcessLogger
+from research_etl.utils.util_binary_copy import copy_dataframes_to_db
+
+from research_etl.etl_gtfs.gtfs_archive import GTFSArchive
+from research_etl.etl_gtfs.gtfs_archive import GTFSSource
+from research_etl.etl_gtfs.gtfs_download import download_gtfs
+from research_etl.etl_gtfs.gtfs_schema import DB_GTFS_SCHEMA
+from research_etl.etl_gtfs.gtfs_schema import GTFSSchema
+from research_etl.etl_gtfs.gtfs_schema import partition_table_name
+from research_etl.etl_gtfs.gtfs_job import TABLES_TO_LOAD
+from research_etl.etl_gtfs.gtfs_job import cached_gtfs_source
+from research_etl.etl_gtfs.gtfs_job import read_feed_info
+from research_etl.etl_gtfs.gtfs_job import read_gtfs_table
+from research_etl.etl_gtfs.gtfs_job import shapes_geog_query
+from research_etl.etl_gtfs.gtfs_job import stops_geog_query
+from research_etl.etl_gtfs.gtfs_job import stop_in_pattern_query
+
+# largest tables of MBTA GTFS feed
+BENCHMARK_TABLES = ["stop_times", "shapes"]
+
+
+def wkt_shapes_geog_query(shapes_table: str) -> str:
+    """
+    SELECT shapes_geog rows building points from WKT text, as built before numeric point constructors
+    """
+    return (
+        "SELECT shape_id"
+        ",ST_MakeLine(array_agg(ST_GeomFromText('POINT(' || shape_pt_lon || ' ' || shape_pt_lat || ')', 4326) ORDER BY shape_pt_sequence))"
+        ",valid_start_date, valid_end_date "
+        f"FROM {shapes_table} "
+        "GROUP BY shape_id, valid_start_date, valid_end_date "
+        "ORDER BY shape_id "
+    )
+
+
+def wkt_stops_geog_query(stops_table: str) -> str:
+    """
+    SELECT stops_geog rows building points from WKT text, as built before numeric point constructors
+    """
+    return (
+        "SELECT stop_id, parent_station "
+        ", ST_GeogFromText('SRID=4326;POINT(' || stop_lon || ' ' || stop_lat || ')') "
+        ", ST_GeomFromText('POINT(' || stop_lon || ' ' || stop_lat || ')', 4326) "
+        ", CASE WHEN stop_lon::decimal BETWEEN -74.0000000 and -69.0000000 "
+        "         AND stop_lat::decimal BETWEEN 41.0000000 and 43.0000000 "
+        "       THEN (st_x(st_transform(st_geomFromText( "
+        "             'POINT(' || stop_lon || ' ' || stop_lat || ')', "
+        "             4326), 3585)) * 1000)::int "
+        "       ELSE null END X "
+        ", CASE WHEN stop_lon::decimal BETWEEN -74.0000000 and -69.0000000 "
+        "         AND stop_lat::decimal BETWEEN 41.0000000 and  43.0000000 "
+        "       THEN (st_y(st_transform(st_geomFromText( "
+        "             'POINT(' || stop_lon || ' ' || stop_lat || ')', "
+        "             4326), 3585)) * 1000)::int "
+        "       ELSE null END Y "
+        ", valid_start_date, valid_end_date "
+        f"FROM {stops_table} "
+        "ORDER BY stop_id "
+    )
+
+
+def per_row_stop_in_pattern_query(
+    shapes_table: str, trips_table: str, routes_table: str, stop_times_table: str, stops_geog_table: str
+) -> str:
+    """
+    SELECT stop_in_pattern rows projecting and measuring shape once per stop, as built before shape projection CTE
+    """
+    return (
+        "SELECT  shg.shape_id, st.stop_sequence, st.stop_id "
+        ",(ST_LineLocatePoint(shape, geom) * ST_Length(ST_Transform(shape,26986)))::INT "
+        ",shg.valid_start_date, shg.valid_end_date "
+        f"FROM {shapes_table} shg "
+        "INNER JOIN ( "
+        "        SELECT shape_id, min(trip_id) trip_id, min(route_id) route_id "
+        f"       FROM {trips_table} "
+        "        GROUP BY shape_id "
+        ") t ON t.shape_id = shg.shape_id "
+        f"INNER JOIN {routes_table} r "
+        "        ON r.route_id = t.route_id "
+        "        AND r.route_type = 3 "
+        f"INNER JOIN {stop_times_table} st "
+        "        ON st.trip_id = t.trip_id "
+        f"INNER JOIN {stops_geog_table} stg "
+        "        ON stg.stop_id = st.stop_id "
+        "ORDER BY shg.shape_id, st.stop_sequence "
+    )
+
+
+# derived table -> (tables built from, build method -> SELECT query of build)
+# the first build method of each table is the baseline speedup is measured against
+GEOMETRY_BUILDS: Dict[str, Tuple[List[str], Dict[str, Callable[..., str]]]] = {
+    "shapes_geog": (["shapes"], {"wkt": wkt_shapes_geog_query, "numeric": shapes_geog_query}),
+    "stops_geog": (["stops"], {"wkt": wkt_stops_geog_query, "numeric": stops_geog_query}),
+    "stop_in_pattern": (
+        ["shapes_geog", "trips", "routes", "stop_times", "stops_geog"],
+        {"per_row": per_row_stop_in_pattern_query, "projected_once": stop_in_pattern_query},
+    ),
+}
+
+
+def time_load(db_manager: DatabaseManager, bench_table: str, like_table: str, load: Callable[[], None]) -> float:
+    """
+    create empty benchmark table like like_table, time load function and drop benchmark table
+
+    Returns:
+        float: load duration in seconds
+    """
+    db_manager.execute(sa.text(f"DROP TABLE IF EXISTS {bench_table}"))
+    db_manager.execute(sa.text(f"CREATE TABLE {bench_table} (LIKE {like_table})"))
+    try:
+        start = time.monotonic()
+        load()
+        return time.monotonic() - start
+    finally:
+        db_manager.execute(sa.text(f"DROP TABLE IF EXISTS {bench_table}"))
+
+
+def benchmark_table_load(
+    db_manager: DatabaseManager,
+    gtfs_archive: GTFSSource,
+    table: GTFSSchema,
+    valid_start_date: datetime.date,
+    valid_end_date: datetime.date,
+) -> Dict[str, float]:
+    """
+    compare polars write_database INSERT path with binary COPY path for one GTFS table
+
+    Returns:
+        Dict[str, float]: load method -> duration in seconds
+    """
+    table_df = read_gtfs_table(gtfs_archive, table, valid_start_date, valid_end_date)
+
+    bench_log = ProcessLogger("benchmark_table_load", table_name=table.table_name, row_count=table_df.height)
+    bench_log.log_start()
+
+    main_table = f"{DB_GTFS_SCHEMA}.{table.table_name}"
+    bench_table = f"{DB_GTFS_SCHEMA}.benchmark_{table.table_name}"
+
+    def write_database() -> None:
+        table_df.write_database(
+            table_name=bench_table,
+            connection=f"postgresql+psycopg2://{create_db_connection_string()}",
+            if_table_exists="append",
+        )
+
+    def binary_copy() -> None:
+        copy_dataframes_to_db(db_manager, bench_table, [table_df], table_df.columns)
+
+    durations = {
+        "write_database": time_load(db_manager, bench_table, main_table, write_database),
+        "binary_copy": time_load(db_manager, bench_table, main_table, binary_copy),
+    }
+
+    bench_log.add_metadata(
+        **{f"{method}_seconds": f"{duration:.2f}" for method, duration in durations.items()},
+        **{f"{method}_rows_per_second": f"{table_df.height / duration:.0f}" for method, duration in durations.items()},
+        speedup=f"{durations['write_database'] / durations['binary_copy']:.1f}",
+    )
+    bench_log.log_complete()
+
+    return durations
+
+
+def table_mismatch_count(db_manager: DatabaseManager, table_a: str, table_b: str) -> int:
+    """
+    count rows in one table and not the other, 0 if tables have the same rows
+    """
+    compare_query = (
+        "SELECT count(*) AS mismatch_count FROM ( "
+        f"(TABLE {table_a} EXCEPT ALL TABLE {table_b}) "
+        "UNION ALL "
+        f"(TABLE {table_b} EXCEPT ALL TABLE {table_a}) "
+        ") mismatch"
+    )
+    return db_manager.select_as_list(sa.text(compare_query))[0]["mismatch_count"]
+
+
+def benchmark_geometry_build(
+    db_manager: DatabaseManager,
+    table_name: str,
+    valid_start_date: datetime.date,
+    valid_end_date: datetime.date,
+) -> Dict[str, float]:
+    """
+    compare baseline and current geometry builds of a derived table from a loaded feed
+
+    both builds are kept until they are compared, mismatch_count is the
+    number of rows in one build and not the other
+
+    Returns:
+        Dict[str, float]: build method -> duration in seconds
+    """
+    build_queries = GEOMETRY_BUILDS[table_name][1]
+    source_tables = [
+        partition_table_name(name, valid_start_date, valid_end_date) for name in GEOMETRY_BUILDS[table_name][0]
+    ]
+    baseline_method, current_method = build_queries
+
+    bench_log = ProcessLogger("benchmark_geometry_build", table_name=table_name, source_table=source_tables[0])
+    bench_log.log_start()
+
+    bench_tables = {method: f"{DB_GTFS_SCHEMA}.benchmark_{table_name}_{method}" for method in build_queries}
+
+    durations = {}
+    try:
+        for method, bench_table in bench_tables.items():
+            db_manager.execute(sa.text(f"DROP TABLE IF EXISTS {bench_table}"))
+            db_manager.execute(sa.text(f"CREATE TABLE {bench_table} (LIKE {DB_GTFS_SCHEMA}.{table_name})"))
+            start = time.monotonic()
+            db_manager.execute(sa.text(f"INSERT INTO {bench_table} {build_queries[method](*source_tables)}"))
+            durations[method] = time.monotonic() - start
+
+        mismatch_count = table_mismatch_count(db_manager, bench_tables[baseline_method], bench_tables[current_method])
+    finally:
+        for bench_table in bench_tables.values():
+            db_manager.execute(sa.text(f"DROP TABLE IF EXISTS {bench_table}"))
+
+    bench_log.add_metadata(
+        **{f"{method}_seconds": f"{duration:.2f}" for method, duration in durations.items()},
+        speedup=f"{durations[baseline_method] / durations[current_method]:.1f}",
+        mismatch_count=mismatch_count,
+    )
+    bench_log.log_complete()
+
+    return durations
+
+
+def run(db_manager: DatabaseManager) -> None:
+    """
+    benchmark GTFS load paths against the current full MBTA GTFS feed, and
+    derived geometry builds against the most recently loaded feed
+
+    benchmark tables are created in the gtfs schema and dropped after each
+    benchmark, no feed data is loaded into partition tables
+    """
+    process_logger = ProcessLogger("benchmark_gtfs")
+    process_logger.log_start()
+
+    gtfs_path = os.path.join(tempfile.gettempdir(), "MBTA_GTFS_benchmark.zip")
+    download_gtfs(gtfs_path)
+    with GTFSArchive(gtfs_path) as gtfs_archive:
+        gtfs_source = cached_gtfs_source(gtfs_archive)
+        feed_info_df = read_feed_info(gtfs_source)
+        valid_start_date = feed_info_df["valid_start_date"][0]
+        valid_end_date = feed_info_df["valid_end_date"][0]
+
+        for table in TABLES_TO_LOAD:
+            if table.table_name in BENCHMARK_TABLES:
+                benchmark_table_load(db_manager, gtfs_source, table, valid_start_date, valid_end_date)
+
+    os.remove(gtfs_path)
+
+    # geometry builds read partitions of the most recently loaded feed
+    feed_query = (
+        f"SELECT valid_start_date, valid_end_date FROM {DB_GTFS_SCHEMA}.feed_info "
+        "ORDER BY creation_timestamp DESC LIMIT 1"
+    )
+    loaded_feeds = db_manager.select_as_list(sa.text(feed_query))
+    process_logger.add_metadata(geometry_builds=len(loaded_feeds) > 0)
+    for feed in loaded_feeds:
+        for table_name in GEOMETRY_BUILDS:
+            benchmark_geometry_build(db_manager, table_name, feed["valid_start_date"], feed["valid_end_date"])
+
+    process_logger.log_complete()
+
+
+if __name__ == "__main__":
+    local_db = DatabaseManager()
+    run(local_db)
@@ -0,0 +1,186 @@
+import os
+import glob
+import hashlib
+import threading
+from typing import Any, Dict, Iterator
+
+import polars
+import pyarrow
+import pyarrow.ipc
+
+from research_etl.utils.util_logging import ProcessLogger
+
+from research_etl.etl_gtfs.gtfs_archive import GTFSSource
+from research_etl.etl_gtfs.gtfs_archive import frame_batches
+
+# bytes of csv text parsed at a time when writing a table to the cache
+CACHE_BATCH_BYTES = 4 * 1024 * 1024
+
+
+def schema_signature(schema: Dict[str, Any]) -> Dict[str, polars.DataType]:
+    """
+    column name -> polars type of schema, with python types resolved to polars types
+    """
+    return dict(polars.DataFrame(schema=schema).schema)
+
+
+class GTFSCache:
+    """
+    on disk cache of parsed GTFS tables, wrapping a GTFS feed
+
+    each table is parsed once with its full schema and stored as an
+    uncompressed Arrow IPC file, named for the content hash of the table and
+    its schema. reads of any schema columns are served from memory mapped
+    IPC files, without parsing csv again. tables that are the same in
+    several feeds share one cache file.
+
+    least recently used files are removed when the cache is larger than
+    max_bytes. implements GTFSSource, so a cached feed is validated and
+    loaded the same way as an open GTFS zip file.
+    """
+
+    def __init__(
+        self,
+        source: GTFSSource,
+        cache_dir: str,
+        schemas: Dict[str, Dict[str, Any]],
+        max_bytes: int,
+    ) -> None:
+        """
+        :param source: GTFS feed read on cache miss
+        :param cache_dir: directory of cache files, created if missing
+        :param schemas: table name -> full schema of table, tables not listed are read from source
+        :param max_bytes: size of cache directory files kept after a cache write
+        """
+        self.source = source
+        self.cache_dir = cache_dir
+        self.schemas = schemas
+        self.max_bytes = max_bytes
+
+        self.table_hashes: Dict[str, str] = {}
+        self.table_locks: Dict[str, threading.Lock] = {}
+        self.lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def has_table(self, table_name: str) -> bool:
+        """True if feed contains table"""
+        return self.source.has_table(table_name)
+
+    def table_hash(self, table_name: str) -> str:
+        """content hash of table, hashed once from source"""
+        with self._table_lock(table_name):
+            if table_name not in self.table_hashes:
+                self.table_hashes[table_name] = self.source.table_hash(table_name)
+            return self.table_hashes[table_name]
+
+    def read_csv(self, table_name: str, schema: Dict[str, Any]) -> polars.DataFrame:
+        """
+        read schema columns of table from memory mapped cache file, parsing table into cache on miss
+
+        schema columns must have the types of the full schema of table,
+        other reads are passed to source
+        """
+        if not self._is_cached_schema(table_name, schema):
+            return self.source.read_csv(table_name, schema)
+
+        try:
+            return polars.read_ipc(self._cache_path(table_name), columns=list(schema.keys()), memory_map=True)
+        except FileNotFoundError:
+            # cache file removed by another process between lookup and read
+            return polars.read_ipc(self._cache_path(table_name), columns=list(schema.keys()), memory_map=True)
+
+    def iter_csv_batches(self, table_name: str, schema: Dict[str, Any], block_size: int) -> Iterator[polars.DataFrame]:
+        """read schema columns of table in slices of about block_size bytes"""
+        if not self._is_cached_schema(table_name, schema):
+            yield from self.source.iter_csv_batches(table_name, schema, block_size)
+            return
+
+        yield from frame_batches(self.read_csv(table_name, schema), block_size)
+
+    def _table_lock(self, table_name: str) -> threading.Lock:
+        """lock held while a table is hashed or written to cache"""
+        with self.lock:
+            return self.table_locks.setdefault(table_name, threading.Lock())
+
+    def _is_cached_schema(self, table_name: str, schema: Dict[str, Any]) -> bool:
+        """True if schema columns of table can be read from its cache file"""
+        if table_name not in self.schemas:
+            return False
+
+        full_schema = schema_signature(self.schemas[table_name])
+        return all(
+            column in full_schema and full_schema[column] == dtype for column, dtype in schema_signature(schema).items()
+        )
+
+    def _cache_path(self, table_name: str) -> str:
+        """
+        path of cache file of table, written from source if not cached
+        """
+        signature = ",".join(
+            f"{column}:{dtype}" for column, dtype in schema_signature(self.schemas[table_name]).items()
+        )
+        cache_key = hashlib.sha256(f"{self.table_hash(table_name)}|{signature}".encode()).hexdigest()
+        cache_path = os.path.join(self.cache_dir, f"{table_name}-{cache_key}.arrow")
+
+        with self._table_lock(table_name):
+            if os.path.exists(cache_path):
+                # modified time orders cache files for eviction
+                os.utime(cache_path)
+                return cache_path
+
+            self._write_cache_file(table_name, cache_path)
+
+        self._evict(keep_path=cache_path)
+
+        return cache_path
+
+    def _write_cache_file(self, table_name: str, cache_path: str) -> None:
+        """
+        stream table from source into Arrow IPC cache file, in batches of CACHE_BATCH_BYTES of csv
+        """
+        cache_log = ProcessLogger("write_gtfs_cache", table_name=table_name, cache_path=cache_path)
+        cache_log.log_start()
+
+        schema = self.schemas[table_name]
+        arrow_schema = polars.DataFrame(schema=schema).to_arrow().schema
+
+        part_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            with pyarrow.ipc.new_file(part_path, arrow_schema) as writer:
+                for batch_df in self.source.iter_csv_batches(table_name, schema, CACHE_BATCH_BYTES):
+                    writer.write_table(batch_df.to_arrow().cast(arrow_schema))
+            os.replace(part_path, cache_path)
+        except Exception as exception:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            cache_log.log_failure(exception)
+            raise exception
+
+        cache_log.add_metadata(file_size=os.path.getsize(cache_path))
+        cache_log.log_complete()
+
+    def _evict(self, keep_path: str) -> None:
+        """
+        remove least recently used cache files until cache is no larger than max_bytes
+        """
+        with self.lock:
+            cache_files = []
+            for path in glob.glob(os.path.join(self.cache_dir, "*.arrow")):
+                try:
+                    cache_files.append((os.path.getmtime(path), os.path.getsize(path), path))
+                except FileNotFoundError:
+                    continue
+
+            cache_bytes = sum(size for _, size, _ in cache_files)
+            for _, size, path in sorted(cache_files):
+                if cache_bytes <= self.max_bytes:
+                    break
+                if path == keep_path:
+                    continue
+                try:
+                    # memory mapped readers of removed file keep reading it
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                cache_bytes -= size
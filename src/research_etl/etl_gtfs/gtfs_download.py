@@ -0,0 +1,113 @@
+import os
+import time
+import shutil
+from typing import Optional
+from http.client import HTTPMessage
+import urllib.error
+import urllib.request
+
+from research_etl.utils.util_logging import ProcessLogger
+
+GTFS_URL = os.getenv("GTFS_URL", "https://cdn.mbta.com/MBTA_GTFS.zip")
+
+
+def gtfs_feed_headers(gtfs_url: str = GTFS_URL, etag: Optional[str] = None) -> Optional[HTTPMessage]:
+    """
+    Get headers of GTFS zip file with a HEAD request, without downloading the file
+
+    Args:
+        gtfs_url (str): url of GTFS zip file
+        etag (str): ETag of last loaded GTFS zip file, sent as If-None-Match
+
+    Returns:
+        HTTPMessage: HTTP Header of GTFS Zip file, None if file matches etag
+    """
+    request = urllib.request.Request(gtfs_url, method="HEAD")
+    if etag is not None:
+        request.add_header("If-None-Match", etag)
+
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.headers
+    except urllib.error.HTTPError as http_error:
+        if http_error.code == 304:
+            return None
+        raise http_error
+
+
+def download_gtfs_part(part_path: str, gtfs_url: str, etag: Optional[str]) -> HTTPMessage:
+    """
+    Make one attempt to download GTFS zip file to part_path, continuing from end of existing part_path file
+
+    Returns:
+        HTTPMessage: HTTP Header from GTFS Zip download
+    """
+    resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+    request = urllib.request.Request(gtfs_url)
+    if resume_from > 0 and etag is not None:
+        request.add_header("Range", f"bytes={resume_from}-")
+        request.add_header("If-Range", etag)
+
+    with urllib.request.urlopen(request) as response:
+        gtfs_headers = response.headers
+        # 206 is a partial response continuing the download, anything else is the full file
+        write_mode = "ab" if response.status == 206 else "wb"
+        with open(part_path, write_mode) as part_file:
+            shutil.copyfileobj(response, part_file, 1024 * 1024)
+
+    content_range = gtfs_headers.get("Content-Range")
+    if content_range is not None:
+        expected_size = int(content_range.split("/")[-1])
+    else:
+        expected_size = int(gtfs_headers.get("Content-Length", os.path.getsize(part_path)))
+
+    if os.path.getsize(part_path) != expected_size:
+        raise IOError(f"incomplete GTFS download {os.path.getsize(part_path)} of {expected_size} bytes")
+
+    return gtfs_headers
+
+
+def download_gtfs(local_path: str, gtfs_url: str = GTFS_URL, etag: Optional[str] = None) -> HTTPMessage:
+    """
+    Stream GTFS zip file to local file, resuming partial downloads
+
+    file is downloaded to {local_path}.part and renamed to local_path when
+    complete. if a partial download exists and etag is known, only the
+    remaining bytes are requested with Range/If-Range headers, if the file
+    changed since the partial download the full file is sent by the server.
+
+    Args:
+        local_path (str): local path to save GTFS zip file to
+        gtfs_url (str): url of GTFS zip file
+        etag (str): ETag of GTFS zip file from HEAD request, required to resume
+
+    Returns:
+        HTTPMessage: HTTP Header from GTFS Zip download
+    """
+    download_log = ProcessLogger("download_gtfs", gtfs_url=gtfs_url, local_path=local_path)
+    download_log.log_start()
+
+    part_path = f"{local_path}.part"
+    max_retries = 3
+
+    for retry_attempts in range(max_retries + 1):
+        try:
+            download_log.add_metadata(retry_attempts=retry_attempts)
+            gtfs_headers = download_gtfs_part(part_path, gtfs_url, etag)
+            break
+        except Exception as exception:
+            # range not satisfiable, restart download from scratch
+            if getattr(exception, "code", None) == 416 and os.path.exists(part_path):
+                os.remove(part_path)
+            if retry_attempts == max_retries:
+                download_log.log_failure(exception)
+                raise exception
+            time.sleep(5)
+
+    os.replace(part_path, local_path)
+
+    download_log.add_metadata(file_size=os.path.getsize(local_path))
+    download_log.log_complete()
+
+    return gtfs_headers
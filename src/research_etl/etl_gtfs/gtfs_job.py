@@ -1,21 +1,49 @@
+# pylint: disable=too-many-lines
+import os
 import re
+import time
+import hashlib
+import tempfile
 import datetime
-import zipfile
+from functools import partial
 
+from typing import Dict
+from typing import List
 from typing import Tuple
+from typing import Callable
+from typing import Iterator
 from typing import Optional
-from io import BytesIO
-from http.client import HTTPMessage
-import urllib.request
 
 import polars
 import sqlalchemy as sa
 
 from research_etl.utils.util_rds import DatabaseManager
-from research_etl.utils.util_rds import create_db_connection_string
 from research_etl.utils.util_logging import ProcessLogger
-
+from research_etl.utils.util_binary_copy import copy_dataframes_to_db
+from research_etl.utils.util_scheduler import JobScheduler
+from research_etl.utils.util_scheduler import ScheduledJob
+
+from research_etl.etl_gtfs.gtfs_archive import GTFSArchive
+from research_etl.etl_gtfs.gtfs_archive import GTFSSource
+from research_etl.etl_gtfs.gtfs_cache import GTFSCache
+from research_etl.etl_gtfs.gtfs_download import GTFS_URL
+from research_etl.etl_gtfs.gtfs_download import gtfs_feed_headers
+from research_etl.etl_gtfs.gtfs_download import download_gtfs
+from research_etl.etl_gtfs.gtfs_schema import DB_GTFS_SCHEMA
 from research_etl.etl_gtfs.gtfs_schema import GTFSSchema
+from research_etl.etl_gtfs.gtfs_validate import raise_for_invalid_feed
+from research_etl.etl_gtfs.gtfs_staging import staging_table_name
+from research_etl.etl_gtfs.gtfs_staging import create_staging_table
+from research_etl.etl_gtfs.gtfs_staging import index_staging_table
+from research_etl.etl_gtfs.gtfs_staging import complete_staging_table
+from research_etl.etl_gtfs.gtfs_staging import completed_table_query
+from research_etl.etl_gtfs.gtfs_staging import matching_partition
+from research_etl.etl_gtfs.gtfs_staging import clone_partition
+from research_etl.etl_gtfs.gtfs_staging import completed_tables
+from research_etl.etl_gtfs.gtfs_staging import completed_partition
+from research_etl.etl_gtfs.gtfs_staging import discard_staged_feed
+from research_etl.etl_gtfs.gtfs_staging import finalize_feed_load
+from research_etl.etl_gtfs.gtfs_retention import run_retention
 from research_etl.etl_gtfs.gtfs_schema import feed_info_schema
 from research_etl.etl_gtfs.gtfs_schema import agency_schema
 from research_etl.etl_gtfs.gtfs_schema import calendar_schema
@@ -38,8 +66,6 @@ from research_etl.etl_gtfs.gtfs_schema import transfers_schema
 from research_etl.etl_gtfs.gtfs_schema import trips_schema
 
 
-DB_GTFS_SCHEMA = "gtfs"
-
 TABLES_TO_LOAD = [
     GTFSSchema(
         table_name="agency",
@@ -58,6 +84,7 @@ TABLES_TO_LOAD = [
     GTFSSchema(
         table_name="calendar_attributes",
         schema=calendar_attributes_schema,
+        optional=True,
         primary_keys=["service_id"],
     ),
     GTFSSchema(
@@ -74,11 +101,13 @@ TABLES_TO_LOAD = [
     GTFSSchema(
         table_name="checkpoints",
         schema=checkpoints_schema,
+        optional=True,
         primary_keys=["checkpoint_id"],
     ),
     GTFSSchema(
         table_name="directions",
         schema=directions_schema,
+        optional=True,
         primary_keys=[
             "route_id",
             "direction_id",
@@ -87,33 +116,40 @@ TABLES_TO_LOAD = [
     GTFSSchema(
         table_name="facilities",
         schema=facilities_schema,
+        optional=True,
         primary_keys=["facility_id"],
     ),
     GTFSSchema(
         table_name="facilities_properties",
         schema=facilities_properties_schema,
+        optional=True,
         primary_keys=[],
     ),
     GTFSSchema(
         table_name="levels",
         schema=levels_schema,
+        optional=True,
         primary_keys=["level_id"],
     ),
     GTFSSchema(
         table_name="lines",
         schema=lines_schema,
+        optional=True,
         primary_keys=["line_id"],
     ),
     GTFSSchema(
         table_name="multi_route_trips",
         schema=multi_route_trips_schema,
+        optional=True,
         primary_keys=[
             "added_route_id",
             "trip_id",
         ],
     ),
-    GTFSSchema(table_name="pathways", schema=pathways_schema, primary_keys=["pathway_id"]),
-    GTFSSchema(table_name="route_patterns", schema=route_patterns_schema, primary_keys=["route_pattern_id"]),
+    GTFSSchema(table_name="pathways", schema=pathways_schema, primary_keys=["pathway_id"], optional=True),
+    GTFSSchema(
+        table_name="route_patterns", schema=route_patterns_schema, primary_keys=["route_pattern_id"], optional=True
+    ),
     GTFSSchema(
         table_name="routes",
         schema=routes_schema,
@@ -134,6 +170,17 @@ TABLES_TO_LOAD = [
             "trip_id",
             "stop_sequence",
         ],
+        foreign_keys={
+            "trip_id": "trips.trip_id",
+            "stop_id": "stops.stop_id",
+        },
+        to_seconds_fields={
+            "arrival_time": "arrival_seconds",
+            "departure_time": "departure_seconds",
+        },
+        indexes=[
+            ["departure_seconds", "trip_id"],
+        ],
     ),
     GTFSSchema(
         table_name="stops",
@@ -143,34 +190,52 @@ TABLES_TO_LOAD = [
     GTFSSchema(
         table_name="transfers",
         schema=transfers_schema,
+        optional=True,
         primary_keys=[],
     ),
     GTFSSchema(
         table_name="trips",
         schema=trips_schema,
         primary_keys=["trip_id"],
+        foreign_keys={
+            "route_id": "routes.route_id",
+            "shape_id": "shapes.shape_id",
+        },
     ),
 ]
 
+# bytes of csv text parsed and loaded at a time when streaming GTFS tables,
+# sets the memory ceiling of a table load
+GTFS_BATCH_BYTES = int(os.getenv("GTFS_BATCH_BYTES", str(4 * 1024 * 1024)))
 
-def download_gtfs() -> Tuple[BytesIO, HTTPMessage]:
-    """
-    Download MBTA GTFS zip file from https://cdn.mbta.com/MBTA_GTFS.zip
+# size cap of parsed GTFS table cache in GTFS_CACHE_DIR, cache is not used if GTFS_CACHE_DIR is not set
+GTFS_CACHE_BYTES = int(os.getenv("GTFS_CACHE_BYTES", str(2 * 1024 * 1024 * 1024)))
 
-    Args:
-        None
+# largest GTFS tables, scheduled first because they take the longest to load
+LONG_POLE_TABLES = ["stop_times", "shapes", "trips"]
 
-    Returns:
-        BytesIO: GTFS Zip file as Bytes object in memory
-        HTTPMessage: HTTP Header from GTFS Zip download
-    """
-    gtfs_url = "https://cdn.mbta.com/MBTA_GTFS.zip"
+# derived postgis table -> tables it is built from, in build order
+DERIVED_TABLE_INPUTS = {
+    "shapes_geog": ["shapes"],
+    "stops_geog": ["stops"],
+    "stop_in_pattern": ["shapes_geog", "stops_geog", "trips", "routes", "stop_times"],
+    "service_dates": ["calendar", "calendar_dates"],
+}
 
-    with urllib.request.urlopen(gtfs_url) as req:
-        gtfs_headers = req.headers
-        gtfs_bytes = BytesIO(req.read())
+# derived postgis table -> primary key columns
+DERIVED_TABLE_KEYS = {
+    "shapes_geog": ["shape_id"],
+    "stops_geog": ["stop_id"],
+    "stop_in_pattern": ["shape_id", "stop_sequence"],
+    # leads with service_date, for date lookups
+    "service_dates": ["service_date", "service_id"],
+}
 
-    return (gtfs_bytes, gtfs_headers)
+# derived postgis table -> columns of each secondary index, spatial columns get GiST indexes
+DERIVED_TABLE_INDEXES = {
+    "shapes_geog": [["shape"]],
+    "stops_geog": [["geom"], ["geog_latlon"]],
+}
 
 
 def last_feed_version(db_manager: DatabaseManager) -> Optional[str]:
@@ -193,6 +258,43 @@ def last_feed_version(db_manager: DatabaseManager) -> Optional[str]:
     return None
 
 
+def last_feed_etag(db_manager: DatabaseManager) -> Optional[str]:
+    """
+    Retrieve ETag of last added GTFS Feed from RDS
+
+    Returns:
+        str: ETag header of GTFS zip file, None if not recorded
+    """
+    query = f"SELECT etag FROM {DB_GTFS_SCHEMA}.feed_info ORDER BY creation_timestamp DESC LIMIT 1"
+
+    result = db_manager.select_as_list(sa.text(query))
+
+    if result:
+        return result[0]["etag"]
+
+    return None
+
+
+def cached_gtfs_source(gtfs_archive: GTFSSource) -> GTFSSource:
+    """
+    wrap GTFS feed in parsed table cache of GTFS_CACHE_DIR
+
+    Args:
+        gtfs_archive (GTFSSource): open GTFS zip file
+
+    Returns:
+        GTFSSource: cached GTFS feed, gtfs_archive if GTFS_CACHE_DIR is not set
+    """
+    cache_dir = os.getenv("GTFS_CACHE_DIR")
+    if not cache_dir:
+        return gtfs_archive
+
+    schemas = {table.table_name: table.schema for table in TABLES_TO_LOAD}
+    schemas["feed_info"] = feed_info_schema
+
+    return GTFSCache(gtfs_archive, cache_dir, schemas, GTFS_CACHE_BYTES)
+
+
 def str_col_to_date(df: polars.DataFrame, column: str, date_format: str = "%Y%m%d") -> polars.DataFrame:
     """
     convert polars string series to date type
@@ -208,40 +310,51 @@ def str_col_to_date(df: polars.DataFrame, column: str, date_format: str = "%Y%m%
     return df.with_columns(df[column].str.to_date(format=date_format).alias(column))
 
 
-def partition_table_name(table: str, start: datetime.date, end: datetime.date) -> str:
+def str_col_to_seconds(df: polars.DataFrame, column: str, seconds_column: str) -> polars.DataFrame:
     """
-    create partitioned table name based on start/end dates
+    add integer seconds after midnight column from "HH:MM:SS" time column
+
+    GTFS times past midnight of the service day have hours of 24 or more,
+    these are kept as seconds past 86400
+
+    Args:
+        df (polars.Dataframe): Dataframe with column
+        column (str): Name of time column
+        seconds_column (str): Name of Int32 column to add
+
+    Returns:
+        polars.Dataframe: dataframe with added column
     """
-    return f"{DB_GTFS_SCHEMA}.{table}_" f"{str(start).replace('-','')}_" f"{str(end).replace('-','')}"
+    time_parts = polars.col(column).str.split_exact(":", 2)
+    seconds = (
+        time_parts.struct.field("field_0").cast(polars.Int32) * 3600
+        + time_parts.struct.field("field_1").cast(polars.Int32) * 60
+        + time_parts.struct.field("field_2").cast(polars.Int32)
+    )
+    return df.with_columns(seconds.alias(seconds_column))
 
 
-def process_feed_info(gtfs_bytes: BytesIO) -> Tuple[datetime.date, datetime.date]:
+def read_feed_info(gtfs_archive: GTFSSource) -> polars.DataFrame:
     """
-    Process feed_info.text file from GTFS and INSERT into Database
+    Read feed_info.txt file from GTFS and add creation_timestamp and valid date columns
 
     Args:
-        gtfs_bytes (BytesIO): Bytes of GTFS file in memory
+        gtfs_archive (GTFSSource): open GTFS zip file or parsed GTFS feed
 
     Returns:
-        feed_start_date (datetime.date)
-        feed_end_date (datetime.date)
+        polars.DataFrame: feed_info table, ready for loading
     """
-    with zipfile.ZipFile(gtfs_bytes) as gtfs_zip:
-        feed_info_df = polars.read_csv(
-            gtfs_zip.read("feed_info.txt"), schema_overrides=feed_info_schema, columns=list(feed_info_schema.keys())
-        )
+    feed_info_df = gtfs_archive.read_csv("feed_info", feed_info_schema)
 
     # Extract creation_timestamp from feed_version text
     feed_version_dt_re = re.search(
         r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}",
         feed_info_df["feed_version"][0],
     )
-    assert feed_version_dt_re is not None
-
-    feed_version_dt_str = feed_version_dt_re.group(0)
-    assert feed_version_dt_str is not None
+    if feed_version_dt_re is None:
+        raise ValueError(f"no creation timestamp in feed_version {feed_info_df['feed_version'][0]!r}")
 
-    feed_version_dt = datetime.datetime.fromisoformat(feed_version_dt_str)
+    feed_version_dt = datetime.datetime.fromisoformat(feed_version_dt_re.group(0))
 
     feed_info_df = feed_info_df.with_columns(creation_timestamp=feed_version_dt)
 
@@ -256,43 +369,123 @@ def process_feed_info(gtfs_bytes: BytesIO) -> Tuple[datetime.date, datetime.date
     feed_info_df = feed_info_df.with_columns(valid_start_date=valid_start_date)
     feed_info_df = feed_info_df.with_columns(valid_end_date=valid_end_date)
 
-    feed_info_df.write_database(
-        table_name=f"{DB_GTFS_SCHEMA}.feed_info",
-        connection=f"postgresql+psycopg2://{create_db_connection_string()}",
-        if_table_exists="append",
-    )
+    return feed_info_df
+
+
+def process_feed_info(
+    db_manager: DatabaseManager, gtfs_archive: GTFSSource, etag: Optional[str] = None
+) -> Tuple[datetime.date, datetime.date]:
+    """
+    Process feed_info.text file from GTFS and stage it for feed load
+
+    feed_info row is added to feed_info table when the feed load is
+    finalized. staged tables of a failed load of another feed version with
+    the same valid dates are dropped.
+
+    Args:
+        db_manager (DatabaseManager): database used for load
+        gtfs_archive (GTFSSource): open GTFS zip file or parsed GTFS feed
+        etag (str): ETag header of GTFS zip file download
+
+    Returns:
+        feed_start_date (datetime.date)
+        feed_end_date (datetime.date)
+    """
+    feed_info_df = read_feed_info(gtfs_archive)
+    feed_info_df = feed_info_df.with_columns(etag=polars.lit(etag, dtype=polars.Utf8))
+    valid_start_date = feed_info_df["valid_start_date"][0]
+    valid_end_date = feed_info_df["valid_end_date"][0]
+
+    discard_staged_feed(db_manager, feed_info_df["feed_version"][0], valid_start_date, valid_end_date)
+
+    feed_info_table = create_staging_table(db_manager, "feed_info", valid_start_date, valid_end_date)
+    copy_dataframes_to_db(db_manager, feed_info_table, [feed_info_df], feed_info_df.columns)
+    db_manager.execute(sa.text(f"ALTER TABLE {feed_info_table} SET LOGGED"))
 
     return (valid_start_date, valid_end_date)
 
 
-def load_gtfs_table(
-    db_manager: DatabaseManager,
-    gtfs_bytes: BytesIO,
+def prepare_gtfs_table(
+    table_df: polars.DataFrame,
     table: GTFSSchema,
     valid_start_date: datetime.date,
     valid_end_date: datetime.date,
-) -> None:
+) -> polars.DataFrame:
     """
-    Load a GTFS table
+    Convert date fields of GTFS table rows and add valid date columns
     """
-    load_log = ProcessLogger("load_gtfs_table", table_name=table.table_name)
-    load_log.log_start()
-
-    with zipfile.ZipFile(gtfs_bytes) as gtfs_zip:
-        table_df = polars.read_csv(
-            gtfs_zip.read(f"{table.table_name}.txt"), schema_overrides=table.schema, columns=list(table.schema.keys())
-        )
-
     # change string date fields to datetime.date
     for column in table.to_date_fields:
         table_df = str_col_to_date(table_df, column)
 
+    # add integer seconds columns of time fields
+    for column, seconds_column in table.to_seconds_fields.items():
+        table_df = str_col_to_seconds(table_df, column, seconds_column)
+
     # add valid date columns to tables
     table_df = table_df.with_columns(valid_start_date=valid_start_date)
     table_df = table_df.with_columns(valid_end_date=valid_end_date)
 
-    main_table = f"{DB_GTFS_SCHEMA}.{table.table_name}"
-    new_table_name = partition_table_name(table.table_name, valid_start_date, valid_end_date)
+    return table_df
+
+
+def read_gtfs_table(
+    gtfs_archive: GTFSSource,
+    table: GTFSSchema,
+    valid_start_date: datetime.date,
+    valid_end_date: datetime.date,
+) -> polars.DataFrame:
+    """
+    Read a GTFS table from GTFS zip file and add valid date columns
+    """
+    table_df = gtfs_archive.read_csv(table.table_name, table.schema)
+
+    return prepare_gtfs_table(table_df, table, valid_start_date, valid_end_date)
+
+
+def read_gtfs_batches(
+    gtfs_archive: GTFSSource,
+    table: GTFSSchema,
+    valid_start_date: datetime.date,
+    valid_end_date: datetime.date,
+    batch_bytes: int = GTFS_BATCH_BYTES,
+) -> Iterator[polars.DataFrame]:
+    """
+    Stream a GTFS table from GTFS zip file in batches of about batch_bytes of csv text
+    """
+    for batch_df in gtfs_archive.iter_csv_batches(table.table_name, table.schema, batch_bytes):
+        yield prepare_gtfs_table(batch_df, table, valid_start_date, valid_end_date)
+
+
+def loaded_columns(table: GTFSSchema) -> List[str]:
+    """
+    columns of GTFS table loaded into feed partitions, in load order
+    """
+    return list(table.schema.keys()) + list(table.to_seconds_fields.values()) + ["valid_start_date", "valid_end_date"]
+
+
+def load_gtfs_table(
+    db_manager: DatabaseManager,
+    gtfs_archive: GTFSSource,
+    table: GTFSSchema,
+    valid_start_date: datetime.date,
+    valid_end_date: datetime.date,
+) -> int:
+    """
+    Load a GTFS table into its staging table, returns number of rows loaded
+
+    table csv is parsed in batches of GTFS_BATCH_BYTES and each batch is
+    streamed to the staging table with binary COPY as it is parsed, so the
+    whole table is never held in memory. values are encoded to the types of
+    the staging table columns
+    """
+    load_log = ProcessLogger("load_gtfs_table", table_name=table.table_name, batch_bytes=GTFS_BATCH_BYTES)
+    load_log.log_start()
+
+    table_batches = read_gtfs_batches(gtfs_archive, table, valid_start_date, valid_end_date)
+    columns = loaded_columns(table)
+
+    new_table_name = staging_table_name(table.table_name, valid_start_date, valid_end_date)
 
     load_log.add_metadata(
         new_table_name=new_table_name,
@@ -300,173 +493,467 @@ def load_gtfs_table(
         valid_end_date=valid_end_date,
     )
 
-    create_table_query = f"CREATE TABLE {new_table_name} () INHERITS ({main_table})"
-    db_manager.execute(sa.text(create_table_query))
+    row_count, byte_count = copy_dataframes_to_db(db_manager, new_table_name, table_batches, columns)
+    load_log.add_metadata(row_count=row_count, byte_count=byte_count)
+
+    load_log.log_complete()
+
+    return row_count
 
-    table_df.write_database(
-        table_name=new_table_name,
-        connection=f"postgresql+psycopg2://{create_db_connection_string()}",
-        if_table_exists="append",
+
+def shapes_geog_query(shapes_table: str) -> str:
+    """
+    SELECT shapes_geog rows from shapes partition, one linestring per shape
+
+    points are built from numeric lat/lon columns, without WKT text
+    """
+    return (
+        "SELECT shape_id"
+        ",ST_MakeLine(array_agg(ST_SetSRID(ST_MakePoint(shape_pt_lon, shape_pt_lat), 4326) ORDER BY shape_pt_sequence))"
+        ",valid_start_date, valid_end_date "
+        f"FROM {shapes_table} "
+        "GROUP BY shape_id, valid_start_date, valid_end_date "
+        "ORDER BY shape_id "
     )
 
-    primary_key = ""
-    if len(table.primary_keys) > 0:
-        primary_key = f"ADD PRIMARY KEY ({', '.join(table.primary_keys)}),"
 
-    alter_query = (
-        f"ALTER TABLE {new_table_name} "
-        f"{primary_key}"
-        f"ADD CHECK (valid_start_date = '{valid_start_date}'),"
-        f"ADD CHECK (valid_end_date = '{valid_end_date}')"
+def stops_geog_query(stops_table: str) -> str:
+    """
+    SELECT stops_geog rows from stops partition
+
+    points are built from numeric lat/lon columns, without WKT text, and
+    projected to EPSG:3585 (Massachusetts Mainland, meters) once per stop
+    within the service area bounding box
+    """
+    return (
+        "SELECT stop_id, parent_station "
+        ", pt.point::geography "
+        ", pt.point "
+        ", (ST_X(prj.projected) * 1000)::int AS easting "
+        ", (ST_Y(prj.projected) * 1000)::int AS northing "
+        ", valid_start_date, valid_end_date "
+        f"FROM {stops_table} "
+        "CROSS JOIN LATERAL ( "
+        "    SELECT ST_SetSRID(ST_MakePoint(stop_lon, stop_lat), 4326) AS point "
+        ") pt "
+        "LEFT JOIN LATERAL ( "
+        "    SELECT ST_Transform(pt.point, 3585) AS projected "
+        "    WHERE stop_lon::decimal BETWEEN -74.0000000 and -69.0000000 "
+        "    AND stop_lat::decimal BETWEEN 41.0000000 and 43.0000000 "
+        ") prj ON true "
+        "ORDER BY stop_id "
     )
-    db_manager.execute(sa.text(alter_query))
 
-    load_log.log_complete()
+
+def stop_in_pattern_query(
+    shapes_table: str, trips_table: str, routes_table: str, stop_times_table: str, stops_geog_table: str
+) -> str:
+    """
+    SELECT stop_in_pattern rows, distance along shape of each stop of bus shapes
+
+    each bus shape is projected to EPSG:26986 (Massachusetts Mainland,
+    meters) and measured once, in a CTE, instead of once for every stop on
+    the shape. OFFSET 0 keeps the CTE from being pulled up into the join on
+    PostgreSQL 12+, which inlines CTEs, and needs no MATERIALIZED keyword,
+    which is a syntax error before PostgreSQL 12
+    """
+    return (
+        "WITH bus_shapes AS ( "
+        "    SELECT shg.shape_id, shg.shape, t.trip_id "
+        "    ,ST_Length(ST_Transform(shg.shape, 26986)) AS shape_length "
+        "    ,shg.valid_start_date, shg.valid_end_date "
+        f"   FROM {shapes_table} shg "
+        "    INNER JOIN ( "
+        "            SELECT shape_id, min(trip_id) trip_id, min(route_id) route_id "
+        f"           FROM {trips_table} "
+        "            GROUP BY shape_id "
+        "    ) t ON t.shape_id = shg.shape_id "
+        f"   INNER JOIN {routes_table} r "
+        "            ON r.route_id = t.route_id "
+        "            AND r.route_type = 3 "  # bus only
+        "    OFFSET 0 "
+        ") "
+        "SELECT  bs.shape_id, st.stop_sequence, st.stop_id "
+        ",(ST_LineLocatePoint(bs.shape, stg.geom) * bs.shape_length)::INT "
+        ",bs.valid_start_date, bs.valid_end_date "
+        "FROM bus_shapes bs "
+        f"INNER JOIN {stop_times_table} st "
+        "        ON st.trip_id = bs.trip_id "
+        f"INNER JOIN {stops_geog_table} stg "
+        "        ON stg.stop_id = st.stop_id "
+        "ORDER BY bs.shape_id, st.stop_sequence "
+    )
 
 
 def build_shapes_geog(
     db_manager: DatabaseManager, valid_start_date: datetime.date, valid_end_date: datetime.date
-) -> None:
+) -> int:
     """
-    Create shapes_geog table
+    Build shapes_geog staging table from shapes staging table, returns number of rows built
     """
     build_log = ProcessLogger("build_shapes_geog")
     build_log.log_start()
 
-    main_table = f"{DB_GTFS_SCHEMA}.shapes_geog"
-    new_table_name = partition_table_name("shapes_geog", valid_start_date, valid_end_date)
-
-    shapes_table = partition_table_name("shapes", valid_start_date, valid_end_date)
-
-    create_table_query = f"CREATE TABLE {new_table_name} () INHERITS ({main_table})"
-    db_manager.execute(sa.text(create_table_query))
+    new_table_name = staging_table_name("shapes_geog", valid_start_date, valid_end_date)
 
-    insert_query = (
-        f"INSERT INTO {new_table_name} "
-        "SELECT shape_id"
-        ",ST_MakeLine(array_agg(ST_GeomFromText('POINT(' || shape_pt_lon || ' ' || shape_pt_lat || ')', 4326) ORDER BY shape_pt_sequence))"
-        ",valid_start_date, valid_end_date "
-        f"FROM {shapes_table} "
-        "GROUP BY shape_id, valid_start_date, valid_end_date "
-        "ORDER BY shape_id "
-    )
-    db_manager.execute(sa.text(insert_query))
+    shapes_table = staging_table_name("shapes", valid_start_date, valid_end_date)
 
-    alter_query = (
-        f"ALTER TABLE {new_table_name} "
-        f"ADD PRIMARY KEY (shape_id),"
-        f"ADD CHECK (valid_start_date = '{valid_start_date}'),"
-        f"ADD CHECK (valid_end_date = '{valid_end_date}')"
-    )
-    db_manager.execute(sa.text(alter_query))
+    insert_query = f"INSERT INTO {new_table_name} {shapes_geog_query(shapes_table)}"
+    row_count = db_manager.execute(sa.text(insert_query)).rowcount
+    build_log.add_metadata(row_count=row_count)
 
     build_log.log_complete()
 
+    return row_count
+
 
 def build_stops_geog(
     db_manager: DatabaseManager, valid_start_date: datetime.date, valid_end_date: datetime.date
-) -> None:
+) -> int:
     """
-    Create stops_geog table
+    Build stops_geog staging table from stops staging table, returns number of rows built
     """
     build_log = ProcessLogger("build_stops_geog")
     build_log.log_start()
 
-    main_table = f"{DB_GTFS_SCHEMA}.stops_geog"
-    new_table_name = partition_table_name("stops_geog", valid_start_date, valid_end_date)
+    new_table_name = staging_table_name("stops_geog", valid_start_date, valid_end_date)
 
-    stops_table = partition_table_name("stops", valid_start_date, valid_end_date)
+    stops_table = staging_table_name("stops", valid_start_date, valid_end_date)
 
-    create_table_query = f"CREATE TABLE {new_table_name} () INHERITS ({main_table})"
-    db_manager.execute(sa.text(create_table_query))
-
-    insert_query = (
-        f"INSERT INTO {new_table_name} "
-        "SELECT stop_id, parent_station "
-        ", ST_GeogFromText('SRID=4326;POINT(' || stop_lon || ' ' || stop_lat || ')') "
-        ", ST_GeomFromText('POINT(' || stop_lon || ' ' || stop_lat || ')', 4326) "
-        ", CASE WHEN stop_lon::decimal BETWEEN -74.0000000 and -69.0000000 "
-        "         AND stop_lat::decimal BETWEEN 41.0000000 and 43.0000000 "
-        "       THEN (st_x(st_transform(st_geomFromText( "
-        "             'POINT(' || stop_lon || ' ' || stop_lat || ')', "
-        "             4326), 3585)) * 1000)::int "
-        "       ELSE null END X "
-        ", CASE WHEN stop_lon::decimal BETWEEN -74.0000000 and -69.0000000 "
-        "         AND stop_lat::decimal BETWEEN 41.0000000 and  43.0000000 "
-        "       THEN (st_y(st_transform(st_geomFromText( "
-        "             'POINT(' || stop_lon || ' ' || stop_lat || ')', "
-        "             4326), 3585)) * 1000)::int "
-        "       ELSE null END Y "
-        ", valid_start_date, valid_end_date "
-        f"FROM {stops_table} "
-        "ORDER BY stop_id "
-    )
-    db_manager.execute(sa.text(insert_query))
-
-    alter_query = (
-        f"ALTER TABLE {new_table_name} "
-        f"ADD PRIMARY KEY (stop_id),"
-        f"ADD CHECK (valid_start_date = '{valid_start_date}'),"
-        f"ADD CHECK (valid_end_date = '{valid_end_date}')"
-    )
-    db_manager.execute(sa.text(alter_query))
+    insert_query = f"INSERT INTO {new_table_name} {stops_geog_query(stops_table)}"
+    row_count = db_manager.execute(sa.text(insert_query)).rowcount
+    build_log.add_metadata(row_count=row_count)
 
     build_log.log_complete()
 
+    return row_count
+
 
 def build_stops_in_pattern(
     db_manager: DatabaseManager, valid_start_date: datetime.date, valid_end_date: datetime.date
-) -> None:
+) -> int:
     """
-    Create stop_in_pattern table
+    Build stop_in_pattern staging table from staging tables of feed, returns number of rows built
     """
     build_log = ProcessLogger("build_stops_in_pattern")
     build_log.log_start()
 
-    main_table = f"{DB_GTFS_SCHEMA}.stop_in_pattern"
-    new_table_name = partition_table_name("stop_in_pattern", valid_start_date, valid_end_date)
-
-    shapes_table = partition_table_name("shapes_geog", valid_start_date, valid_end_date)
-    trips_table = partition_table_name("trips", valid_start_date, valid_end_date)
-    routes_table = partition_table_name("routes", valid_start_date, valid_end_date)
-    stop_times_table = partition_table_name("stop_times", valid_start_date, valid_end_date)
-    stops_geog_table = partition_table_name("stops_geog", valid_start_date, valid_end_date)
-
-    create_table_query = f"CREATE TABLE {new_table_name} () INHERITS ({main_table})"
-    db_manager.execute(sa.text(create_table_query))
-
-    insert_query = (
-        f"INSERT INTO {new_table_name} "
-        "SELECT  shg.shape_id, st.stop_sequence, st.stop_id "
-        ",(ST_LineLocatePoint(shape, geom) * ST_Length(ST_Transform(shape,26986)))::INT "
-        ",shg.valid_start_date, shg.valid_end_date "
-        f"FROM {shapes_table} shg "
-        "INNER JOIN ( "
-        "        SELECT shape_id, min(trip_id) trip_id, min(route_id) route_id "
-        f"       FROM {trips_table} "
-        "        GROUP BY shape_id "
-        ") t ON t.shape_id = shg.shape_id "
-        f"INNER JOIN {routes_table} r "
-        "        ON r.route_id = t.route_id "
-        "        AND r.route_type = 3 "  # bus only
-        f"INNER JOIN {stop_times_table} st "
-        "        ON st.trip_id = t.trip_id "
-        f"INNER JOIN {stops_geog_table} stg "
-        "        ON stg.stop_id = st.stop_id "
-        "ORDER BY shg.shape_id, st.stop_sequence "
+    new_table_name = staging_table_name("stop_in_pattern", valid_start_date, valid_end_date)
+
+    shapes_table = staging_table_name("shapes_geog", valid_start_date, valid_end_date)
+    trips_table = staging_table_name("trips", valid_start_date, valid_end_date)
+    routes_table = staging_table_name("routes", valid_start_date, valid_end_date)
+    stop_times_table = staging_table_name("stop_times", valid_start_date, valid_end_date)
+    stops_geog_table = staging_table_name("stops_geog", valid_start_date, valid_end_date)
+
+    select_query = stop_in_pattern_query(shapes_table, trips_table, routes_table, stop_times_table, stops_geog_table)
+    insert_query = f"INSERT INTO {new_table_name} {select_query}"
+    row_count = db_manager.execute(sa.text(insert_query)).rowcount
+    build_log.add_metadata(row_count=row_count)
+
+    build_log.log_complete()
+
+    return row_count
+
+
+def expand_service_dates(calendar_df: polars.DataFrame, calendar_dates_df: polars.DataFrame) -> polars.DataFrame:
+    """
+    expand calendar and calendar_dates to one row per service_id and date the service runs
+
+    calendar rows are expanded to every date between start_date and end_date
+    on the days of week flagged for the service. calendar_dates exceptions are
+    then applied, exception_type 1 adds a service date, 2 removes it.
+
+    Args:
+        calendar_df (polars.DataFrame): calendar table, with Date start_date/end_date
+        calendar_dates_df (polars.DataFrame): calendar_dates table, with Date date
+
+    Returns:
+        polars.DataFrame: service_date, service_id rows ordered by service_date
+    """
+    weekdays = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+    calendar_days = (
+        calendar_df.select(
+            "service_id",
+            polars.concat_list(weekdays).alias("runs_on_weekday"),
+            polars.date_ranges("start_date", "end_date").alias("service_date"),
+        )
+        .explode("service_date")
+        .drop_nulls("service_date")
+        .filter(polars.col("runs_on_weekday").list.get(polars.col("service_date").dt.weekday() - 1) == 1)
+        .select("service_date", "service_id")
+    )
+
+    exceptions = calendar_dates_df.select(
+        polars.col("date").alias("service_date"),
+        "service_id",
+        "exception_type",
     )
-    db_manager.execute(sa.text(insert_query))
+    added_days = exceptions.filter(polars.col("exception_type") == 1).select("service_date", "service_id")
+    removed_days = exceptions.filter(polars.col("exception_type") == 2).select("service_date", "service_id")
 
-    alter_query = (
-        f"ALTER TABLE {new_table_name} "
-        f"ADD PRIMARY KEY (shape_id, stop_sequence),"
-        f"ADD CHECK (valid_start_date = '{valid_start_date}'),"
-        f"ADD CHECK (valid_end_date = '{valid_end_date}')"
+    return (
+        polars.concat([calendar_days.join(removed_days, on=["service_date", "service_id"], how="anti"), added_days])
+        .unique()
+        .sort("service_date", "service_id")
     )
-    db_manager.execute(sa.text(alter_query))
+
+
+def build_service_dates(
+    db_manager: DatabaseManager,
+    gtfs_archive: GTFSSource,
+    valid_start_date: datetime.date,
+    valid_end_date: datetime.date,
+) -> int:
+    """
+    Build service_dates staging table, every date each service_id runs with calendar_dates exceptions applied
+
+    returns number of rows built
+    """
+    build_log = ProcessLogger("build_service_dates")
+    build_log.log_start()
+
+    new_table_name = staging_table_name("service_dates", valid_start_date, valid_end_date)
+
+    tables = {table.table_name: table for table in TABLES_TO_LOAD}
+    calendar_df = read_gtfs_table(gtfs_archive, tables["calendar"], valid_start_date, valid_end_date)
+    calendar_dates_df = read_gtfs_table(gtfs_archive, tables["calendar_dates"], valid_start_date, valid_end_date)
+    service_dates_df = expand_service_dates(calendar_df, calendar_dates_df)
+    service_dates_df = service_dates_df.with_columns(valid_start_date=valid_start_date, valid_end_date=valid_end_date)
+
+    row_count, _ = copy_dataframes_to_db(db_manager, new_table_name, [service_dates_df], service_dates_df.columns)
+    build_log.add_metadata(row_count=row_count)
 
     build_log.log_complete()
 
+    return row_count
+
+
+def feed_tables(gtfs_archive: GTFSSource) -> List[GTFSSchema]:
+    """
+    GTFS tables loaded from a feed, optional tables missing from the feed are not loaded
+
+    Args:
+        gtfs_archive (GTFSSource): open GTFS zip file or parsed GTFS feed
+
+    Returns:
+        List[GTFSSchema]: tables of TABLES_TO_LOAD in feed
+    """
+    return [table for table in TABLES_TO_LOAD if gtfs_archive.has_table(table.table_name)]
+
+
+def feed_table_hashes(gtfs_archive: GTFSSource) -> Dict[str, str]:
+    """
+    content hash of each GTFS table and derived table of a feed
+
+    GTFS tables are hashed from their zip file members and loaded columns,
+    so partitions loaded with other columns are not cloned. derived tables
+    are hashed from the hashes of the tables they are built from
+    """
+    table_hashes = {
+        table.table_name: hashlib.sha256(
+            f"{gtfs_archive.table_hash(table.table_name)}{','.join(loaded_columns(table))}".encode()
+        ).hexdigest()
+        for table in feed_tables(gtfs_archive)
+    }
+
+    for derived_table, input_tables in DERIVED_TABLE_INPUTS.items():
+        input_hashes = "".join(table_hashes[input_table] for input_table in input_tables)
+        table_hashes[derived_table] = hashlib.sha256(input_hashes.encode()).hexdigest()
+
+    return table_hashes
+
+
+def partition_primary_keys(table_name: str) -> List[str]:
+    """
+    primary key columns of GTFS table or derived table partition
+    """
+    if table_name in DERIVED_TABLE_KEYS:
+        return DERIVED_TABLE_KEYS[table_name]
+
+    return next(table.primary_keys for table in TABLES_TO_LOAD if table.table_name == table_name)
+
+
+def partition_indexes(table_name: str) -> List[List[str]]:
+    """
+    columns of each secondary index of GTFS table or derived table partition
+    """
+    if table_name in DERIVED_TABLE_INPUTS:
+        return DERIVED_TABLE_INDEXES.get(table_name, [])
+
+    return next(table.indexes for table in TABLES_TO_LOAD if table.table_name == table_name)
+
+
+def load_or_clone_partition(  # pylint: disable=too-many-arguments
+    db_manager: DatabaseManager,
+    table_name: str,
+    content_hash: str,
+    valid_start_date: datetime.date,
+    valid_end_date: datetime.date,
+    load: Callable[[], int],
+) -> int:
+    """
+    create staging table of table for feed, cloning an earlier feed's partition if its content is unchanged
+
+    load fills the empty staging table and is only called if no earlier
+    partition of table has the same content hash. completed staging table is
+    recorded in feed load state, with its content hash for later feeds, in
+    one transaction.
+
+    Returns:
+        int: number of rows in new staging table
+    """
+    partition_log = ProcessLogger("load_or_clone_partition", table_name=table_name, content_hash=content_hash)
+    partition_log.log_start()
+
+    source_table = matching_partition(db_manager, table_name, content_hash, valid_start_date, valid_end_date)
+    partition_log.add_metadata(cloned_from=source_table)
+
+    create_staging_table(db_manager, table_name, valid_start_date, valid_end_date)
+    if source_table is None:
+        row_count = load()
+    else:
+        row_count = clone_partition(db_manager, source_table, table_name, valid_start_date, valid_end_date)
+    partition_log.add_metadata(row_count=row_count)
+
+    index_staging_table(db_manager, table_name, partition_indexes(table_name), valid_start_date, valid_end_date)
+    primary_keys = partition_primary_keys(table_name)
+    complete_staging_table(db_manager, table_name, primary_keys, valid_start_date, valid_end_date)
+
+    hash_query = (
+        f"INSERT INTO {DB_GTFS_SCHEMA}.feed_table_hash "
+        "(table_name, content_hash, valid_start_date, valid_end_date) "
+        f"VALUES ('{table_name}', '{content_hash}', '{valid_start_date}', '{valid_end_date}')"
+    )
+    state_query = completed_table_query(table_name, valid_start_date, valid_end_date, row_count)
+    db_manager.execute_transaction([sa.text(hash_query), sa.text(state_query)])
+
+    partition_log.log_complete()
+
+    return row_count
+
+
+def feed_load_jobs(
+    db_manager: DatabaseManager,
+    gtfs_archive: GTFSSource,
+    valid_start_date: datetime.date,
+    valid_end_date: datetime.date,
+) -> List[ScheduledJob]:
+    """
+    create scheduler jobs to load GTFS tables and build derived tables for a feed
+
+    long pole tables are listed first so they start first, derived tables
+    start as soon as the tables they are built from are loaded. tables with
+    the same content as a partition of an earlier feed are cloned from that
+    partition instead of loaded or built. tables completed by an earlier
+    attempt of the feed load are not loaded again. optional tables missing
+    from the feed get no partition.
+    """
+    table_hashes = feed_table_hashes(gtfs_archive)
+
+    tables = sorted(
+        feed_tables(gtfs_archive),
+        key=lambda t: LONG_POLE_TABLES.index(t.table_name)
+        if t.table_name in LONG_POLE_TABLES
+        else len(LONG_POLE_TABLES),
+    )
+
+    jobs = [
+        ScheduledJob(
+            name=table.table_name,
+            func=partial(
+                load_or_clone_partition,
+                db_manager,
+                table.table_name,
+                table_hashes[table.table_name],
+                valid_start_date,
+                valid_end_date,
+                partial(load_gtfs_table, db_manager, gtfs_archive, table, valid_start_date, valid_end_date),
+            ),
+        )
+        for table in tables
+    ]
+
+    # build postgis tables from GTFS data
+    # these were pulled from original ETL code on MIT Research Server
+    derived_builders = {
+        "shapes_geog": partial(build_shapes_geog, db_manager, valid_start_date, valid_end_date),
+        "stops_geog": partial(build_stops_geog, db_manager, valid_start_date, valid_end_date),
+        "stop_in_pattern": partial(build_stops_in_pattern, db_manager, valid_start_date, valid_end_date),
+        "service_dates": partial(build_service_dates, db_manager, gtfs_archive, valid_start_date, valid_end_date),
+    }
+    jobs += [
+        ScheduledJob(
+            name=derived_table,
+            func=partial(
+                load_or_clone_partition,
+                db_manager,
+                derived_table,
+                table_hashes[derived_table],
+                valid_start_date,
+                valid_end_date,
+                derived_builders[derived_table],
+            ),
+            depends_on=input_tables,
+        )
+        for derived_table, input_tables in DERIVED_TABLE_INPUTS.items()
+    ]
+
+    completed = completed_tables(db_manager, valid_start_date, valid_end_date)
+    for job in jobs:
+        if job.name in completed:
+            job.func = partial(completed_partition, job.name, completed[job.name])
+
+    return jobs
+
+
+def load_feed(db_manager: DatabaseManager, gtfs_archive: GTFSSource, etag: Optional[str] = None) -> Dict[str, int]:
+    """
+    load feed_info, GTFS tables and derived tables of a feed, and add feed to feed registry
+
+    tables are loaded and derived tables built into UNLOGGED staging tables
+    in a bounded worker pool. each completed table is recorded in feed load
+    state, so a failed load resumes from the completed tables when the feed
+    is loaded again. staging tables are attached as partitions, and the feed
+    added to feed_info and feed registry, in one transaction once every
+    table is complete.
+
+    Args:
+        db_manager (DatabaseManager): database used for load
+        gtfs_archive (GTFSSource): open GTFS zip file or parsed GTFS feed
+        etag (str): ETag header of GTFS zip file download
+
+    Returns:
+        Dict[str, int]: table name -> number of rows in feed partition
+    """
+    feed_log = ProcessLogger("load_gtfs_feed")
+    feed_log.log_start()
+    start = time.monotonic()
+
+    valid_start_date, valid_end_date = process_feed_info(db_manager, gtfs_archive, etag)
+    feed_log.add_metadata(valid_start_date=valid_start_date, valid_end_date=valid_end_date)
+
+    scheduler = JobScheduler(
+        max_workers=int(os.getenv("GTFS_MAX_WORKERS", "4")),
+        scheduler_name="gtfs_feed_load",
+    )
+    results = scheduler.run(feed_load_jobs(db_manager, gtfs_archive, valid_start_date, valid_end_date))
+    scheduler.raise_for_failures()
+
+    # feed is only visible once every partition is loaded
+    row_counts = {table_name: result.result for table_name, result in results.items()}
+    finalize_feed_load(db_manager, valid_start_date, valid_end_date, row_counts)
+
+    duration = time.monotonic() - start
+    feed_log.add_metadata(
+        row_count=sum(row_counts.values()),
+        rows_per_second=f"{sum(row_counts.values()) / duration:.0f}",
+    )
+    feed_log.log_complete()
+
+    return row_counts
+
 
 def run(db_manager: DatabaseManager) -> None:
     """
@@ -476,16 +963,28 @@ def run(db_manager: DatabaseManager) -> None:
     most recent feed version in research server
 
     if feed_version's do not match, load GTFS schedule
+
+    after a new feed is loaded, superseded feeds are exported and dropped
+    under the retention policy
     """
     process_logger = ProcessLogger("etl_gtfs")
     process_logger.log_start()
+
+    gtfs_path = os.path.join(os.getenv("GTFS_DOWNLOAD_DIR") or tempfile.gettempdir(), "MBTA_GTFS.zip")
     try:
-        gtfs_bytes, gtfs_headers = download_gtfs()
+        db_feed_version = last_feed_version(db_manager)
+        db_etag = last_feed_etag(db_manager)
 
-        # current GTFS feed_version provided as header metadata from file download
-        download_feed_version = gtfs_headers.get("x-amz-meta-feed-version")
+        # check feed version before downloading, server responds with no
+        # headers (304) if GTFS zip file ETag matches last loaded feed
+        gtfs_headers = gtfs_feed_headers(GTFS_URL, db_etag)
+        if gtfs_headers is None:
+            process_logger.add_metadata(rds_last_version=db_feed_version, etag_match=True)
+            process_logger.log_complete()
+            return
 
-        db_feed_version = last_feed_version(db_manager)
+        # current GTFS feed_version provided as header metadata
+        download_feed_version = gtfs_headers.get("x-amz-meta-feed-version")
 
         process_logger.add_metadata(
             rds_last_version=db_feed_version,
@@ -497,34 +996,28 @@ def run(db_manager: DatabaseManager) -> None:
             process_logger.log_complete()
             return
 
-        # Begin running GTFS ETL if downloaded feed is not in DB
-        valid_start_date, valid_end_date = process_feed_info(gtfs_bytes)
+        gtfs_headers = download_gtfs(gtfs_path, GTFS_URL, gtfs_headers.get("ETag"))
 
-        process_logger.add_metadata(
-            valid_end_date=valid_end_date,
-            valid_start_date=valid_start_date,
-        )
+        with GTFSArchive(gtfs_path) as gtfs_archive:
+            # tables parsed for validation are read from cache by load
+            gtfs_source = cached_gtfs_source(gtfs_archive)
 
-        # load tables from GTFS file
-        for table in TABLES_TO_LOAD:
-            load_gtfs_table(
-                db_manager,
-                gtfs_bytes,
-                table,
-                valid_start_date,
-                valid_end_date,
-            )
+            # validate whole feed before anything is written to DB
+            raise_for_invalid_feed(gtfs_source, TABLES_TO_LOAD)
 
-        # build postgis tables from GTFS data
-        # these were pulled from original ETL code on MIT Research Server
-        build_shapes_geog(db_manager, valid_start_date, valid_end_date)
-        build_stops_geog(db_manager, valid_start_date, valid_end_date)
-        build_stops_in_pattern(db_manager, valid_start_date, valid_end_date)
+            # Begin running GTFS ETL if downloaded feed is not in DB
+            load_feed(db_manager, gtfs_source, gtfs_headers.get("ETag"))
+
+        os.remove(gtfs_path)
 
         process_logger.log_complete()
 
     except Exception as exception:
         process_logger.log_failure(exception)
+        return
+
+    # feeds are only dropped once the feed superseding them is loaded
+    run_retention(db_manager)
 
 
 if __name__ == "__main__":
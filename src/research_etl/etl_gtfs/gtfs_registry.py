@@ -0,0 +1,83 @@
+import datetime
+from typing import Any, Dict, List, Optional
+
+import sqlalchemy as sa
+
+from research_etl.utils.util_rds import DatabaseManager
+
+from research_etl.etl_gtfs.gtfs_schema import DB_GTFS_SCHEMA
+from research_etl.etl_gtfs.gtfs_schema import partition_table_name
+
+
+def feed_registry_queries(
+    valid_start_date: datetime.date,
+    valid_end_date: datetime.date,
+    row_counts: Dict[str, int],
+) -> List[str]:
+    """
+    statements adding a loaded feed and its partitions to feed registry, in order
+
+    partitions are registered before the feed. feed is registered from its
+    feed_info row. registering a feed again replaces its registry entries.
+
+    :param valid_start_date: valid_start_date of feed partitions
+    :param valid_end_date: valid_end_date of feed partitions
+    :param row_counts: table name -> number of rows in feed partition of table
+    """
+    partition_values = ",".join(
+        f"('{valid_start_date}', '{valid_end_date}', '{table_name}', "
+        f"'{partition_table_name(table_name, valid_start_date, valid_end_date)}', {row_count})"
+        for table_name, row_count in row_counts.items()
+    )
+    partition_query = (
+        f"INSERT INTO {DB_GTFS_SCHEMA}.feed_registry_partition "
+        "(valid_start_date, valid_end_date, table_name, partition_name, row_count) "
+        f"VALUES {partition_values} "
+        "ON CONFLICT (valid_start_date, valid_end_date, table_name) DO UPDATE "
+        "SET partition_name = EXCLUDED.partition_name, row_count = EXCLUDED.row_count"
+    )
+
+    feed_query = (
+        f"INSERT INTO {DB_GTFS_SCHEMA}.feed_registry "
+        "(feed_version, valid_start_date, valid_end_date, creation_timestamp) "
+        "SELECT feed_version, valid_start_date, valid_end_date, creation_timestamp "
+        f"FROM {DB_GTFS_SCHEMA}.feed_info "
+        f"WHERE valid_start_date = '{valid_start_date}' AND valid_end_date = '{valid_end_date}' "
+        "ON CONFLICT (valid_start_date, valid_end_date) DO UPDATE "
+        "SET feed_version = EXCLUDED.feed_version, creation_timestamp = EXCLUDED.creation_timestamp"
+    )
+
+    return [partition_query, feed_query]
+
+
+def feed_for_date(db_manager: DatabaseManager, service_date: datetime.date) -> Optional[Dict[str, Any]]:
+    """
+    most recently created registered feed valid on service_date
+
+    :return: feed_version, valid_start_date and valid_end_date of feed, None if no feed is valid on service_date
+    """
+    query = f"SELECT * FROM {DB_GTFS_SCHEMA}.feed_for_date('{service_date}')"
+    result = db_manager.select_as_list(sa.text(query))
+
+    if result:
+        return result[0]
+
+    return None
+
+
+def partition_for_date(db_manager: DatabaseManager, table_name: str, service_date: datetime.date) -> Optional[str]:
+    """
+    partition of GTFS table for the feed valid on service_date
+
+    querying the returned partition directly avoids planning a query across
+    every partition of the parent table
+
+    :return: schema qualified partition name, None if no feed is valid on service_date
+    """
+    query = f"SELECT {DB_GTFS_SCHEMA}.partition_for_date('{table_name}', '{service_date}') AS partition_name"
+    result = db_manager.select_as_list(sa.text(query))
+
+    if result:
+        return result[0]["partition_name"]
+
+    return None
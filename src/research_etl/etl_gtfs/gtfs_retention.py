@@ -0,0 +1,233 @@
+import os
+import re
+import gzip
+import tempfile
+import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+
+from research_etl.utils.util_rds import DatabaseManager
+from research_etl.utils.util_logging import ProcessLogger
+from research_etl.utils.util_aws import upload_file
+from research_etl.utils.util_aws import object_etag
+
+from research_etl.etl_gtfs.gtfs_schema import DB_GTFS_SCHEMA
+
+# feeds valid on any date in the last GTFS_RETENTION_MONTHS months are kept, partitions of
+# dropped feeds are exported under S3 path GTFS_EXPORT_PREFIX (s3://bucket/prefix),
+# retention is not run if GTFS_RETENTION_MONTHS or GTFS_EXPORT_PREFIX is not set
+GTFS_RETENTION_MONTHS = os.getenv("GTFS_RETENTION_MONTHS")
+GTFS_EXPORT_PREFIX = os.getenv("GTFS_EXPORT_PREFIX")
+
+# valid date suffix of feed partition table names
+PARTITION_DATES_RE = re.compile(r"_(\d{8})_(\d{8})$")
+
+
+def rating_name(feed_version: Optional[str]) -> Optional[str]:
+    """
+    rating period of feed, from text of feed_version before first comma, None if feed has no feed_version
+
+    MBTA feed versions start with their rating, e.g. "Spring 2024, 2024-04-26T22:50:51+00:00, version D"
+    """
+    if feed_version is None:
+        return None
+    return feed_version.split(",")[0].strip()
+
+
+def retention_cutoff(today: datetime.date, keep_months: int) -> datetime.date:
+    """
+    first day of the month keep_months months before today
+    """
+    month_index = today.year * 12 + today.month - 1 - keep_months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def superseded_feeds(feeds: List[Dict[str, Any]], cutoff: datetime.date) -> List[Dict[str, Any]]:
+    """
+    feeds dropped by retention policy
+
+    feeds valid on or after cutoff are kept. before cutoff, only the most
+    recently created feed of each rating is kept, as the representative
+    feed of the rating. feeds with no feed_version have no rating and are kept.
+
+    :param feeds: feed_version, valid_start_date, valid_end_date and creation_timestamp of each feed
+    :param cutoff: first date of retention window
+
+    :return: feeds to drop, oldest first
+    """
+    rated_feeds = sorted(
+        (feed for feed in feeds if rating_name(feed["feed_version"]) is not None),
+        key=lambda f: f["creation_timestamp"],
+    )
+
+    representatives: Dict[Optional[str], Dict[str, Any]] = {}
+    for feed in rated_feeds:
+        representatives[rating_name(feed["feed_version"])] = feed
+
+    return [
+        feed
+        for feed in rated_feeds
+        if feed["valid_end_date"] < cutoff and representatives[rating_name(feed["feed_version"])] is not feed
+    ]
+
+
+def feed_partitions(db_manager: DatabaseManager) -> Dict[Tuple[datetime.date, datetime.date], List[str]]:
+    """
+    partition tables of every feed with partitions in the database
+
+    Returns:
+        Dict[Tuple[datetime.date, datetime.date], List[str]]: (valid_start_date, valid_end_date) -> partition tables
+    """
+    table_query = f"SELECT tablename FROM pg_tables WHERE schemaname = '{DB_GTFS_SCHEMA}'"
+
+    partitions: Dict[Tuple[datetime.date, datetime.date], List[str]] = {}
+    for row in db_manager.select_as_list(sa.text(table_query)):
+        dates_match = PARTITION_DATES_RE.search(row["tablename"])
+        if dates_match is None:
+            continue
+        feed_dates = (
+            datetime.datetime.strptime(dates_match.group(1), "%Y%m%d").date(),
+            datetime.datetime.strptime(dates_match.group(2), "%Y%m%d").date(),
+        )
+        partitions.setdefault(feed_dates, []).append(f"{DB_GTFS_SCHEMA}.{row['tablename']}")
+
+    return partitions
+
+
+def export_partition(db_manager: DatabaseManager, partition: str, feed_prefix: str) -> str:
+    """
+    export rows of partition table to gzip compressed csv file uploaded under S3 path feed_prefix
+
+    file is written to a local temporary directory, uploaded, and removed.
+    upload is confirmed by comparing size of S3 object with size of local
+    file, so a partition is never dropped without a complete export.
+
+    Returns:
+        str: S3 path of exported file
+    """
+    export_name = f"{partition.split('.')[-1]}.csv.gz"
+    export_object = f"{feed_prefix}/{export_name}"
+
+    with tempfile.TemporaryDirectory() as export_dir:
+        export_path = os.path.join(export_dir, export_name)
+        with gzip.open(export_path, "wb") as export_file:
+            db_manager.copy_to_stream(partition, export_file)
+
+        if not upload_file(export_path, export_object):
+            raise IOError(f"failed to upload {partition} export to {export_object}")
+
+        _, object_size = object_etag(export_object)
+        if object_size != os.path.getsize(export_path):
+            raise IOError(
+                f"{export_object} is {object_size} bytes, expected {os.path.getsize(export_path)} bytes exported"
+            )
+
+    return export_object
+
+
+def drop_superseded_feed(
+    db_manager: DatabaseManager, feed: Dict[str, Any], partitions: List[str], export_prefix: str
+) -> int:
+    """
+    export every partition of feed to S3 under export_prefix and drop feed with gtfs.drop_feed
+
+    feed is dropped and its S3 export path recorded in gtfs.feed_export in
+    one transaction, after every partition export is confirmed in S3.
+
+    Returns:
+        int: bytes of partition tables and indexes dropped
+    """
+    start_str = feed["valid_start_date"].strftime("%Y%m%d")
+    end_str = feed["valid_end_date"].strftime("%Y%m%d")
+
+    drop_log = ProcessLogger("drop_superseded_gtfs_feed", feed_version=feed["feed_version"], partitions=len(partitions))
+    drop_log.log_start()
+
+    size_query = sa.text(
+        "SELECT coalesce(sum(pg_total_relation_size(partition::regclass)), 0) AS reclaimed_bytes "
+        "FROM unnest(CAST(:partitions AS text[])) AS partition"
+    ).bindparams(partitions=partitions)
+    reclaimed_bytes = int(db_manager.select_as_list(size_query)[0]["reclaimed_bytes"])
+
+    feed_prefix = f"{export_prefix.rstrip('/')}/{start_str}_{end_str}"
+    for partition in partitions:
+        export_partition(db_manager, partition, feed_prefix)
+
+    export_query = sa.text(
+        f"INSERT INTO {DB_GTFS_SCHEMA}.feed_export "
+        "(feed_version, valid_start_date, valid_end_date, export_path, partition_count, reclaimed_bytes) "
+        "VALUES (:feed_version, :valid_start_date, :valid_end_date, :export_path, :partition_count, :reclaimed_bytes)"
+    ).bindparams(
+        feed_version=feed["feed_version"],
+        valid_start_date=feed["valid_start_date"],
+        valid_end_date=feed["valid_end_date"],
+        export_path=feed_prefix,
+        partition_count=len(partitions),
+        reclaimed_bytes=reclaimed_bytes,
+    )
+    db_manager.execute_transaction(
+        [
+            sa.text(f"SELECT {DB_GTFS_SCHEMA}.drop_feed('{start_str}', '{end_str}')"),
+            export_query,
+        ]
+    )
+
+    drop_log.add_metadata(export_path=feed_prefix, reclaimed_bytes=reclaimed_bytes)
+    drop_log.log_complete()
+
+    return reclaimed_bytes
+
+
+def run_retention(
+    db_manager: DatabaseManager,
+    keep_months: Optional[str] = GTFS_RETENTION_MONTHS,
+    export_prefix: Optional[str] = GTFS_EXPORT_PREFIX,
+) -> None:
+    """
+    export and drop partitions of feeds superseded under the retention policy
+
+    feeds valid in the last keep_months months are kept, older feeds are
+    kept only if they are the representative feed of their rating.
+    feed_info rows of dropped feeds are kept, so dropped feeds are not
+    loaded again. failures are logged and not raised, so retention does not
+    fail the GTFS job.
+
+    :param db_manager: database of feeds
+    :param keep_months: months of feeds kept, retention is not run if not set
+    :param export_prefix: S3 path partitions are exported under, retention is not run if not set
+    """
+    process_log = ProcessLogger("gtfs_retention", keep_months=keep_months, export_prefix=export_prefix)
+    process_log.log_start()
+
+    if not keep_months or not export_prefix:
+        process_log.add_metadata(enabled=False)
+        process_log.log_complete()
+        return
+
+    try:
+        cutoff = retention_cutoff(datetime.date.today(), int(keep_months))
+        partitions = feed_partitions(db_manager)
+
+        feed_query = (
+            "SELECT feed_version, valid_start_date, valid_end_date, creation_timestamp "
+            f"FROM {DB_GTFS_SCHEMA}.feed_info"
+        )
+        feeds = db_manager.select_as_list(sa.text(feed_query))
+        dropped_feeds = [
+            feed
+            for feed in superseded_feeds(feeds, cutoff)
+            if (feed["valid_start_date"], feed["valid_end_date"]) in partitions
+        ]
+        process_log.add_metadata(cutoff=cutoff, feed_count=len(feeds), dropped_feed_count=len(dropped_feeds))
+
+        reclaimed_bytes = 0
+        for feed in dropped_feeds:
+            feed_dates = (feed["valid_start_date"], feed["valid_end_date"])
+            reclaimed_bytes += drop_superseded_feed(db_manager, feed, partitions[feed_dates], export_prefix)
+
+        process_log.add_metadata(reclaimed_bytes=reclaimed_bytes)
+        process_log.log_complete()
+
+    except Exception as exception:
+        process_log.log_failure(exception)
@@ -1,17 +1,35 @@
+import datetime
 from typing import Dict, Any, List
 from dataclasses import dataclass, field
 
 import polars
 
+DB_GTFS_SCHEMA = "gtfs"
+
 
 @dataclass
-class GTFSSchema:
+class GTFSSchema:  # pylint: disable=too-many-instance-attributes
     """describe GTFS tables"""
 
     table_name: str
     schema: Dict[str, Any]
     primary_keys: List[str]
     to_date_fields: List[str] = field(default_factory=list)
+    # column -> "referenced_table.referenced_column"
+    foreign_keys: Dict[str, str] = field(default_factory=dict)
+    # "HH:MM:SS" time column -> integer seconds after midnight column added from it
+    to_seconds_fields: Dict[str, str] = field(default_factory=dict)
+    # columns of each secondary index of feed partitions
+    indexes: List[List[str]] = field(default_factory=list)
+    # table may be missing from a feed, older feeds predate it
+    optional: bool = False
+
+
+def partition_table_name(table: str, start: datetime.date, end: datetime.date) -> str:
+    """
+    create partitioned table name based on start/end dates
+    """
+    return f"{DB_GTFS_SCHEMA}.{table}_" f"{str(start).replace('-','')}_" f"{str(end).replace('-','')}"
 
 
 agency_schema = {
@@ -0,0 +1,310 @@
+import datetime
+from typing import Dict, List, Optional
+
+import sqlalchemy as sa
+
+from research_etl.utils.util_rds import DatabaseManager
+from research_etl.utils.util_logging import ProcessLogger
+
+from research_etl.etl_gtfs.gtfs_schema import DB_GTFS_SCHEMA
+from research_etl.etl_gtfs.gtfs_schema import partition_table_name
+from research_etl.etl_gtfs.gtfs_registry import feed_registry_queries
+
+# feed partitions are built in staging tables named {partition}_stg, and
+# renamed to their partition name when every table of the feed is loaded
+STAGING_SUFFIX = "_stg"
+
+
+def staging_table_name(table: str, start: datetime.date, end: datetime.date) -> str:
+    """
+    create staging table name of partitioned table based on start/end dates
+    """
+    return f"{partition_table_name(table, start, end)}{STAGING_SUFFIX}"
+
+
+def create_staging_table(
+    db_manager: DatabaseManager, table_name: str, valid_start_date: datetime.date, valid_end_date: datetime.date
+) -> str:
+    """
+    create empty UNLOGGED staging table for feed partition of table
+
+    any staging table left by a failed load is replaced. staging table is
+    created as a child of the parent table, to take its columns, defaults
+    and inherited check constraints, and is detached from the parent table
+    in the same transaction. rows are not visible in the parent table until
+    the feed load is finalized.
+
+    Returns:
+        str: name of staging table
+    """
+    staging_table = staging_table_name(table_name, valid_start_date, valid_end_date)
+    main_table = f"{DB_GTFS_SCHEMA}.{table_name}"
+
+    db_manager.execute_transaction(
+        [
+            sa.text(f"DROP TABLE IF EXISTS {staging_table}"),
+            sa.text(f"CREATE UNLOGGED TABLE {staging_table} () INHERITS ({main_table})"),
+            sa.text(f"ALTER TABLE {staging_table} NO INHERIT {main_table}"),
+        ]
+    )
+
+    return staging_table
+
+
+def index_staging_table(
+    db_manager: DatabaseManager,
+    table_name: str,
+    indexes: List[List[str]],
+    valid_start_date: datetime.date,
+    valid_end_date: datetime.date,
+) -> None:
+    """
+    create secondary indexes of loaded staging table, named for the partition the staging table is renamed to
+
+    indexes on geometry or geography columns are GiST indexes, others are btree
+
+    :param indexes: columns of each index
+    """
+    index_prefix = partition_table_name(table_name, valid_start_date, valid_end_date).split(".")[-1]
+    staging_table = staging_table_name(table_name, valid_start_date, valid_end_date)
+    column_types = db_manager.column_types(staging_table) if indexes else {}
+
+    for index_columns in indexes:
+        index_name = f"{index_prefix}_{'_'.join(index_columns)}_idx"
+        index_method = "gist" if any(column_types[c] in ("geometry", "geography") for c in index_columns) else "btree"
+        index_query = f"CREATE INDEX {index_name} ON {staging_table} USING {index_method} ({', '.join(index_columns)})"
+        db_manager.execute(sa.text(index_query))
+
+
+def complete_staging_table(
+    db_manager: DatabaseManager,
+    table_name: str,
+    primary_keys: List[str],
+    valid_start_date: datetime.date,
+    valid_end_date: datetime.date,
+) -> None:
+    """
+    add primary key and valid date checks to loaded staging table and make it LOGGED
+
+    constraints are named for the partition the staging table is renamed to.
+    staging table is made LOGGED as soon as it is loaded, so a completed
+    table survives a database restart and finalizing the feed only renames
+    tables.
+    """
+    staging_table = staging_table_name(table_name, valid_start_date, valid_end_date)
+    constraint_prefix = partition_table_name(table_name, valid_start_date, valid_end_date).split(".")[-1]
+
+    primary_key = ""
+    if len(primary_keys) > 0:
+        primary_key = f"ADD CONSTRAINT {constraint_prefix}_pkey PRIMARY KEY ({', '.join(primary_keys)}),"
+
+    alter_query = (
+        f"ALTER TABLE {staging_table} "
+        f"{primary_key}"
+        f"ADD CONSTRAINT {constraint_prefix}_valid_start_date_check CHECK (valid_start_date = '{valid_start_date}'),"
+        f"ADD CONSTRAINT {constraint_prefix}_valid_end_date_check CHECK (valid_end_date = '{valid_end_date}')"
+    )
+    db_manager.execute(sa.text(alter_query))
+    db_manager.execute(sa.text(f"ALTER TABLE {staging_table} SET LOGGED"))
+
+
+def matching_partition(
+    db_manager: DatabaseManager,
+    table_name: str,
+    content_hash: str,
+    valid_start_date: datetime.date,
+    valid_end_date: datetime.date,
+) -> Optional[str]:
+    """
+    find partition of table, loaded for an earlier feed, with the same content hash
+
+    Returns:
+        str: name of most recently loaded matching partition, None if no partition matches
+    """
+    query = (
+        "SELECT valid_start_date, valid_end_date "
+        f"FROM {DB_GTFS_SCHEMA}.feed_table_hash "
+        f"WHERE table_name = '{table_name}' "
+        f"AND content_hash = '{content_hash}' "
+        f"AND NOT (valid_start_date = '{valid_start_date}' AND valid_end_date = '{valid_end_date}') "
+        "ORDER BY created_at DESC"
+    )
+
+    for row in db_manager.select_as_list(sa.text(query)):
+        source_table = partition_table_name(table_name, row["valid_start_date"], row["valid_end_date"])
+        exists_query = f"SELECT to_regclass('{source_table}') IS NOT NULL AS partition_exists"
+        if db_manager.select_as_list(sa.text(exists_query))[0]["partition_exists"]:
+            return source_table
+
+    return None
+
+
+def clone_partition(
+    db_manager: DatabaseManager,
+    source_table: str,
+    table_name: str,
+    valid_start_date: datetime.date,
+    valid_end_date: datetime.date,
+) -> int:
+    """
+    fill staging table of table for feed by copying rows of an earlier feed's partition
+
+    rows are copied server side, only valid date columns are changed
+
+    Returns:
+        int: number of rows copied
+    """
+    main_table = f"{DB_GTFS_SCHEMA}.{table_name}"
+    new_table_name = staging_table_name(table_name, valid_start_date, valid_end_date)
+
+    columns = list(db_manager.column_types(main_table).keys())
+    select_columns = [
+        f"'{valid_start_date}'::date"
+        if column == "valid_start_date"
+        else f"'{valid_end_date}'::date"
+        if column == "valid_end_date"
+        else column
+        for column in columns
+    ]
+
+    insert_query = (
+        f"INSERT INTO {new_table_name} ({', '.join(columns)}) "
+        f"SELECT {', '.join(select_columns)} "
+        f"FROM {source_table} "
+    )
+    return db_manager.execute(sa.text(insert_query)).rowcount
+
+
+def completed_table_query(
+    table_name: str, valid_start_date: datetime.date, valid_end_date: datetime.date, row_count: int
+) -> str:
+    """
+    INSERT feed load state of table whose staging table is complete
+    """
+    return (
+        f"INSERT INTO {DB_GTFS_SCHEMA}.feed_load_state "
+        "(valid_start_date, valid_end_date, table_name, row_count) "
+        f"VALUES ('{valid_start_date}', '{valid_end_date}', '{table_name}', {row_count})"
+    )
+
+
+def completed_tables(
+    db_manager: DatabaseManager, valid_start_date: datetime.date, valid_end_date: datetime.date
+) -> Dict[str, int]:
+    """
+    tables of feed completed by an earlier attempt of the feed load
+
+    Returns:
+        Dict[str, int]: table name -> number of rows in completed staging table
+    """
+    query = (
+        "SELECT table_name, row_count "
+        f"FROM {DB_GTFS_SCHEMA}.feed_load_state "
+        f"WHERE valid_start_date = '{valid_start_date}' AND valid_end_date = '{valid_end_date}'"
+    )
+    return {row["table_name"]: row["row_count"] for row in db_manager.select_as_list(sa.text(query))}
+
+
+def completed_partition(table_name: str, row_count: int) -> int:
+    """
+    scheduler job of table completed by an earlier attempt of the feed load, returns number of rows
+    """
+    resume_log = ProcessLogger("resume_gtfs_partition", table_name=table_name, row_count=row_count)
+    resume_log.log_start()
+    resume_log.log_complete()
+
+    return row_count
+
+
+def discard_staged_feed(
+    db_manager: DatabaseManager, feed_version: str, valid_start_date: datetime.date, valid_end_date: datetime.date
+) -> None:
+    """
+    drop staging tables, load state and table hashes of a failed load of another feed version with the same valid dates
+
+    staged tables are kept if they were staged for feed_version, so the
+    feed load resumes from the tables already completed
+    """
+    feed_info_table = staging_table_name("feed_info", valid_start_date, valid_end_date)
+    exists_query = f"SELECT to_regclass('{feed_info_table}') IS NOT NULL AS staging_exists"
+    if db_manager.select_as_list(sa.text(exists_query))[0]["staging_exists"]:
+        version_query = f"SELECT feed_version FROM {feed_info_table}"
+        staged_versions = [row["feed_version"] for row in db_manager.select_as_list(sa.text(version_query))]
+        if staged_versions == [feed_version]:
+            return
+
+    discard_log = ProcessLogger("discard_staged_gtfs_feed", valid_start_date=valid_start_date)
+    discard_log.log_start()
+
+    date_suffix = partition_table_name("", valid_start_date, valid_end_date).split(".")[-1]
+    staging_query = (
+        "SELECT schemaname || '.' || tablename AS staging_table "
+        "FROM pg_tables "
+        f"WHERE schemaname = '{DB_GTFS_SCHEMA}' "
+        f"AND right(tablename, {len(date_suffix + STAGING_SUFFIX)}) = '{date_suffix}{STAGING_SUFFIX}'"
+    )
+    staging_tables = [row["staging_table"] for row in db_manager.select_as_list(sa.text(staging_query))]
+    for staging_table in staging_tables:
+        db_manager.execute(sa.text(f"DROP TABLE IF EXISTS {staging_table}"))
+
+    # table hashes are keyed on valid dates and table name, hashes of the
+    # discarded feed version would block the new version from recording its own
+    db_manager.execute_transaction(
+        [
+            sa.text(
+                f"DELETE FROM {DB_GTFS_SCHEMA}.{state_table} "
+                f"WHERE valid_start_date = '{valid_start_date}' AND valid_end_date = '{valid_end_date}'"
+            )
+            for state_table in ("feed_load_state", "feed_table_hash")
+        ]
+    )
+
+    discard_log.add_metadata(dropped_tables=len(staging_tables))
+    discard_log.log_complete()
+
+
+def finalize_feed_load(
+    db_manager: DatabaseManager,
+    valid_start_date: datetime.date,
+    valid_end_date: datetime.date,
+    row_counts: Dict[str, int],
+) -> None:
+    """
+    make every staged table of a feed visible in one transaction
+
+    staging tables are renamed to their partition names and attached to
+    their parent tables, staged feed_info row is added to feed_info, feed
+    is added to feed registry and feed load state is cleared. a failure
+    leaves the staged feed unchanged, to be finalized by the next attempt.
+
+    :param db_manager: database of feed
+    :param valid_start_date: valid_start_date of feed partitions
+    :param valid_end_date: valid_end_date of feed partitions
+    :param row_counts: table name -> number of rows in staging table, of every table to finalize
+    """
+    finalize_log = ProcessLogger("finalize_gtfs_feed_load", partition_count=len(row_counts))
+    finalize_log.log_start()
+
+    statements = []
+    for table_name in row_counts:
+        staging_table = staging_table_name(table_name, valid_start_date, valid_end_date)
+        new_table_name = partition_table_name(table_name, valid_start_date, valid_end_date)
+        statements += [
+            f"ALTER TABLE {staging_table} RENAME TO {new_table_name.split('.')[-1]}",
+            f"ALTER TABLE {new_table_name} INHERIT {DB_GTFS_SCHEMA}.{table_name}",
+        ]
+
+    feed_info_table = staging_table_name("feed_info", valid_start_date, valid_end_date)
+    statements += [
+        f"INSERT INTO {DB_GTFS_SCHEMA}.feed_info SELECT * FROM {feed_info_table}",
+        f"DROP TABLE {feed_info_table}",
+    ]
+    statements += feed_registry_queries(valid_start_date, valid_end_date, row_counts)
+    statements.append(
+        f"DELETE FROM {DB_GTFS_SCHEMA}.feed_load_state "
+        f"WHERE valid_start_date = '{valid_start_date}' AND valid_end_date = '{valid_end_date}'"
+    )
+
+    db_manager.execute_transaction([sa.text(statement) for statement in statements])
+
+    finalize_log.log_complete()
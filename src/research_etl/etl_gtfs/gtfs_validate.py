@@ -0,0 +1,175 @@
+from typing import Dict, List, Set
+
+import polars
+import pyarrow
+
+from research_etl.utils.util_logging import ProcessLogger
+
+from research_etl.etl_gtfs.gtfs_archive import GTFSSource
+from research_etl.etl_gtfs.gtfs_schema import GTFSSchema
+
+# number of offending values included in each violation message
+MAX_EXAMPLES = 5
+
+# bytes of csv text parsed at a time when reading validation columns
+VALIDATE_BATCH_BYTES = 4 * 1024 * 1024
+
+
+def _examples(values: polars.DataFrame) -> str:
+    """format first MAX_EXAMPLES rows of values for a violation message"""
+    return ", ".join(str(row) for row in values.head(MAX_EXAMPLES).rows())
+
+
+def validation_columns(tables: List[GTFSSchema]) -> Dict[str, List[str]]:
+    """
+    table name -> columns needed to validate table, or referenced by foreign keys of other tables
+    """
+    columns: Dict[str, Set[str]] = {table.table_name: set() for table in tables}
+
+    for table in tables:
+        columns[table.table_name].update(table.primary_keys)
+        columns[table.table_name].update(table.to_date_fields)
+        for column, reference in table.foreign_keys.items():
+            columns[table.table_name].add(column)
+            ref_table, ref_column = reference.split(".")
+            columns.setdefault(ref_table, set()).add(ref_column)
+
+    return {table_name: sorted(table_columns) for table_name, table_columns in columns.items()}
+
+
+def check_primary_key(table: GTFSSchema, table_df: polars.DataFrame) -> List[str]:
+    """
+    check primary key columns of table are not NULL and are unique
+    """
+    if len(table.primary_keys) == 0:
+        return []
+
+    violations = []
+    keys_df = table_df.select(table.primary_keys)
+
+    null_keys = keys_df.filter(polars.any_horizontal(polars.all().is_null()))
+    if null_keys.height > 0:
+        violations.append(
+            f"{table.table_name}: {null_keys.height} rows with NULL primary key "
+            f"({', '.join(table.primary_keys)}) e.g. {_examples(null_keys)}"
+        )
+
+    duplicate_keys = keys_df.filter(keys_df.is_duplicated()).unique(maintain_order=True)
+    if duplicate_keys.height > 0:
+        violations.append(
+            f"{table.table_name}: {duplicate_keys.height} duplicated primary keys "
+            f"({', '.join(table.primary_keys)}) e.g. {_examples(duplicate_keys)}"
+        )
+
+    return violations
+
+
+def check_dates(table: GTFSSchema, table_df: polars.DataFrame, date_format: str = "%Y%m%d") -> List[str]:
+    """
+    check date fields of table can be converted to dates
+    """
+    violations = []
+    for column in table.to_date_fields:
+        bad_dates = table_df.select(column).filter(
+            polars.col(column).is_not_null()
+            & polars.col(column).str.to_date(format=date_format, strict=False).is_null()
+        )
+        if bad_dates.height > 0:
+            violations.append(
+                f"{table.table_name}.{column}: {bad_dates.height} values are not {date_format} dates "
+                f"e.g. {_examples(bad_dates.unique(maintain_order=True))}"
+            )
+
+    return violations
+
+
+def check_foreign_keys(table: GTFSSchema, table_frames: Dict[str, polars.DataFrame]) -> List[str]:
+    """
+    check non NULL foreign key values of table exist in referenced table
+    """
+    violations = []
+    for column, reference in table.foreign_keys.items():
+        ref_table, ref_column = reference.split(".")
+        if ref_table not in table_frames:
+            # missing referenced table is reported on its own
+            continue
+
+        ref_values = table_frames[ref_table].select(polars.col(ref_column).alias(column)).unique()
+        orphans = (
+            table_frames[table.table_name]
+            .select(column)
+            .drop_nulls()
+            .unique(maintain_order=True)
+            .join(ref_values, on=column, how="anti")
+        )
+        if orphans.height > 0:
+            violations.append(
+                f"{table.table_name}.{column}: {orphans.height} values not found in {reference} "
+                f"e.g. {_examples(orphans)}"
+            )
+
+    return violations
+
+
+def validate_feed(gtfs_archive: GTFSSource, tables: List[GTFSSchema]) -> List[str]:
+    """
+    validate GTFS tables of feed in memory, before anything is loaded
+
+    only primary key, foreign key and date columns are read. checks that
+    every table is present, unless it is optional, and parses with its
+    schema, that primary keys
+    are unique and not NULL, that foreign keys exist in the referenced
+    table and that date fields are valid dates.
+
+    :param gtfs_archive: open GTFS zip file or cached GTFS feed
+    :param tables: GTFS tables to validate
+
+    :return: every violation found, empty if feed is valid
+    """
+    violations: List[str] = []
+    table_frames: Dict[str, polars.DataFrame] = {}
+    table_columns = validation_columns(tables)
+
+    for table in tables:
+        if not gtfs_archive.has_table(table.table_name):
+            if table.optional:
+                continue
+            violations.append(f"{table.table_name}: {table.table_name}.txt missing from GTFS file")
+            continue
+
+        schema = {column: table.schema[column] for column in table_columns[table.table_name]}
+        try:
+            batches = list(gtfs_archive.iter_csv_batches(table.table_name, schema, VALIDATE_BATCH_BYTES))
+        except pyarrow.ArrowInvalid as parse_error:
+            violations.append(f"{table.table_name}: could not be parsed ({parse_error})")
+            continue
+
+        table_frames[table.table_name] = polars.concat(batches) if batches else polars.DataFrame(schema=schema)
+
+    for table in tables:
+        if table.table_name not in table_frames:
+            continue
+        violations += check_primary_key(table, table_frames[table.table_name])
+        violations += check_dates(table, table_frames[table.table_name])
+        violations += check_foreign_keys(table, table_frames)
+
+    return violations
+
+
+def raise_for_invalid_feed(gtfs_archive: GTFSSource, tables: List[GTFSSchema]) -> None:
+    """
+    validate GTFS feed and raise ValueError listing every violation if feed is not valid
+    """
+    validate_log = ProcessLogger("validate_gtfs", table_count=len(tables))
+    validate_log.log_start()
+
+    try:
+        violations = validate_feed(gtfs_archive, tables)
+        validate_log.add_metadata(violation_count=len(violations))
+        if violations:
+            raise ValueError("GTFS feed failed validation:\n" + "\n".join(violations))
+    except Exception as exception:
+        validate_log.log_failure(exception)
+        raise exception
+
+    validate_log.log_complete()
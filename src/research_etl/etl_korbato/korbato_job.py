@@ -2,47 +2,59 @@ import os
 import tempfile
 import datetime
 from io import StringIO
+from typing import List, Optional, Tuple
 
 import paramiko
 import sqlalchemy as sa
 
 from research_etl.utils.util_logging import ProcessLogger
 from research_etl.utils.util_rds import DatabaseManager
+from research_etl.utils.util_partitions import PartitionManager
+from research_etl.utils.util_partitions import PartitionedTable
 from research_etl.utils.util_rds import copy_zip_csv_to_db
 from research_etl.utils.util_sftp import walk_sftp_dirs
 
 
-def verify_partition(date: datetime.date, table: str, db_manager: DatabaseManager) -> None:
+def korbato_partitioned_tables() -> List[PartitionedTable]:
     """
-    check if table partition exists for odx2 table and date
-    if does not exist, create partition
+    odx tables partitioned by month of svc_date
     """
-    partition_table = f"{table}_y{date.strftime('%Y')}m{date.strftime('%m')}"
-    check_query = (
-        "SELECT EXISTS ( "
-        "    SELECT FROM pg_tables WHERE "
-        "       schemaname = 'odx2' "
-        f"       AND tablename = '{partition_table}'"
-        ");"
-    )
-    check_bool = db_manager.select_as_list(sa.text(check_query))[0]["exists"]
+    schema = os.getenv("KORBATO_SCHEMA", "")
+    return [PartitionedTable(schema, "fare_transaction", "svc_date", brin_indexes=[["txn_time"]])]
 
-    if check_bool:
-        # table already exists, do nothing
-        return
 
-    # create new partition table
-    from_month = datetime.date(date.year, date.month, 1)
-    if date.month == 12:
-        to_month = datetime.date(date.year + 1, 1, 1)
-    else:
-        to_month = datetime.date(date.year, date.month + 1, 1)
+def korbato_file_table(file_name: str) -> Tuple[Optional[datetime.date], str]:
+    """
+    service date and table loaded by korbato file, service date is None for lookup tables
 
-    create_query = (
-        f"CREATE TABLE odx2.{partition_table} PARTITION OF odx2.{table} "
-        f"FOR VALUES FROM ('{from_month}') TO ('{to_month}');"
-    )
-    db_manager.execute(sa.text(create_query))
+    20240309_vehicle_day_20240312-200001.csv.zip -> (2024-03-09, vehicle_day)
+    """
+    # handle data tables
+    if file_name[:8].isnumeric():
+        service_date = datetime.date(int(file_name[:4]), int(file_name[4:6]), int(file_name[6:8]))
+        return service_date, file_name[9:].rsplit("_", 1)[0]
+
+    # handle lookup tables
+    return None, file_name.rsplit("_", 1)[0]
+
+
+def create_pending_partitions(sftp_paths: List[str], partition_manager: PartitionManager) -> None:
+    """
+    create partitions needed by every file to load, and partitions of this month and next month, in one batch
+    """
+    schema = os.getenv("KORBATO_SCHEMA", "")
+
+    pending_months = partition_manager.months_ahead(datetime.date.today())
+    for sftp_path in sftp_paths:
+        try:
+            service_date, table = korbato_file_table(sftp_path.split("/")[-1])
+        except ValueError:
+            # load of file fails and is logged by the job
+            continue
+        if service_date is not None and f"{schema}.{table}" in partition_manager.tables:
+            pending_months.setdefault(f"{schema}.{table}", []).append(service_date)
+
+    partition_manager.ensure_partitions(pending_months)
 
 
 def connect_ssh_client(hostname: str = "", username: str = "") -> paramiko.SSHClient:
@@ -96,7 +108,7 @@ def download_sftp_file(sftp_path: str, local_path: str, sftp_client: paramiko.SF
     download_logger.log_complete()
 
 
-def load_korbato_file(local_path: str, db_manager: DatabaseManager) -> None:
+def load_korbato_file(local_path: str, db_manager: DatabaseManager, partition_manager: PartitionManager) -> None:
     """
     load one korbato file into rds
 
@@ -106,27 +118,21 @@ def load_korbato_file(local_path: str, db_manager: DatabaseManager) -> None:
 
     schema = os.getenv("KORBATO_SCHEMA", "")
 
-    # handle data tables
-    if file_name[:8].isnumeric():
-        year = int(file_name[:4])
-        month = int(file_name[4:6])
-        day = int(file_name[6:8])
-        service_date = datetime.date(year, month, day)
-
-        table = file_name[9:].rsplit("_", 1)[0]
+    service_date, table = korbato_file_table(file_name)
 
-        if table == "fare_transaction":
-            verify_partition(service_date, table, db_manager)
+    # handle data tables
+    if service_date is not None:
+        if f"{schema}.{table}" in partition_manager.tables:
+            partition_manager.ensure_partitions({f"{schema}.{table}": [service_date]})
 
-        del_q = sa.text(f"DELETE FROM {schema}.{table} WHERE svc_date = '{year}-{month}-{day}'")
+        del_q = sa.text(f"DELETE FROM {schema}.{table} WHERE svc_date = '{service_date}'")
         db_manager.execute(del_q)
 
     # handle lookup tables
     else:
-        table = file_name.rsplit("_", 1)[0]
         db_manager.truncate_table(f"{schema}.{table}")
 
-    copy_zip_csv_to_db(local_path, f"{schema}.{table}")
+    copy_zip_csv_to_db(local_path, f"{schema}.{table}", db_manager)
 
 
 def run(db_manager: DatabaseManager) -> None:
@@ -144,13 +150,16 @@ def run(db_manager: DatabaseManager) -> None:
 
         sftp_paths = walk_sftp_dirs(sftp_client, "out")
 
+        partition_manager = PartitionManager(db_manager, korbato_partitioned_tables())
+        create_pending_partitions(sftp_paths, partition_manager)
+
         process_logger.add_metadata(file_count=len(sftp_paths))
         for sftp_path in sftp_paths:
             sftp_file = sftp_path.split("/")[-1]
             with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
                 temp_file = os.path.join(temp_dir, sftp_file)
                 download_sftp_file(sftp_path, temp_file, sftp_client)
-                load_korbato_file(temp_file, db_manager)
+                load_korbato_file(temp_file, db_manager, partition_manager)
 
         sftp_client.close()
         ssh_client.close()
@@ -180,13 +189,16 @@ def alt_run(db_manager: DatabaseManager) -> None:
         # sftp_paths += walk_sftp_dirs(sftp_client, "out/20240517")
         sftp_paths = walk_sftp_dirs(sftp_client, "out/20240711")
 
+        partition_manager = PartitionManager(db_manager, korbato_partitioned_tables())
+        create_pending_partitions(sftp_paths, partition_manager)
+
         process_logger.add_metadata(file_count=len(sftp_paths))
         for sftp_path in sftp_paths:
             sftp_file = sftp_path.split("/")[-1]
             with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
                 temp_file = os.path.join(temp_dir, sftp_file)
                 download_sftp_file(sftp_path, temp_file, sftp_client)
-                load_korbato_file(temp_file, db_manager)
+                load_korbato_file(temp_file, db_manager, partition_manager)
 
         sftp_client.close()
         ssh_client.close()
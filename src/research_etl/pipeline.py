@@ -12,6 +12,8 @@ from research_etl.etl_afc.afc_job import run as afc_job
 
 from research_etl.utils.util_aws import check_for_parallel_tasks
 from research_etl.utils.util_rds import DatabaseManager
+from research_etl.utils.util_scheduler import JobScheduler
+from research_etl.utils.util_scheduler import ScheduledJob
 
 
 def run_jobs() -> None:
@@ -24,12 +26,29 @@ def run_jobs() -> None:
 
     db_manager = DatabaseManager()
 
-    gtfs_job(db_manager)
-    odx_job(db_manager)
-    # odx_catch_up_job(db_manager)
-    afc_job(db_manager)
-    # csat_job(db_manager)
-    # gse_job(db_manager)
+    # jobs write to disjoint schemas (gtfs, odx2, afc) so they can run
+    # concurrently, each job holds one unit of "db" while running to bound the
+    # number of jobs running against the database. "db" does not bound
+    # connections, each job runs its own worker pool (GTFS_MAX_WORKERS,
+    # AFC_MAX_WORKERS x AFC_BULK_WORKERS) and every running worker holds a
+    # connection, workers beyond the engine pool_size + max_overflow wait on
+    # the DatabaseManager pool and fail after its pool_timeout
+    jobs = [
+        ScheduledJob(name="gtfs", func=lambda: gtfs_job(db_manager), resources={"db": 1}),
+        ScheduledJob(name="odx", func=lambda: odx_job(db_manager), resources={"db": 1}),
+        # ScheduledJob(name="odx_catch_up", func=lambda: odx_catch_up_job(db_manager), depends_on=["odx"]),
+        ScheduledJob(name="afc", func=lambda: afc_job(db_manager), resources={"db": 1}),
+        # ScheduledJob(name="csat", func=lambda: csat_job(db_manager)),
+        # ScheduledJob(name="gse", func=lambda: gse_job(db_manager), depends_on=["afc"]),
+    ]
+
+    scheduler = JobScheduler(
+        max_workers=int(os.getenv("ETL_MAX_WORKERS", "3")),
+        resource_limits={"db": int(os.getenv("ETL_MAX_DB_JOBS", "3"))},
+        scheduler_name="run_etl_jobs",
+    )
+    scheduler.run(jobs)
+    scheduler.raise_for_failures()
 
 
 if __name__ == "__main__":
@@ -1,19 +1,138 @@
 import os
-from typing import List
+import threading
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
 import boto3
+from botocore.config import Config
 
 from research_etl.utils.util_logging import ProcessLogger
 
+# HTTP connections pooled by the shared S3 client, across all workers
+S3_MAX_POOL_CONNECTIONS = 32
+
+# byte range of S3 object downloaded by each ranged GET of S3RangedReader
+S3_PART_BYTES = 8 * 1024 * 1024
+
+# parts of S3 object downloading or downloaded ahead of S3RangedReader reader
+S3_MAX_PARTS_AHEAD = 4
+
+S3_CLIENTS: Dict[Optional[str], Any] = {}
+S3_CLIENT_LOCK = threading.Lock()
+
 
 def get_s3_client() -> boto3.client:
-    """Thin function needed for stubbing tests"""
+    """
+    Thin function needed for stubbing tests
+
+    one client is created per AWS profile and shared by every caller, boto3
+    clients are thread safe and pool their HTTP connections. set
+    AWS_ENDPOINT_URL_S3 to run against a local S3 stand-in.
+    """
     aws_profile = os.getenv("AWS_PROFILE", None)
 
-    if aws_profile is not None:
-        return boto3.Session(profile_name=aws_profile).client("s3")
+    with S3_CLIENT_LOCK:
+        if aws_profile not in S3_CLIENTS:
+            # clients are created from their own session, the boto3 default
+            # session is not safe to create clients from in concurrent workers
+            S3_CLIENTS[aws_profile] = boto3.Session(profile_name=aws_profile).client(
+                "s3",
+                config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS, retries={"mode": "standard"}),
+            )
+        return S3_CLIENTS[aws_profile]
 
-    return boto3.client("s3")
+
+class S3RangedReader:  # pylint: disable=too-many-instance-attributes
+    """
+    file-like reader of S3 object, downloading byte ranges of the object concurrently
+
+    parts of part_size bytes are downloaded by a thread pool ahead of the
+    reader. at most max_parts_ahead parts are downloading or held at a time,
+    so memory use is bounded and downloads wait on a slow reader. parts are
+    requested with the ETag of the object, so reading an object that is
+    replaced mid-read fails instead of mixing object versions.
+    """
+
+    def __init__(
+        self, object_path: str, part_size: int = S3_PART_BYTES, max_parts_ahead: int = S3_MAX_PARTS_AHEAD
+    ) -> None:
+        """
+        :param object_path: S3 object path, as 's3://my_bucket/object' or 'my_bucket/object'
+        :param part_size: bytes of each ranged GET
+        :param max_parts_ahead: parts downloading or downloaded and not yet read
+        """
+        self.bucket, self.key = object_path.replace("s3://", "").split("/", 1)
+        self.part_size = part_size
+
+        self.s3_client = get_s3_client()
+        head = self.s3_client.head_object(Bucket=self.bucket, Key=self.key)
+        self.object_size: int = head["ContentLength"]
+        self.etag: str = head["ETag"]
+
+        self.bytes_read = 0
+        self.part_count = 0
+
+        self.next_offset = 0
+        self.buffer = memoryview(b"")
+        self.parts: Deque[Future] = deque()
+        self.pool = ThreadPoolExecutor(max_workers=max_parts_ahead)
+        for _ in range(max_parts_ahead):
+            self._submit_next_part()
+
+    def _download_part(self, first_byte: int, last_byte: int) -> bytes:
+        """download inclusive byte range of object"""
+        response = self.s3_client.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f"bytes={first_byte}-{last_byte}",
+            IfMatch=self.etag,
+        )
+        with response["Body"] as body:
+            return body.read()
+
+    def _submit_next_part(self) -> None:
+        """start download of next part of object, if any"""
+        if self.next_offset >= self.object_size:
+            return
+        last_byte = min(self.next_offset + self.part_size, self.object_size) - 1
+        self.parts.append(self.pool.submit(self._download_part, self.next_offset, last_byte))
+        self.next_offset = last_byte + 1
+
+    def read(self, size: int = -1) -> bytes:
+        """read up to size bytes of object, all remaining bytes if size is negative"""
+        remaining = size if size >= 0 else self.object_size
+        chunks = []
+        while remaining > 0:
+            if not self.buffer:
+                if not self.parts:
+                    break
+                self.buffer = memoryview(self.parts.popleft().result())
+                self.part_count += 1
+                # a part is only downloaded once a downloaded part is read
+                self._submit_next_part()
+
+            chunk = self.buffer[:remaining]
+            self.buffer = self.buffer[len(chunk) :]
+            chunks.append(chunk)
+            remaining -= len(chunk)
+
+        data = b"".join(chunks)
+        self.bytes_read += len(data)
+        return data
+
+    def close(self) -> None:
+        """cancel downloads not started and wait for running downloads"""
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.parts.clear()
+        self.buffer = memoryview(b"")
+
+    def __enter__(self) -> "S3RangedReader":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
 
 
 def download_file(object_path: str, file_name: str) -> bool:
@@ -53,6 +172,40 @@ def download_file(object_path: str, file_name: str) -> bool:
         return False
 
 
+def upload_file(file_name: str, object_path: str) -> bool:
+    """
+    Upload a local file to an S3 object
+    will overwrite S3 object, if exists
+
+    :param file_name: local file path to upload
+    :param object_path: S3 object path to upload to (including bucket)
+
+    :return: True if file was uploaded, else False
+    """
+    upload_log = ProcessLogger(
+        "s3_upload_file",
+        file_name=file_name,
+        object_path=object_path,
+    )
+    upload_log.log_start()
+
+    try:
+        object_path = object_path.replace("s3://", "")
+        bucket, object_name = object_path.split("/", 1)
+
+        s3_client = get_s3_client()
+
+        s3_client.upload_file(file_name, bucket, object_name)
+
+        upload_log.log_complete()
+
+        return True
+
+    except Exception as exception:
+        upload_log.log_failure(exception=exception)
+        return False
+
+
 def file_list_from_s3(bucket_name: str, file_prefix: str, max_list_size: int = 250_000) -> List[str]:
     """
     provide list of s3 objects based on bucket_name and file_prefix
@@ -91,6 +244,20 @@ def file_list_from_s3(bucket_name: str, file_prefix: str, max_list_size: int = 2
         return []
 
 
+def object_etag(s3_object: str) -> Tuple[str, int]:
+    """
+    ETag and size of s3 object
+
+    :param s3_object - expected as 's3://my_bucket/object' or 'my_bucket/object'
+
+    :return: (ETag without quotes, size in bytes)
+    """
+    bucket, object_name = s3_object.replace("s3://", "").split("/", 1)
+    head = get_s3_client().head_object(Bucket=bucket, Key=object_name)
+
+    return head["ETag"].strip('"'), head["ContentLength"]
+
+
 def delete_object(del_obj: str) -> bool:
     """
     delete s3 object
@@ -0,0 +1,246 @@
+import struct
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple
+
+import numpy
+import polars
+import pyarrow
+import pyarrow.compute as pc
+
+from research_etl.utils.util_rds import DatabaseManager
+
+# pyarrow.compute functions are generated at import time
+# pylint: disable=no-member
+
+# PGCOPY signature, flags field and header extension length
+BINARY_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+# tuple field count of -1 marks end of data
+BINARY_COPY_TRAILER = struct.pack(">h", -1)
+
+# postgres binary date/timestamp epoch (2000-01-01) as offsets from unix epoch
+PG_EPOCH_DAYS = 10_957
+PG_EPOCH_MICROSECONDS = PG_EPOCH_DAYS * 86_400 * 1_000_000
+
+# postgres types with a fixed width big-endian binary encoding
+# column type -> (polars cast type, numpy big-endian dtype)
+FIXED_WIDTH_TYPES: Dict[str, Tuple[Any, str]] = {
+    "smallint": (polars.Int16, ">i2"),
+    "integer": (polars.Int32, ">i4"),
+    "bigint": (polars.Int64, ">i8"),
+    "real": (polars.Float32, ">f4"),
+    "double precision": (polars.Float64, ">f8"),
+    "boolean": (polars.UInt8, "u1"),
+}
+
+# postgres types sent as raw bytes
+TEXT_TYPES = ("text", "character varying", "character", "name")
+BYTES_TYPES = ("bytea", "geometry", "geography")
+
+
+def _binary_array(matrix: numpy.ndarray, row_lengths: Optional[numpy.ndarray] = None) -> pyarrow.Array:
+    """
+    create arrow binary array from rows of a uint8 matrix
+
+    :param matrix: (rows, width) uint8 matrix
+    :param row_lengths: number of leading bytes of each matrix row to keep, all if None
+    """
+    rows, width = matrix.shape
+    if row_lengths is None:
+        data = matrix.reshape(-1)
+        offsets = numpy.arange(0, (rows + 1) * width, width, dtype=numpy.int32)
+    else:
+        data = matrix[numpy.arange(width) < row_lengths[:, None]]
+        offsets = numpy.zeros(rows + 1, dtype=numpy.int32)
+        numpy.cumsum(row_lengths, out=offsets[1:])
+
+    return pyarrow.Array.from_buffers(
+        pyarrow.binary(),
+        rows,
+        [None, pyarrow.py_buffer(offsets), pyarrow.py_buffer(numpy.ascontiguousarray(data))],
+    )
+
+
+def _field_header(lengths: numpy.ndarray) -> numpy.ndarray:
+    """(rows, 4) uint8 matrix of big-endian field lengths, -1 is NULL"""
+    return lengths.astype(">i4").view(numpy.uint8).reshape(-1, 4)
+
+
+def _fixed_width_fields(values: numpy.ndarray, null_mask: numpy.ndarray) -> pyarrow.Array:
+    """
+    encode fixed width values as binary COPY fields
+
+    :param values: (rows, width) uint8 matrix of big-endian encoded values
+    :param null_mask: True for NULL rows
+    """
+    width = values.shape[1]
+    lengths = numpy.where(null_mask, -1, width)
+    matrix = numpy.hstack([_field_header(lengths), values])
+
+    if not null_mask.any():
+        return _binary_array(matrix)
+
+    return _binary_array(matrix, numpy.where(null_mask, 4, 4 + width).astype(numpy.int32))
+
+
+def _bytes_fields(payload: pyarrow.Array) -> pyarrow.Array:
+    """
+    encode arrow binary payload as binary COPY fields
+    """
+    null_mask = payload.is_null().to_numpy(zero_copy_only=False)
+    lengths = pc.binary_length(payload).fill_null(0).to_numpy(zero_copy_only=False)
+    header = _binary_array(_field_header(numpy.where(null_mask, -1, lengths)))
+
+    return pc.binary_join_element_wise(header, payload.fill_null(b""), b"")
+
+
+def _interval_values(column: polars.Series) -> numpy.ndarray:
+    """
+    convert "HH:MM:SS" strings (hours may be 24+) or durations to postgres interval binary values
+    """
+    if column.dtype == polars.Duration:
+        microseconds = column.cast(polars.Duration("us")).to_physical()
+    else:
+        parts = column.cast(polars.Utf8).str.split_exact(":", 2).struct.unnest()
+        seconds = (
+            parts["field_0"].cast(polars.Int64) * 3600
+            + parts["field_1"].cast(polars.Int64) * 60
+            + parts["field_2"].cast(polars.Int64)
+        )
+        microseconds = seconds * 1_000_000
+
+    # interval is int64 microseconds, int32 days, int32 months
+    values = numpy.zeros(len(column), dtype=[("time", ">i8"), ("days", ">i4"), ("months", ">i4")])
+    values["time"] = microseconds.fill_null(0).to_numpy()
+    return values.view(numpy.uint8).reshape(-1, 16)
+
+
+def encode_column(column: polars.Series, column_type: str) -> pyarrow.Array:
+    """
+    encode polars Series as arrow binary array of binary COPY fields, one per row
+
+    :param column: values to encode
+    :param column_type: postgres type of destination column, as returned by format_type
+    """
+    null_mask = column.is_null().to_numpy()
+
+    if column_type in FIXED_WIDTH_TYPES:
+        cast_type, numpy_type = FIXED_WIDTH_TYPES[column_type]
+        values = column.cast(cast_type).fill_null(0).to_numpy().astype(numpy_type)
+        return _fixed_width_fields(values.view(numpy.uint8).reshape(len(column), values.itemsize), null_mask)
+
+    if column_type == "date":
+        days = column.cast(polars.Date).to_physical().fill_null(0).to_numpy() - PG_EPOCH_DAYS
+        return _fixed_width_fields(days.astype(">i4").view(numpy.uint8).reshape(-1, 4), null_mask)
+
+    if column_type in ("timestamp without time zone", "timestamp with time zone"):
+        if isinstance(column.dtype, polars.Datetime) and column.dtype.time_zone is not None:
+            column = column.dt.convert_time_zone("UTC").dt.replace_time_zone(None)
+        micros = column.cast(polars.Datetime("us")).to_physical().fill_null(0).to_numpy() - PG_EPOCH_MICROSECONDS
+        return _fixed_width_fields(micros.astype(">i8").view(numpy.uint8).reshape(-1, 8), null_mask)
+
+    if column_type == "interval":
+        return _fixed_width_fields(_interval_values(column), null_mask)
+
+    if column_type in TEXT_TYPES:
+        return _bytes_fields(column.cast(polars.Utf8).cast(polars.Binary).to_arrow().cast(pyarrow.binary()))
+
+    if column_type in BYTES_TYPES:
+        return _bytes_fields(column.cast(polars.Binary).to_arrow().cast(pyarrow.binary()))
+
+    raise NotImplementedError(f"binary COPY encoding not supported for {column_type} ({column.name})")
+
+
+def encode_binary_rows(df: polars.DataFrame, column_types: Dict[str, str]) -> memoryview:
+    """
+    encode DataFrame rows as binary COPY tuples, without file header or trailer
+
+    :param df: rows to encode, all columns are encoded in DataFrame order
+    :param column_types: column name -> postgres type of destination column
+    """
+    if df.height == 0:
+        return memoryview(b"")
+
+    field_count = numpy.full((df.height, 1), df.width, dtype=">i2").view(numpy.uint8)
+    fields = [_binary_array(field_count)]
+    fields += [encode_column(df[column], column_types[column]) for column in df.columns]
+
+    rows = pc.binary_join_element_wise(*fields, b"")
+
+    offsets = numpy.frombuffer(rows.buffers()[1], dtype=numpy.int32)[rows.offset : rows.offset + len(rows) + 1]
+    return memoryview(rows.buffers()[2])[offsets[0] : offsets[-1]]
+
+
+class BinaryCopyStream:
+    """
+    file-like object producing a binary COPY stream from polars DataFrames
+
+    DataFrames are encoded lazily, batch_rows rows at a time, as the stream is read
+    """
+
+    def __init__(self, frames: Iterable[polars.DataFrame], column_types: Dict[str, str], batch_rows: int = 100_000):
+        self.chunks = self._encode_chunks(frames, column_types, batch_rows)
+        self.buffer = memoryview(b"")
+        self.position = 0
+
+    @staticmethod
+    def _encode_chunks(
+        frames: Iterable[polars.DataFrame], column_types: Dict[str, str], batch_rows: int
+    ) -> Generator[memoryview, None, None]:
+        """yield encoded header, tuples and trailer"""
+        yield memoryview(BINARY_COPY_HEADER)
+        for df in frames:
+            for offset in range(0, df.height, batch_rows):
+                yield encode_binary_rows(df.slice(offset, batch_rows), column_types)
+        yield memoryview(BINARY_COPY_TRAILER)
+
+    def read(self, size: int = -1) -> bytes:
+        """read up to size bytes from stream, all remaining bytes if size < 0"""
+        parts: List[bytes] = []
+        remaining = size
+        while remaining != 0:
+            if self.position >= len(self.buffer):
+                next_chunk = next(self.chunks, None)
+                if next_chunk is None:
+                    break
+                self.buffer = next_chunk
+                self.position = 0
+                continue
+
+            end = len(self.buffer) if remaining < 0 else min(len(self.buffer), self.position + remaining)
+            parts.append(self.buffer[self.position : end].tobytes())
+            if remaining > 0:
+                remaining -= end - self.position
+            self.position = end
+
+        return b"".join(parts)
+
+    def close(self) -> None:
+        """stop encoding, release any buffered data"""
+        self.chunks.close()
+        self.buffer = memoryview(b"")
+        self.position = 0
+
+
+def copy_dataframes_to_db(
+    db_manager: DatabaseManager,
+    table: str,
+    frames: Iterable[polars.DataFrame],
+    columns: List[str],
+    batch_rows: int = 100_000,
+) -> Tuple[int, int]:
+    """
+    stream polars DataFrames into table with binary COPY
+
+    DataFrame values are cast to the types of the destination table columns
+
+    :param db_manager: DatabaseManager used for COPY
+    :param table: destination table
+    :param frames: DataFrames to load, all with the same columns
+    :param columns: columns of DataFrames to load, in order
+    :param batch_rows: number of rows encoded at a time
+
+    :return: (rows loaded, bytes streamed)
+    """
+    column_types = db_manager.column_types(table)
+    stream = BinaryCopyStream((df.select(columns) for df in frames), column_types, batch_rows)
+
+    return db_manager.copy_from_stream(table, columns, stream, "FORMAT binary")
@@ -0,0 +1,291 @@
+import datetime
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import sqlalchemy as sa
+
+from research_etl.utils.util_rds import DatabaseManager
+from research_etl.utils.util_logging import ProcessLogger
+
+
+@dataclass
+class PartitionedTable:
+    """table partitioned by month on a date column, managed by PartitionManager"""
+
+    schema: str
+    table: str
+    # date column table is partitioned on
+    date_column: str
+    # columns of each BRIN index created on every new partition
+    brin_indexes: List[List[str]] = field(default_factory=list)
+
+    @property
+    def full_name(self) -> str:
+        """schema qualified table name"""
+        return f"{self.schema}.{self.table}"
+
+
+def month_start(date: datetime.date) -> datetime.date:
+    """
+    first day of month of date
+    """
+    return date.replace(day=1)
+
+
+def next_month(date: datetime.date) -> datetime.date:
+    """
+    first day of month after month of date
+    """
+    if date.month == 12:
+        return datetime.date(date.year + 1, 1, 1)
+    return datetime.date(date.year, date.month + 1, 1)
+
+
+def partition_months(start_date: datetime.date, end_date: datetime.date) -> List[datetime.date]:
+    """
+    first day of every month from start_date to end_date, one per monthly partition
+    """
+    partition_date = month_start(start_date)
+
+    partition_dates = []
+    while partition_date <= end_date:
+        partition_dates.append(partition_date)
+        partition_date = next_month(partition_date)
+
+    return partition_dates
+
+
+def partition_table_name(date: datetime.date, table: str) -> str:
+    """
+    name of monthly partition of table containing date
+    """
+    return f"{table}_y{date.strftime('%Y')}m{date.strftime('%m')}"
+
+
+class PartitionManager:
+    """
+    create monthly partitions of partitioned tables in batches
+
+    partitions of managed tables are listed once, on first use, and cached
+    for the life of the manager, so a manager should be created for each job
+    run. missing partitions are created with their BRIN indexes in one
+    transaction. safe to share between the workers of a job, as long as
+    only one worker swaps a partition at a time.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, tables: List[PartitionedTable]) -> None:
+        """
+        :param db_manager: database of partitioned tables
+        :param tables: partitioned tables managed
+        """
+        self.db_manager = db_manager
+        self.tables = {table.full_name: table for table in tables}
+
+        self.partitions: Optional[Set[str]] = None
+        self.lock = threading.Lock()
+
+    def _existing_partitions(self) -> Set[str]:
+        """schema qualified names of tables in schemas of managed tables, listed on first call"""
+        if self.partitions is None:
+            schemas = ", ".join(sorted({f"'{table.schema}'" for table in self.tables.values()}))
+            table_query = (
+                "SELECT schemaname || '.' || tablename AS partition "
+                "FROM pg_tables "
+                f"WHERE schemaname IN ({schemas})"
+            )
+            self.partitions = {row["partition"] for row in self.db_manager.select_as_list(sa.text(table_query))}
+
+        return self.partitions
+
+    def ensure_partitions(self, months: Dict[str, Iterable[datetime.date]]) -> List[str]:
+        """
+        create every missing monthly partition in one transaction
+
+        :param months: schema qualified table name -> dates in months that need a partition
+
+        :return: names of partitions created
+        """
+        with self.lock:
+            existing = self._existing_partitions()
+
+            missing = []
+            for table_name, dates in months.items():
+                table = self.tables[table_name]
+                for month in sorted({month_start(date) for date in dates}):
+                    if f"{table.schema}.{partition_table_name(month, table.table)}" not in existing:
+                        missing.append((table, month))
+
+            if not missing:
+                return []
+
+            partition_log = ProcessLogger("create_partitions", partition_count=len(missing))
+            partition_log.log_start()
+
+            statements = []
+            created = []
+            for table, month in missing:
+                partition = f"{table.schema}.{partition_table_name(month, table.table)}"
+                statements.append(
+                    f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table.full_name} "
+                    f"FOR VALUES FROM ('{month}') TO ('{next_month(month)}')"
+                )
+                statements += [
+                    f"CREATE INDEX IF NOT EXISTS {partition.split('.')[-1]}_{'_'.join(columns)}_brin "
+                    f"ON {partition} USING brin ({', '.join(columns)})"
+                    for columns in table.brin_indexes
+                ]
+                created.append(partition)
+
+            try:
+                self.db_manager.execute_transaction([sa.text(statement) for statement in statements])
+            except Exception as exception:
+                partition_log.log_failure(exception)
+                raise exception
+            existing.update(created)
+
+            partition_log.add_metadata(partitions=" | ".join(created))
+            partition_log.log_complete()
+
+            return created
+
+    def months_ahead(self, today: datetime.date, months_ahead: int = 1) -> Dict[str, List[datetime.date]]:
+        """
+        months of partitions of every managed table for the month of today and the next months_ahead months,
+        to pass to ensure_partitions
+
+        :return: schema qualified table name -> first day of each month
+        """
+        months = [month_start(today)]
+        for _ in range(months_ahead):
+            months.append(next_month(months[-1]))
+
+        return {table_name: list(months) for table_name in self.tables}
+
+    def _prepare_swap_table(self, table: PartitionedTable, month: datetime.date) -> None:
+        """
+        add partition bounds CHECK constraint, indexes of partitioned table and BRIN index template to filled
+        swap table of month, and analyze it
+        """
+        partition_name = partition_table_name(month, table.table)
+        swap_table = f"{table.schema}.{partition_name}_swap"
+
+        statements = [
+            f"ALTER TABLE {swap_table} ADD CONSTRAINT {partition_name}_swap_bounds "
+            f"CHECK ({table.date_column} IS NOT NULL "
+            f"AND {table.date_column} >= '{month}' AND {table.date_column} < '{next_month(month)}')"
+        ]
+
+        index_query = (
+            f"SELECT indexdef FROM pg_indexes WHERE schemaname = '{table.schema}' AND tablename = '{table.table}'"
+        )
+        for row in self.db_manager.select_as_list(sa.text(index_query)):
+            # CREATE INDEX ridership_servicedate_idx ON ONLY afc.ridership USING btree (servicedate)
+            unique = "UNIQUE " if row["indexdef"].startswith("CREATE UNIQUE") else ""
+            statements.append(f"CREATE {unique}INDEX ON {swap_table} USING {row['indexdef'].split(' USING ', 1)[1]}")
+        statements += [
+            f"CREATE INDEX {partition_name}_swap_{'_'.join(columns)}_brin "
+            f"ON {swap_table} USING brin ({', '.join(columns)})"
+            for columns in table.brin_indexes
+        ]
+        statements.append(f"ANALYZE {swap_table}")
+
+        for statement in statements:
+            self.db_manager.execute(sa.text(statement))
+
+    def _swap_statements(self, table: PartitionedTable, month: datetime.date, partition_exists: bool) -> List[str]:
+        """
+        statements detaching and dropping partition of month, if it exists, and attaching swap table in its place
+        """
+        partition_name = partition_table_name(month, table.table)
+        partition = f"{table.schema}.{partition_name}"
+
+        index_query = (
+            "SELECT indexname FROM pg_indexes "
+            f"WHERE schemaname = '{table.schema}' AND tablename = '{partition_name}_swap'"
+        )
+        swap_indexes = [row["indexname"] for row in self.db_manager.select_as_list(sa.text(index_query))]
+
+        statements = []
+        if partition_exists:
+            statements += [
+                f"ALTER TABLE {table.full_name} DETACH PARTITION {partition}",
+                f"DROP TABLE {partition}",
+            ]
+        statements.append(f"ALTER TABLE {partition}_swap RENAME TO {partition_name}")
+        statements += [
+            f"ALTER INDEX {table.schema}.{index} RENAME TO {index.replace(f'{partition_name}_swap', partition_name, 1)}"
+            for index in swap_indexes
+        ]
+        statements += [
+            f"ALTER TABLE {table.full_name} ATTACH PARTITION {partition} "
+            f"FOR VALUES FROM ('{month}') TO ('{next_month(month)}')",
+            f"ALTER TABLE {partition} DROP CONSTRAINT {partition_name}_swap_bounds",
+        ]
+
+        return statements
+
+    def swap_partition(
+        self,
+        table_name: str,
+        month: datetime.date,
+        fill: Callable[[str], int],
+        replace_dates: Tuple[datetime.date, datetime.date],
+    ) -> int:
+        """
+        replace rows of monthly partition in a date range with rows loaded by fill, without DELETE
+
+        a standalone swap table is filled with the rows loaded by fill and
+        the rows of the existing partition outside of the date range,
+        indexed and analyzed. in one short transaction, the existing
+        partition is detached and dropped and the swap table is attached in
+        its place, so readers see the whole old month or the whole new month.
+        a CHECK constraint matching the partition bounds lets ATTACH skip
+        scanning the swap table.
+
+        :param table_name: schema qualified partitioned table name
+        :param month: date in month of partition
+        :param fill: loads rows of month in date range into the table it is passed, returns number of rows
+        :param replace_dates: first and last date of rows replaced
+
+        :return: number of rows loaded by fill
+        """
+        table = self.tables[table_name]
+        month = month_start(month)
+        partition = f"{table.schema}.{partition_table_name(month, table.table)}"
+        date_range = (
+            f"{table.date_column} BETWEEN '{max(replace_dates[0], month)}' "
+            f"AND '{min(replace_dates[1], next_month(month) - datetime.timedelta(days=1))}'"
+        )
+
+        swap_log = ProcessLogger("swap_partition", partition=partition)
+        swap_log.log_start()
+
+        try:
+            with self.lock:
+                partition_exists = partition in self._existing_partitions()
+
+            self.db_manager.execute(sa.text(f"DROP TABLE IF EXISTS {partition}_swap"))
+            self.db_manager.execute(sa.text(f"CREATE TABLE {partition}_swap (LIKE {table_name} INCLUDING DEFAULTS)"))
+            row_count = fill(f"{partition}_swap")
+            if partition_exists:
+                self.db_manager.execute(
+                    sa.text(f"INSERT INTO {partition}_swap SELECT * FROM {partition} WHERE NOT ({date_range})")
+                )
+            self._prepare_swap_table(table, month)
+
+            swap_statements = self._swap_statements(table, month, partition_exists)
+            self.db_manager.execute_transaction([sa.text(statement) for statement in swap_statements])
+
+        except Exception as exception:
+            self.db_manager.execute(sa.text(f"DROP TABLE IF EXISTS {partition}_swap"))
+            swap_log.log_failure(exception)
+            raise exception
+
+        with self.lock:
+            self._existing_partitions().add(partition)
+
+        swap_log.add_metadata(row_count=row_count, replaced_existing=partition_exists)
+        swap_log.log_complete()
+
+        return row_count
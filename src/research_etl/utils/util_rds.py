@@ -4,15 +4,16 @@ import gzip
 import time
 import zipfile
 import platform
-import subprocess
 import urllib.parse as urlparse
-from typing import Any, Dict, List, Tuple, Union
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Protocol, Tuple, Union
 
 import boto3
 import sqlalchemy as sa
 from sqlalchemy.orm import sessionmaker
 
 from research_etl.utils.util_logging import ProcessLogger
+from research_etl.utils.util_aws import S3RangedReader
 
 
 def running_in_docker() -> bool:
@@ -159,8 +160,10 @@ def get_local_engine(
             future=True,
             pool_pre_ping=True,
             pool_use_lifo=True,
-            pool_size=3,
-            max_overflow=2,
+            # pipeline jobs and their worker pools run concurrently, each
+            # running worker holds one connection
+            pool_size=5,
+            max_overflow=10,
             connect_args={
                 "keepalives": 1,
                 "keepalives_idle": 60,
@@ -175,6 +178,35 @@ def get_local_engine(
         raise exception
 
 
+class ReadableFile(Protocol):  # pylint: disable=too-few-public-methods
+    """any file-like object with a read method, bytes or str"""
+
+    def read(self, size: int = ..., /) -> Any:
+        """read up to size bytes/characters"""
+
+
+class CountingReader:
+    """
+    file-like wrapper that counts bytes read from an underlying file object
+    """
+
+    def __init__(self, fileobj: Any) -> None:
+        self.fileobj = fileobj
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> Any:
+        """read from underlying file object and count bytes"""
+        data = self.fileobj.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def readline(self, size: int = -1) -> Any:
+        """readline from underlying file object and count bytes"""
+        data = self.fileobj.readline(size)
+        self.bytes_read += len(data)
+        return data
+
+
 # Setup the base class that all of the SQL objects will inherit from.
 #
 # Note that the typing hint is required to be set at Any for mypy to be cool
@@ -227,13 +259,38 @@ class DatabaseManager:
             result = cursor.execute(statement)
         return result  # type: ignore
 
-    def select_as_list(self, select_query: sa.sql.selectable.Select) -> Union[List[Any], List[Dict[str, Any]]]:
+    def execute_transaction(self, statements: List[sa.sql.elements.TextClause]) -> None:
+        """
+        execute db actions WITHOUT data in a single transaction, none are committed if any fails
+        """
+        with self.session.begin() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+    def select_as_list(
+        self,
+        select_query: Union[sa.sql.selectable.Select, sa.sql.elements.TextClause],
+    ) -> Union[List[Any], List[Dict[str, Any]]]:
         """
         select data from db table and return list
         """
         with self.session.begin() as cursor:
             return [row._asdict() for row in cursor.execute(select_query)]
 
+    def column_types(self, table: str) -> Dict[str, str]:
+        """
+        get column name -> postgres type name (without modifiers) for table
+        """
+        type_query = (
+            "SELECT attname, format_type(atttypid, NULL) AS column_type "
+            "FROM pg_attribute "
+            f"WHERE attrelid = '{table}'::regclass "
+            "AND attnum > 0 "
+            "AND NOT attisdropped "
+            "ORDER BY attnum"
+        )
+        return {row["attname"]: row["column_type"] for row in self.select_as_list(sa.text(type_query))}
+
     def write_to_csv(self, query: sa.sql.selectable.Select, dest_path: str, batch_size: int = 1024 * 1024) -> None:
         """
         stream db select results to csv file in batches
@@ -254,6 +311,77 @@ class DatabaseManager:
                         writer.writeheader()
                     writer.writerows(rows)
 
+    def copy_from_stream(
+        self,
+        table: str,
+        columns: List[str],
+        fileobj: ReadableFile,
+        copy_options: str = "FORMAT csv",
+    ) -> Tuple[int, int]:
+        """
+        stream file-like object into table with COPY ... FROM STDIN
+
+        uses a pooled connection from the engine, so no new connection (or IAM
+        auth token) is created for each COPY. the COPY is committed on success
+        and rolled back on failure.
+
+        :param table:       destination table for COPY
+        :param columns:     destination columns, in file order
+        :param fileobj:     file-like object with read(size) method, bytes or str
+        :param copy_options: COPY WITH options, e.g. "FORMAT csv, HEADER true" or "FORMAT binary"
+
+        :return: (rows loaded, bytes read from fileobj)
+        """
+        copy_query = f"COPY {table} ({','.join(columns)}) FROM STDIN WITH ({copy_options})"
+
+        reader = CountingReader(fileobj)
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.copy_expert(copy_query, reader, size=1024 * 1024)
+            row_count = cursor.rowcount
+            cursor.close()
+            connection.commit()
+        except Exception as exception:
+            connection.rollback()
+            raise exception
+        finally:
+            connection.close()
+
+        return (row_count, reader.bytes_read)
+
+    def copy_to_stream(self, query: str, fileobj: Any, copy_options: str = "FORMAT csv, HEADER true") -> int:
+        """
+        stream results of query into file-like object with COPY ... TO STDOUT
+
+        uses a pooled connection from the engine, rows are written to fileobj
+        as they are sent by the server.
+
+        :param query:       table name or SELECT query to COPY from
+        :param fileobj:     file-like object with write(data) method, opened in binary mode
+        :param copy_options: COPY WITH options, e.g. "FORMAT csv, HEADER true" or "FORMAT binary"
+
+        :return: rows written to fileobj
+        """
+        if query.strip().upper().startswith("SELECT"):
+            query = f"({query})"
+        copy_query = f"COPY {query} TO STDOUT WITH ({copy_options})"
+
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.copy_expert(copy_query, fileobj, size=1024 * 1024)
+            row_count = cursor.rowcount
+            cursor.close()
+            connection.commit()
+        except Exception as exception:
+            connection.rollback()
+            raise exception
+        finally:
+            connection.close()
+
+        return row_count
+
     def vaccuum_analyze(self, table: str) -> None:
         """RUN VACUUM (ANALYZE) on table"""
         with self.session.begin() as cursor:
@@ -287,19 +415,20 @@ class DatabaseManager:
         self.vaccuum_analyze(table_to_truncate)
 
 
-def copy_gzip_csv_to_db(local_path: str, destination_table: str) -> None:
+def copy_gzip_csv_to_db(local_path: str, destination_table: str, db_manager: DatabaseManager) -> None:
     """
-    load local csv.gzip file into DB using psql COPY command
+    load local csv.gzip file into DB using in-process COPY
 
     table headers are required to be in first row of file
 
-    will throw if psql command does not exit with code 0
+    will throw if COPY fails after retries
 
     :param local_path:          path to local file that will be loaded
     :param destination_table:   table name for COPY destination
+    :param db_manager:          DatabaseManager used for COPY
     """
     copy_log = ProcessLogger(
-        "gzip_psql_copy",
+        "gzip_copy",
         local_file=local_path,
         destination_table=destination_table,
     )
@@ -308,96 +437,107 @@ def copy_gzip_csv_to_db(local_path: str, destination_table: str) -> None:
     with gzip.open(local_path, "rt") as gzip_file:
         local_columns = gzip_file.readline().strip().lower().split(",")
 
-    copy_command = (
-        f"\\COPY {destination_table} "
-        f"({','.join(local_columns)}) "
-        "FROM PROGRAM "
-        f"'gzip -dc {local_path}' "
-        "WITH CSV HEADER"
-    )
-
-    psql = [
-        "psql",
-        f"postgresql://{create_db_connection_string()}",
-        "-c",
-        f"{copy_command}",
-    ]
+    def copy_gzip() -> Tuple[int, int]:
+        with gzip.open(local_path, "rb") as gzip_file:
+            return db_manager.copy_from_stream(destination_table, local_columns, gzip_file, "FORMAT csv, HEADER true")
 
-    run_psql_subprocess(psql, copy_log)
+    run_copy_with_retry(copy_gzip, copy_log)
 
 
-def afc_copy(obj_path: str, destination_table: str, headers: List[str], null_as: bool = True) -> None:
+@contextmanager
+def open_copy_source(obj_path: str) -> Iterator[Any]:
     """
-    load local csv or csv.gz file into DB using psql COPY command
+    open local or S3 object for streaming, decompressing .gz files in-process
 
-    correct headers should be provided
+    S3 objects are read with concurrent ranged GETs of the shared S3 client,
+    downloads run ahead of COPY by a bounded number of parts
 
-    will throw if psql command does not exit with code 0
+    :param obj_path: local file path or s3://bucket/object path
 
-    :param local_path: path to local file that will be loaded
-    :param destination_table: table name for COPY destination
+    :return: readable binary file-like object
     """
-    copy_log = ProcessLogger(
-        "psql_afc_copy",
-        obj_path=obj_path,
-        destination_table=destination_table,
-        headers=" | ".join(headers),
-    )
-    copy_log.log_start()
+    if obj_path.lower().startswith("s3://"):
+        stream = S3RangedReader(obj_path)
+    else:
+        stream = open(obj_path, "rb")  # pylint: disable=consider-using-with
 
-    copy_from = f"FROM {obj_path} "
-    if obj_path.lower().startswith("s3://") and obj_path.lower().endswith(".gz"):
-        copy_from = f"FROM PROGRAM 'aws s3 cp {obj_path} - | gzip -dc' "
-    elif obj_path.lower().endswith(".gz"):
-        copy_from = f"FROM PROGRAM 'gzip -dc {obj_path}' "
+    with stream:
+        if obj_path.lower().endswith(".gz"):
+            with gzip.GzipFile(fileobj=stream, mode="rb") as gzip_stream:
+                yield gzip_stream
+        else:
+            yield stream
 
-    null_as_str = "WITH NULL '\\N'"
-    if not null_as:
-        null_as_str = ""
 
-    copy_command = f"\\COPY {destination_table} ({','.join(headers)}) {copy_from} {null_as_str} CSV QUOTE AS '\"'"
+def afc_copy_options(null_as: bool = True) -> str:
+    """
+    COPY WITH options of afc csv files
 
-    psql = [
-        "psql",
-        f"postgresql://{create_db_connection_string()}",
-        "-c",
-        f"{copy_command}",
-    ]
+    :param null_as: if True, treat \\N as NULL, otherwise COPY default
+    """
+    copy_options = "FORMAT csv, QUOTE '\"'"
+    if null_as:
+        copy_options = f"{copy_options}, NULL '\\N'"
 
-    run_psql_subprocess(psql, copy_log)
+    return copy_options
 
 
-def zip_line_count(local_path: str) -> str:
+def afc_copy(
+    obj_path: str,
+    destination_table: str,
+    headers: List[str],
+    db_manager: DatabaseManager,
+    null_as: bool = True,
+) -> int:
     """
-    get line count of local zip file
+    load local or S3 csv or csv.gz file into DB using in-process COPY
 
-    :param local_path: path to local zip file
+    correct headers should be provided
+
+    will throw if COPY fails after retries
 
-    :return number of lines in un-compressed zip file
+    :param obj_path: local path or s3 path of file that will be loaded
+    :param destination_table: table name for COPY destination
+    :param headers: columns of file, in file order
+    :param db_manager: DatabaseManager used for COPY
+    :param null_as: if True, treat \\N as NULL, otherwise COPY default
+
+    :return: number of rows loaded
     """
-    output = subprocess.check_output(f"unzip -p {local_path} | wc -l", shell=True)
+    copy_log = ProcessLogger(
+        "afc_copy",
+        obj_path=obj_path,
+        destination_table=destination_table,
+        headers=" | ".join(headers),
+    )
+    copy_log.log_start()
+
+    copy_options = afc_copy_options(null_as)
 
-    return output.decode("utf8").strip()
+    def copy_obj() -> Tuple[int, int]:
+        with open_copy_source(obj_path) as copy_source:
+            return db_manager.copy_from_stream(destination_table, headers, copy_source, copy_options)
 
+    return run_copy_with_retry(copy_obj, copy_log)
 
-def copy_zip_csv_to_db(local_path: str, destination_table: str) -> None:
+
+def copy_zip_csv_to_db(local_path: str, destination_table: str, db_manager: DatabaseManager) -> None:
     """
-    load local csv.zip file into DB using psql COPY command
+    load local csv.zip file into DB using in-process COPY
 
     table headers are required to be in first row of file
-    file to load inside of zip archive should be same name as local path
-    file without .zip
+    first file inside of zip archive is loaded
 
-    will throw if psql command does not exit with code 0
+    will throw if COPY fails after retries
 
     :param local_path: path to local file that will be loaded
     :param destination_table: table name for COPY destination
+    :param db_manager: DatabaseManager used for COPY
     """
     copy_log = ProcessLogger(
-        "zip_psql_copy",
+        "zip_copy",
         local_file=local_path,
         destination_table=destination_table,
-        row_count=zip_line_count(local_path),
     )
     copy_log.log_start()
 
@@ -408,27 +548,21 @@ def copy_zip_csv_to_db(local_path: str, destination_table: str) -> None:
 
     copy_log.add_metadata(csv_file=csv_file, headers="|".join(headers))
 
-    copy_command = (
-        f"\\COPY {destination_table} "
-        f"({','.join(headers)}) "
-        "FROM PROGRAM "
-        f"'unzip -p {local_path}' "
-        "WITH CSV HEADER"
-    )
-
-    psql = [
-        "psql",
-        f"postgresql://{create_db_connection_string()}",
-        "-c",
-        f"{copy_command}",
-    ]
+    def copy_zip() -> Tuple[int, int]:
+        with zipfile.ZipFile(local_path, "r") as zip_files:
+            with zip_files.open(csv_file, "r") as reader:
+                return db_manager.copy_from_stream(destination_table, headers, reader, "FORMAT csv, HEADER true")
 
-    run_psql_subprocess(psql, copy_log)
+    run_copy_with_retry(copy_zip, copy_log)
 
 
-def run_psql_subprocess(psql_cmd: List[str], logger: ProcessLogger) -> None:
+def run_copy_with_retry(copy_func: Callable[[], Tuple[int, int]], logger: ProcessLogger) -> int:
     """
-    run psql command with retry logic
+    run COPY function with retry logic, logging rows and bytes loaded
+
+    copy_func should re-open its source stream on every call
+
+    :return: number of rows loaded
     """
     max_retries = 3
     logger.add_metadata(max_retries=max_retries)
@@ -436,7 +570,7 @@ def run_psql_subprocess(psql_cmd: List[str], logger: ProcessLogger) -> None:
     for retry_attempts in range(max_retries + 1):
         try:
             logger.add_metadata(retry_attempts=retry_attempts)
-            process_result = subprocess.run(psql_cmd, check=True)
+            row_count, byte_count = copy_func()
             break
         except Exception as exception:
             if retry_attempts == max_retries:
@@ -444,5 +578,7 @@ def run_psql_subprocess(psql_cmd: List[str], logger: ProcessLogger) -> None:
                 raise exception
             time.sleep(5)
 
-    logger.add_metadata(exit_code=process_result.returncode)
+    logger.add_metadata(row_count=row_count, byte_count=byte_count)
     logger.log_complete()
+
+    return row_count
@@ -0,0 +1,192 @@
+import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from research_etl.utils.util_logging import ProcessLogger
+
+
+@dataclass
+class ScheduledJob:
+    """describe a job to be run by JobScheduler"""
+
+    name: str
+    func: Callable[[], Any]
+    # names of jobs that must complete before this job can start
+    depends_on: List[str] = field(default_factory=list)
+    # resource name -> units of that resource held while job is running
+    resources: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class JobResult:
+    """outcome of a job run by JobScheduler"""
+
+    name: str
+    status: str
+    duration: float = 0.0
+    exception: Optional[BaseException] = None
+    # return value of job function, if job completed
+    result: Any = None
+
+
+def validate_job_graph(jobs: List[ScheduledJob], resource_limits: Dict[str, int]) -> None:
+    """
+    check that job names are unique, dependencies exist, resource requests can
+    be satisfied and that the dependency graph has no cycles
+    """
+    job_map = {job.name: job for job in jobs}
+    if len(job_map) != len(jobs):
+        raise ValueError("job names must be unique")
+
+    for job in jobs:
+        for dependency in job.depends_on:
+            if dependency not in job_map:
+                raise ValueError(f"{job.name} depends on unknown job {dependency}")
+        for resource, units in job.resources.items():
+            if units > resource_limits.get(resource, units):
+                raise ValueError(f"{job.name} requests {units} {resource}, limit is {resource_limits[resource]}")
+
+    # Kahn's algorithm, any job left unvisited is part of a cycle
+    remaining = {job.name: len(job.depends_on) for job in jobs}
+    ready = [name for name, count in remaining.items() if count == 0]
+    visited = 0
+    while ready:
+        name = ready.pop()
+        visited += 1
+        for job in jobs:
+            if name in job.depends_on:
+                remaining[job.name] -= 1
+                if remaining[job.name] == 0:
+                    ready.append(job.name)
+
+    if visited != len(jobs):
+        raise ValueError("job dependency graph contains a cycle")
+
+
+class JobScheduler:
+    """
+    run jobs concurrently in a thread pool, respecting dependencies and resource limits
+
+    a job is started once all of its dependencies have completed and enough
+    units of each of its resources are free. ready jobs are started in the
+    order they appear in the jobs list, so long running jobs should be listed
+    first. if a job fails, all jobs that depend on it are skipped.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        resource_limits: Optional[Dict[str, int]] = None,
+        scheduler_name: str = "job_scheduler",
+    ) -> None:
+        """
+        :param max_workers: max number of jobs running at the same time
+        :param resource_limits: resource name -> units available to all running jobs
+        :param scheduler_name: process name used for scheduler logging
+        """
+        self.max_workers = max_workers
+        self.resource_limits = resource_limits if resource_limits is not None else {}
+        self.scheduler_name = scheduler_name
+
+        self.results: Dict[str, JobResult] = {}
+        self.durations: Dict[str, float] = {}
+        self.resources_free: Dict[str, int] = {}
+
+    def _timed_run(self, job: ScheduledJob) -> Any:
+        """run job function, logging and recording wall time"""
+        job_log = ProcessLogger(f"{self.scheduler_name}_job", job_name=job.name)
+        job_log.log_start()
+        start = time.monotonic()
+        try:
+            result = job.func()
+        except Exception as exception:
+            job_log.log_failure(exception)
+            raise exception
+        finally:
+            self.durations[job.name] = time.monotonic() - start
+        job_log.log_complete()
+
+        return result
+
+    def _dependency_failed(self, job: ScheduledJob) -> bool:
+        """True if any dependency of job finished without completing"""
+        return any(dep in self.results and self.results[dep].status != "complete" for dep in job.depends_on)
+
+    def _can_start(self, job: ScheduledJob) -> bool:
+        """True if all dependencies of job are complete and its resources are free"""
+        if any(dep not in self.results for dep in job.depends_on):
+            return False
+        return all(self.resources_free.get(res, units) >= units for res, units in job.resources.items())
+
+    def _claim_resources(self, job: ScheduledJob, sign: int) -> None:
+        """take (sign=-1) or release (sign=1) resources held by job"""
+        for res, units in job.resources.items():
+            if res in self.resources_free:
+                self.resources_free[res] += sign * units
+
+    def run(self, jobs: List[ScheduledJob]) -> Dict[str, JobResult]:
+        """
+        run all jobs to completion
+
+        :param jobs: jobs to run
+
+        :return: job name -> JobResult, with wall time and return value of each job
+        """
+        validate_job_graph(jobs, self.resource_limits)
+
+        process_log = ProcessLogger(self.scheduler_name, job_count=len(jobs), max_workers=self.max_workers)
+        process_log.log_start()
+
+        self.results = {}
+        self.durations = {}
+        self.resources_free = dict(self.resource_limits)
+
+        pending = list(jobs)
+        running: Dict[Future, ScheduledJob] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for job in list(pending):
+                    if self._dependency_failed(job):
+                        self.results[job.name] = JobResult(name=job.name, status="skipped")
+                        pending.remove(job)
+                    elif len(running) < self.max_workers and self._can_start(job):
+                        self._claim_resources(job, -1)
+                        running[pool.submit(self._timed_run, job)] = job
+                        pending.remove(job)
+
+                if not running:
+                    # remaining jobs depend on skipped jobs, they are skipped next loop
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    self._claim_resources(job, 1)
+                    exception = future.exception()
+                    self.results[job.name] = JobResult(
+                        name=job.name,
+                        status="complete" if exception is None else "failed",
+                        duration=self.durations.get(job.name, 0.0),
+                        exception=exception,
+                        result=future.result() if exception is None else None,
+                    )
+
+        process_log.add_metadata(
+            **{f"{name}_duration": f"{result.duration:.2f}" for name, result in self.results.items()},
+            failed_count=sum(result.status == "failed" for result in self.results.values()),
+            skipped_count=sum(result.status == "skipped" for result in self.results.values()),
+        )
+        process_log.log_complete()
+
+        return self.results
+
+    def raise_for_failures(self) -> None:
+        """re-raise the exception of the first failed job from the last run, if any"""
+        for result in self.results.values():
+            if result.exception is not None:
+                raise result.exception
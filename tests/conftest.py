@@ -0,0 +1,28 @@
+import os
+from typing import Generator
+
+import pytest
+import sqlalchemy as sa
+
+from research_etl.utils.util_rds import DatabaseManager
+
+
+@pytest.fixture(name="db_manager", scope="session")
+def fixture_db_manager() -> Generator[DatabaseManager, None, None]:
+    """
+    DatabaseManager of local database created from tests/files/init_schema.sql
+
+    tests using the database are skipped if DB_HOST is not set or the database can not be reached
+    """
+    if not os.getenv("DB_HOST"):
+        pytest.skip("DB_HOST not set, no test database")
+
+    db_manager = DatabaseManager()
+    try:
+        db_manager.select_as_list(sa.text("SELECT 1"))
+    except Exception as exception:
+        pytest.skip(f"test database not available: {exception}")
+
+    yield db_manager
+
+    db_manager.engine.dispose()
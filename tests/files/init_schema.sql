@@ -30,6 +30,8 @@ CREATE EXTENSION IF NOT EXISTS postgis_raster WITH SCHEMA public;
 CREATE FUNCTION gtfs.drop_feed(startdate text, enddate text) RETURNS void
     LANGUAGE plpgsql
     AS $$
+DECLARE
+staging_table text;
 BEGIN 
 EXECUTE 'DROP TABLE IF EXISTS gtfs.agency_' || startdate || '_' || enddate;
 EXECUTE 'DROP TABLE IF EXISTS gtfs.calendar_' || startdate || '_' || enddate;
@@ -48,6 +50,7 @@ EXECUTE 'DROP TABLE IF EXISTS gtfs.multi_route_trips_' || startdate || '_' || en
 EXECUTE 'DROP TABLE IF EXISTS gtfs.pathways_' || startdate || '_' || enddate;
 EXECUTE 'DROP TABLE IF EXISTS gtfs.route_patterns_' || startdate || '_' || enddate;
 EXECUTE 'DROP TABLE IF EXISTS gtfs.routes_' || startdate || '_' || enddate;
+EXECUTE 'DROP TABLE IF EXISTS gtfs.service_dates_' || startdate || '_' || enddate;
 EXECUTE 'DROP TABLE IF EXISTS gtfs.shapes_' || startdate || '_' || enddate;
 EXECUTE 'DROP TABLE IF EXISTS gtfs.shapes_geog_' || startdate || '_' || enddate;
 EXECUTE 'DROP TABLE IF EXISTS gtfs.stop_in_pattern_' || startdate || '_' || enddate;
@@ -56,8 +59,50 @@ EXECUTE 'DROP TABLE IF EXISTS gtfs.stops_' || startdate || '_' || enddate;
 EXECUTE 'DROP TABLE IF EXISTS gtfs.stops_geog_' || startdate || '_' || enddate;
 EXECUTE 'DROP TABLE IF EXISTS gtfs.transfers_' || startdate || '_' || enddate;
 EXECUTE 'DROP TABLE IF EXISTS gtfs.trips_' || startdate || '_' || enddate;
+DELETE FROM gtfs.feed_table_hash
+WHERE valid_start_date = to_date(startdate, 'YYYYMMDD')
+AND valid_end_date = to_date(enddate, 'YYYYMMDD');
+DELETE FROM gtfs.feed_registry
+WHERE valid_start_date = to_date(startdate, 'YYYYMMDD')
+AND valid_end_date = to_date(enddate, 'YYYYMMDD');
+DELETE FROM gtfs.feed_registry_partition
+WHERE valid_start_date = to_date(startdate, 'YYYYMMDD')
+AND valid_end_date = to_date(enddate, 'YYYYMMDD');
+FOR staging_table IN
+    SELECT tablename FROM pg_tables
+    WHERE schemaname = 'gtfs'
+    AND right(tablename, 22) = '_' || startdate || '_' || enddate || '_stg'
+LOOP
+    EXECUTE 'DROP TABLE IF EXISTS gtfs.' || staging_table;
+END LOOP;
+DELETE FROM gtfs.feed_load_state
+WHERE valid_start_date = to_date(startdate, 'YYYYMMDD')
+AND valid_end_date = to_date(enddate, 'YYYYMMDD');
 END;$$;
 
+-- most recently created feed valid on lookup_date
+CREATE FUNCTION gtfs.feed_for_date(lookup_date date) RETURNS TABLE (feed_version text, valid_start_date date, valid_end_date date)
+    LANGUAGE sql STABLE
+    AS $$
+SELECT fr.feed_version, fr.valid_start_date, fr.valid_end_date
+FROM gtfs.feed_registry fr
+WHERE daterange(fr.valid_start_date, fr.valid_end_date, '[]') @> lookup_date
+ORDER BY fr.creation_timestamp DESC
+LIMIT 1
+$$;
+
+-- partition of lookup_table loaded for feed valid on lookup_date
+CREATE FUNCTION gtfs.partition_for_date(lookup_table text, lookup_date date) RETURNS text
+    LANGUAGE sql STABLE
+    AS $$
+SELECT frp.partition_name
+FROM gtfs.feed_for_date(lookup_date) f
+JOIN gtfs.feed_registry_partition frp
+    ON frp.valid_start_date = f.valid_start_date
+    AND frp.valid_end_date = f.valid_end_date
+WHERE frp.table_name = lookup_table
+$$;
+
 
 SET default_tablespace = '';
 
@@ -267,6 +312,15 @@ CREATE TABLE gtfs.routes (
     CONSTRAINT routes_valid_start_date_check CHECK ((valid_start_date = '1900-01-01'::date)) NO INHERIT
 );
 
+CREATE TABLE gtfs.service_dates (
+    service_date date NOT NULL,
+    service_id text NOT NULL,
+    valid_start_date date NOT NULL,
+    valid_end_date date NOT NULL,
+    CONSTRAINT service_dates_valid_end_date_check CHECK ((valid_end_date = '1900-01-01'::date)) NO INHERIT,
+    CONSTRAINT service_dates_valid_start_date_check CHECK ((valid_start_date = '1900-01-01'::date)) NO INHERIT
+);
+
 CREATE TABLE gtfs.shapes (
     shape_id text NOT NULL,
     shape_pt_lat double precision NOT NULL,
@@ -312,6 +366,8 @@ CREATE TABLE gtfs.stop_times (
     drop_off_type integer,
     timepoint text,
     checkpoint_id text,
+    arrival_seconds integer,
+    departure_seconds integer,
     valid_start_date date NOT NULL,
     valid_end_date date NOT NULL,
     CONSTRAINT stop_times_valid_end_date_check CHECK ((valid_end_date = '1900-01-01'::date)) NO INHERIT,
@@ -391,6 +447,48 @@ CREATE TABLE gtfs.trips (
     CONSTRAINT trips_valid_start_date_check CHECK ((valid_start_date = '1900-01-01'::date)) NO INHERIT
 );
 
+CREATE TABLE gtfs.feed_table_hash (
+    table_name text NOT NULL,
+    content_hash text NOT NULL,
+    valid_start_date date NOT NULL,
+    valid_end_date date NOT NULL,
+    created_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+CREATE TABLE gtfs.feed_load_state (
+    valid_start_date date NOT NULL,
+    valid_end_date date NOT NULL,
+    table_name text NOT NULL,
+    row_count bigint,
+    completed_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+CREATE TABLE gtfs.feed_export (
+    feed_version text,
+    valid_start_date date NOT NULL,
+    valid_end_date date NOT NULL,
+    export_path text NOT NULL,
+    partition_count integer NOT NULL,
+    reclaimed_bytes bigint NOT NULL,
+    exported_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+CREATE TABLE gtfs.feed_registry (
+    feed_version text,
+    valid_start_date date NOT NULL,
+    valid_end_date date NOT NULL,
+    creation_timestamp timestamp with time zone NOT NULL,
+    registered_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+CREATE TABLE gtfs.feed_registry_partition (
+    valid_start_date date NOT NULL,
+    valid_end_date date NOT NULL,
+    table_name text NOT NULL,
+    partition_name text NOT NULL,
+    row_count bigint
+);
+
 ALTER TABLE ONLY gtfs.agency
     ADD CONSTRAINT agency_pkey PRIMARY KEY (valid_start_date, valid_end_date, agency_id);
 
@@ -415,6 +513,25 @@ ALTER TABLE ONLY gtfs.feed_info
 ALTER TABLE ONLY gtfs.feed_info
     ADD CONSTRAINT feed_info_pkey PRIMARY KEY (valid_start_date, valid_end_date);
 
+ALTER TABLE ONLY gtfs.feed_table_hash
+    ADD CONSTRAINT feed_table_hash_pkey PRIMARY KEY (valid_start_date, valid_end_date, table_name);
+
+CREATE INDEX ON gtfs.feed_table_hash (table_name, content_hash);
+
+ALTER TABLE ONLY gtfs.feed_load_state
+    ADD CONSTRAINT feed_load_state_pkey PRIMARY KEY (valid_start_date, valid_end_date, table_name);
+
+ALTER TABLE ONLY gtfs.feed_export
+    ADD CONSTRAINT feed_export_pkey PRIMARY KEY (valid_start_date, valid_end_date);
+
+ALTER TABLE ONLY gtfs.feed_registry
+    ADD CONSTRAINT feed_registry_pkey PRIMARY KEY (valid_start_date, valid_end_date);
+
+CREATE INDEX ON gtfs.feed_registry USING gist (daterange(valid_start_date, valid_end_date, '[]'));
+
+ALTER TABLE ONLY gtfs.feed_registry_partition
+    ADD CONSTRAINT feed_registry_partition_pkey PRIMARY KEY (valid_start_date, valid_end_date, table_name);
+
 ALTER TABLE ONLY gtfs.levels
     ADD CONSTRAINT levels_pkey PRIMARY KEY (valid_start_date, valid_end_date, level_id);
 
@@ -433,6 +550,9 @@ ALTER TABLE ONLY gtfs.route_patterns
 ALTER TABLE ONLY gtfs.routes
     ADD CONSTRAINT routes_pkey PRIMARY KEY (valid_start_date, valid_end_date, route_id);
 
+ALTER TABLE ONLY gtfs.service_dates
+    ADD CONSTRAINT service_dates_pkey PRIMARY KEY (valid_start_date, valid_end_date, service_date, service_id);
+
 ALTER TABLE ONLY gtfs.shapes_geog
     ADD CONSTRAINT shapes_geog_pkey PRIMARY KEY (valid_start_date, valid_end_date, shape_id);
 
@@ -894,6 +1014,52 @@ CREATE TABLE afc.tvmtable (
     parametergroupid integer
 );
 
+CREATE TABLE afc.load_ledger (
+    s3_object text NOT NULL,
+    etag text NOT NULL,
+    object_size bigint NOT NULL,
+    afc_type text NOT NULL,
+    first_service_date date,
+    last_service_date date,
+    status text NOT NULL,
+    row_count bigint NOT NULL,
+    load_seconds double precision NOT NULL,
+    loaded_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+CREATE INDEX ON afc.load_ledger (afc_type, first_service_date, last_service_date, loaded_at);
+
+CREATE TABLE afc.lookup_hash (
+    table_name text NOT NULL,
+    content_hash text NOT NULL,
+    row_count bigint NOT NULL,
+    loaded_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+ALTER TABLE ONLY afc.lookup_hash
+    ADD CONSTRAINT lookup_hash_pkey PRIMARY KEY (table_name);
+
+CREATE TABLE afc.faregate_halfhour (
+    servicedate date NOT NULL,
+    halfhour timestamp without time zone,
+    tarifflocationid integer,
+    eventcode integer,
+    event_count bigint NOT NULL
+);
+
+CREATE INDEX ON afc.faregate_halfhour (servicedate);
+
+CREATE TABLE afc.ridership_daily (
+    servicedate date NOT NULL,
+    tariffversion integer,
+    articleno integer,
+    ticketstocktype integer,
+    transaction_count bigint NOT NULL,
+    fareoptamount bigint
+);
+
+CREATE INDEX ON afc.ridership_daily (servicedate);
+
 
 -- ****************************************** --
 -- END INIT AFC SCHEMA --
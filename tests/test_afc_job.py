@@ -0,0 +1,92 @@
+import gzip
+import pathlib
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+from research_etl.etl_afc import afc_job
+from research_etl.etl_afc.afc_job import afc_load_jobs
+from research_etl.etl_afc.afc_job import file_partitions
+from research_etl.etl_afc.afc_job import load_afc_bulk
+from research_etl.utils.util_scheduler import JobScheduler
+
+S3_OBJECTS = [
+    f"s3://afc-bucket/afc_oracle_db/{object_name}"
+    for object_name in [
+        "20240102_faregate_1.csv.gz",
+        "20240103_faregate_1.csv.gz",
+        "20240104_faregate_1.csv.gz",
+        "20240103_ridership_1.csv.gz",
+        "20240201_faregate_1.csv.gz",
+        "20240202_ridership_1.csv.gz",
+        # lookups sort after daily files and before bulk imports
+        "afc_lookups_20240205.csv.tar.gz",
+        "bulk_import_faregate_20240101_20240229.csv.gz",
+        "bulk_import_ridership_20240301_20240331.csv.gz",
+    ]
+]
+
+
+def overlaps(first: Tuple[float, float], second: Tuple[float, float]) -> bool:
+    """True if (start, end) intervals overlap"""
+    return first[0] < second[1] and second[0] < first[1]
+
+
+def test_afc_load_jobs_serialize_partitions(monkeypatch: pytest.MonkeyPatch) -> None:
+    """files loading into the same partition never run at the same time, lookup load runs alone"""
+    intervals: Dict[str, Tuple[float, float]] = {}
+    lock = threading.Lock()
+
+    def load_afc_file(s3_object: str, *_: Any) -> None:
+        start = time.monotonic()
+        time.sleep(0.05)
+        with lock:
+            intervals[s3_object] = (start, time.monotonic())
+
+    monkeypatch.setattr(afc_job, "load_afc_file", load_afc_file)
+    jobs = afc_load_jobs(S3_OBJECTS, None, None, "afc-bucket/afc_oracle_db_error")
+
+    scheduler = JobScheduler(max_workers=len(S3_OBJECTS), scheduler_name="test_afc_file_load")
+    scheduler.run(jobs)
+    scheduler.raise_for_failures()
+
+    assert sorted(intervals) == sorted(S3_OBJECTS)
+
+    partitions = {
+        s3_object: {
+            (table, month) for table, months in file_partitions(s3_object.split("/")[-1]).items() for month in months
+        }
+        for s3_object in S3_OBJECTS
+    }
+    overlapping: List[Tuple[str, str]] = [
+        (first, second)
+        for i, first in enumerate(S3_OBJECTS)
+        for second in S3_OBJECTS[i + 1 :]
+        if overlaps(intervals[first], intervals[second])
+    ]
+
+    # daily and bulk faregate files share January, February and March ridership files share nothing
+    assert partitions[S3_OBJECTS[0]] & partitions[S3_OBJECTS[7]]
+    assert partitions[S3_OBJECTS[5]] & partitions[S3_OBJECTS[8]] == set()
+
+    lookup_object = S3_OBJECTS[6]
+    assert all(lookup_object not in pair for pair in overlapping)
+    assert all(not partitions[first] & partitions[second] for first, second in overlapping)
+    # files of different partitions load concurrently
+    assert overlapping
+
+
+def test_load_afc_bulk_outside_file_dates(tmp_path: pathlib.Path) -> None:
+    """bulk file with servicedate outside of the date range in its name is rejected before anything is loaded"""
+    afc_path = tmp_path / "bulk_import_faregate_20240101_20240131.csv.gz"
+    with gzip.open(afc_path, "wb") as afc_file:
+        afc_file.write(
+            b"2024-01-31 23:10:00,2024-01-31 00:00:00,1,101,7,1,1,1001,0,1,2024-02-01 00:00:00\n"
+            b"2024-02-01 04:30:00,2024-02-01 00:00:00,1,101,7,2,1,1001,0,1,2024-02-02 00:00:00\n"
+        )
+
+    # database is not used before the file is rejected
+    with pytest.raises(ValueError, match="from 2024-01-31 to 2024-02-01, outside of file name range"):
+        load_afc_bulk(str(afc_path), None, "faregate", None)
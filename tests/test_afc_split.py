@@ -0,0 +1,64 @@
+import datetime
+import gzip
+import pathlib
+
+import pytest
+
+from research_etl.etl_afc.afc_split import split_by_month
+
+HEADERS = ["trxtime", "servicedate", "deviceid", "note"]
+
+# faregate style rows, without header: embedded delimiter and quotes, quoted
+# empty string, unquoted empty (NULL) and literal \N text
+AFC_ROWS = (
+    b'2024-01-31 23:10:00,2024-01-31 00:00:00,101,"gate 3, ""north"" lobby"\n'
+    b'2024-02-01 04:30:00,2024-02-01 00:00:00,102,""\n'
+    b"2024-02-02 01:15:00,2024-02-01 00:00:00,,\\N\n"
+    b"2024-03-01 05:00:00,2024-03-01 00:00:00,103,open\n"
+)
+
+
+def write_gzip(path: pathlib.Path, data: bytes) -> str:
+    """gzip compressed file of data"""
+    with gzip.open(path, "wb") as gzip_file:
+        gzip_file.write(data)
+    return str(path)
+
+
+def test_split_by_month(tmp_path: pathlib.Path) -> None:
+    """rows are written to the file of their servicedate month with values unchanged"""
+    afc_path = write_gzip(tmp_path / "bulk_import_faregate_20240101_20240331.csv.gz", AFC_ROWS)
+    split_dir = tmp_path / "split"
+    split_dir.mkdir()
+
+    split = split_by_month(afc_path, HEADERS, str(split_dir))
+
+    january, february, march = datetime.date(2024, 1, 1), datetime.date(2024, 2, 1), datetime.date(2024, 3, 1)
+    assert split.first_date == datetime.date(2024, 1, 31)
+    assert split.last_date == datetime.date(2024, 3, 1)
+    assert split.row_counts == {january: 1, february: 2, march: 1}
+
+    month_bytes = {month: pathlib.Path(path).read_bytes() for month, path in split.month_files.items()}
+    assert month_bytes == {
+        january: b'2024-01-31 23:10:00,2024-01-31 00:00:00,101,"gate 3, ""north"" lobby"\n',
+        february: b'2024-02-01 04:30:00,2024-02-01 00:00:00,102,""\n2024-02-02 01:15:00,2024-02-01 00:00:00,,\\N\n',
+        march: b"2024-03-01 05:00:00,2024-03-01 00:00:00,103,open\n",
+    }
+
+
+def test_split_empty_file(tmp_path: pathlib.Path) -> None:
+    """file without rows has no months and no servicedate range"""
+    afc_path = write_gzip(tmp_path / "bulk_import_faregate_20240101_20240131.csv.gz", b"")
+
+    split = split_by_month(afc_path, HEADERS, str(tmp_path))
+
+    assert not split.month_files
+    assert split.first_date is None and split.last_date is None
+
+
+def test_split_missing_servicedate(tmp_path: pathlib.Path) -> None:
+    """rows without servicedate fail the split"""
+    afc_path = write_gzip(tmp_path / "bulk_import_faregate_20240101_20240131.csv.gz", b"2024-01-31 23:10:00,,101,\n")
+
+    with pytest.raises(ValueError, match="without servicedate"):
+        split_by_month(afc_path, HEADERS, str(tmp_path))
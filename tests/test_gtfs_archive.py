@@ -0,0 +1,38 @@
+import zipfile
+from io import BytesIO
+from typing import Dict
+
+import polars
+from polars.testing import assert_frame_equal
+
+from research_etl.etl_gtfs.gtfs_archive import GTFSArchive
+from research_etl.etl_gtfs.gtfs_schema import routes_schema
+
+# feed published before listed_route was added to routes.txt
+ROUTES_TXT = (
+    "route_id,agency_id,route_short_name,route_long_name,route_desc,route_type,route_url,"
+    "route_color,route_text_color,route_sort_order,route_fare_class,line_id\n"
+    'Red,1,,Red Line,Rapid Transit,1,https://www.mbta.com/schedules/Red,DA291C,FFFFFF,10010,"Rapid Transit",line-Red\n'
+    "1,1,1,,Key Bus,3,,FFC72C,000000,50010,Local Bus,\n"
+)
+
+
+def gtfs_archive(members: Dict[str, str]) -> GTFSArchive:
+    """GTFS archive of {table_name}.txt members, in memory"""
+    zip_bytes = BytesIO()
+    with zipfile.ZipFile(zip_bytes, "w") as zip_file:
+        for table_name, text in members.items():
+            zip_file.writestr(f"{table_name}.txt", text)
+    return GTFSArchive(zip_bytes)
+
+
+def test_missing_column_is_null() -> None:
+    """schema column missing from member is read as NULL by read_csv and iter_csv_batches"""
+    with gtfs_archive({"routes": ROUTES_TXT}) as archive:
+        routes_df = archive.read_csv("routes", routes_schema)
+        batches_df = polars.concat(archive.iter_csv_batches("routes", routes_schema, 1024 * 1024))
+
+    assert routes_df.columns == list(routes_schema.keys())
+    assert routes_df["listed_route"].null_count() == 2
+    assert routes_df["route_type"].to_list() == [1, 3]
+    assert_frame_equal(routes_df, batches_df)
@@ -0,0 +1,34 @@
+import datetime
+import os
+import pathlib
+import zipfile
+
+from research_etl.etl_gtfs.gtfs_backfill import find_feed_files
+
+FEED_INFO_HEADER = "feed_publisher_name,feed_publisher_url,feed_lang,feed_start_date,feed_end_date,feed_version\n"
+
+
+def write_feed(path: pathlib.Path, feed_version: str) -> None:
+    """GTFS zip file with only a feed_info table"""
+    with zipfile.ZipFile(path, "w") as zip_file:
+        zip_file.writestr(
+            "feed_info.txt",
+            FEED_INFO_HEADER + f'MBTA,http://www.mbta.com,EN,20240701,20240930,"{feed_version}"\n',
+        )
+
+
+def test_find_feed_files_skips_unreadable(tmp_path: pathlib.Path) -> None:
+    """feeds with no feed_version timestamp or that are not zip files are skipped"""
+    write_feed(tmp_path / "a.zip", "Summer 2024, 2024-06-28T14:15:16+00:00, version D")
+    write_feed(tmp_path / "b.zip", "Summer 2024, version E")
+    with open(tmp_path / "c.zip", "wb") as not_zip:
+        not_zip.write(b"<html>not found</html>")
+    with zipfile.ZipFile(tmp_path / "d.zip", "w") as no_feed_info:
+        no_feed_info.writestr("agency.txt", "agency_id\n1\n")
+
+    feed_files = find_feed_files(str(tmp_path))
+
+    assert [feed_file.path for feed_file in feed_files] == [os.path.join(tmp_path, "a.zip")]
+    assert feed_files[0].creation_timestamp == datetime.datetime(2024, 6, 28, 14, 15, 16)
+    assert feed_files[0].valid_start_date == datetime.date(2024, 7, 1)
+    assert feed_files[0].valid_end_date == datetime.date(2024, 9, 30)
@@ -0,0 +1,131 @@
+import os
+import pathlib
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Dict, Generator, List
+
+import pytest
+
+from research_etl.etl_gtfs import gtfs_download
+from research_etl.etl_gtfs.gtfs_download import download_gtfs
+from research_etl.etl_gtfs.gtfs_download import gtfs_feed_headers
+
+GTFS_CONTENT = bytes(range(256)) * 64
+GTFS_ETAG = '"feed-v2"'
+
+
+class GTFSHandler(BaseHTTPRequestHandler):
+    """serves GTFS_CONTENT with ETag, If-None-Match and Range/If-Range support"""
+
+    requests: List[Dict[str, str]] = []
+
+    def log_message(self, *args: object) -> None:  # pylint: disable=arguments-differ
+        """silence request logging"""
+
+    def _send_headers(self, status: int, headers: Dict[str, str]) -> None:
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def _record(self) -> None:
+        self.requests.append({"method": self.command, **dict(self.headers)})
+
+    def do_HEAD(self) -> None:  # pylint: disable=invalid-name
+        """HEAD of GTFS file, 304 if If-None-Match is current ETag"""
+        self._record()
+        if self.headers.get("If-None-Match") == GTFS_ETAG:
+            self._send_headers(304, {"ETag": GTFS_ETAG})
+            return
+        self._send_headers(200, {"ETag": GTFS_ETAG, "Content-Length": str(len(GTFS_CONTENT))})
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """GET of GTFS file, range is only honored if If-Range is current ETag"""
+        self._record()
+        byte_range = self.headers.get("Range")
+        if byte_range is not None and self.headers.get("If-Range") == GTFS_ETAG:
+            first_byte = int(byte_range.replace("bytes=", "").split("-")[0])
+            if first_byte >= len(GTFS_CONTENT):
+                self._send_headers(416, {"Content-Range": f"bytes */{len(GTFS_CONTENT)}", "Content-Length": "0"})
+                return
+            body = GTFS_CONTENT[first_byte:]
+            self._send_headers(
+                206,
+                {
+                    "ETag": GTFS_ETAG,
+                    "Content-Length": str(len(body)),
+                    "Content-Range": f"bytes {first_byte}-{len(GTFS_CONTENT) - 1}/{len(GTFS_CONTENT)}",
+                },
+            )
+            self.wfile.write(body)
+            return
+
+        self._send_headers(200, {"ETag": GTFS_ETAG, "Content-Length": str(len(GTFS_CONTENT))})
+        self.wfile.write(GTFS_CONTENT)
+
+
+@pytest.fixture(name="gtfs_url")
+def fixture_gtfs_url() -> Generator[str, None, None]:
+    """url of local GTFS server"""
+    GTFSHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GTFSHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/MBTA_GTFS.zip"
+    server.shutdown()
+    server.server_close()
+
+
+def test_feed_headers_not_modified(gtfs_url: str) -> None:
+    """HEAD with current ETag is 304, no headers are returned"""
+    assert gtfs_feed_headers(gtfs_url, GTFS_ETAG) is None
+
+    headers = gtfs_feed_headers(gtfs_url, '"feed-v1"')
+    assert headers is not None
+    assert headers.get("ETag") == GTFS_ETAG
+
+    assert [request["method"] for request in GTFSHandler.requests] == ["HEAD", "HEAD"]
+
+
+def test_download_resumes_part(gtfs_url: str, tmp_path: pathlib.Path) -> None:
+    """existing part file is continued with a Range request"""
+    local_path = os.path.join(tmp_path, "MBTA_GTFS.zip")
+    with open(f"{local_path}.part", "wb") as part_file:
+        part_file.write(GTFS_CONTENT[:1000])
+
+    headers = download_gtfs(local_path, gtfs_url, GTFS_ETAG)
+
+    assert headers.get("Content-Range") is not None
+    assert GTFSHandler.requests[-1]["Range"] == "bytes=1000-"
+    assert not os.path.exists(f"{local_path}.part")
+    with open(local_path, "rb") as gtfs_file:
+        assert gtfs_file.read() == GTFS_CONTENT
+
+
+def test_download_if_range_changed(gtfs_url: str, tmp_path: pathlib.Path) -> None:
+    """part file of a replaced feed is overwritten by the full file, not appended to"""
+    local_path = os.path.join(tmp_path, "MBTA_GTFS.zip")
+    with open(f"{local_path}.part", "wb") as part_file:
+        part_file.write(b"x" * 1000)
+
+    headers = download_gtfs(local_path, gtfs_url, '"feed-v1"')
+
+    assert headers.get("Content-Range") is None
+    assert GTFSHandler.requests[-1]["If-Range"] == '"feed-v1"'
+    with open(local_path, "rb") as gtfs_file:
+        assert gtfs_file.read() == GTFS_CONTENT
+
+
+def test_download_range_not_satisfiable(gtfs_url: str, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """part file longer than the feed is discarded and the download restarted"""
+    monkeypatch.setattr(gtfs_download.time, "sleep", lambda _: None)
+    local_path = os.path.join(tmp_path, "MBTA_GTFS.zip")
+    with open(f"{local_path}.part", "wb") as part_file:
+        part_file.write(GTFS_CONTENT + b"x")
+
+    download_gtfs(local_path, gtfs_url, GTFS_ETAG)
+
+    assert [request.get("Range") for request in GTFSHandler.requests] == [f"bytes={len(GTFS_CONTENT) + 1}-", None]
+    with open(local_path, "rb") as gtfs_file:
+        assert gtfs_file.read() == GTFS_CONTENT
@@ -0,0 +1,53 @@
+import datetime
+from typing import List
+
+import polars
+
+from research_etl.etl_gtfs.gtfs_job import TABLES_TO_LOAD
+from research_etl.etl_gtfs.gtfs_job import expand_service_dates
+from research_etl.etl_gtfs.gtfs_job import prepare_gtfs_table
+
+TABLES = {table.table_name: table for table in TABLES_TO_LOAD}
+VALID_START_DATE = datetime.date(2024, 7, 1)
+VALID_END_DATE = datetime.date(2024, 7, 7)
+
+
+def gtfs_table(table_name: str, rows: List[tuple]) -> polars.DataFrame:
+    """GTFS table rows as read from a feed, with dates converted"""
+    table = TABLES[table_name]
+    table_df = polars.DataFrame(rows, schema=table.schema, orient="row")
+    return prepare_gtfs_table(table_df, table, VALID_START_DATE, VALID_END_DATE)
+
+
+def test_expand_service_dates() -> None:
+    """calendar days of week are expanded, then calendar_dates exceptions added and removed"""
+    calendar_df = gtfs_table(
+        "calendar",
+        [
+            ("weekday", 1, 1, 1, 1, 1, 0, 0, "20240701", "20240707"),
+            ("sunday", 0, 0, 0, 0, 0, 0, 1, "20240701", "20240707"),
+        ],
+    )
+    calendar_dates_df = gtfs_table(
+        "calendar_dates",
+        [
+            # holiday, weekday service removed and sunday service added
+            ("weekday", "20240704", 2, "Independence Day"),
+            ("sunday", "20240704", 1, "Independence Day"),
+            # service added on a day not in any calendar
+            ("weekday", "20240706", 1, None),
+        ],
+    )
+
+    service_dates_df = expand_service_dates(calendar_df, calendar_dates_df)
+
+    july = [datetime.date(2024, 7, day) for day in range(1, 8)]
+    assert service_dates_df.rows() == [
+        (july[0], "weekday"),
+        (july[1], "weekday"),
+        (july[2], "weekday"),
+        (july[3], "sunday"),
+        (july[4], "weekday"),
+        (july[5], "weekday"),
+        (july[6], "sunday"),
+    ]
@@ -0,0 +1,67 @@
+import datetime
+from typing import Any, Dict, List, Optional
+
+import pytest
+import sqlalchemy as sa
+
+from research_etl.utils.util_rds import DatabaseManager
+from research_etl.etl_gtfs import gtfs_retention
+from research_etl.etl_gtfs.gtfs_retention import drop_superseded_feed
+from research_etl.etl_gtfs.gtfs_retention import superseded_feeds
+
+
+def feed(feed_version: Optional[str], month: int) -> Dict[str, Any]:
+    """feed_info row of feed created and valid in month of 2024"""
+    return {
+        "feed_version": feed_version,
+        "valid_start_date": datetime.date(2024, month, 1),
+        "valid_end_date": datetime.date(2024, month, 28),
+        "creation_timestamp": datetime.datetime(2024, month, 1),
+    }
+
+
+def test_superseded_feeds() -> None:
+    """older feeds of a rating are superseded by its last feed, feeds in the window or without feed_version are kept"""
+    feeds = [
+        feed("Winter 2024, 2024-01-01T00:00:00+00:00, version A", 1),
+        feed(None, 2),
+        feed("Winter 2024, 2024-03-01T00:00:00+00:00, version B", 3),
+        feed("Spring 2024, 2024-04-01T00:00:00+00:00, version A", 4),
+        feed("Spring 2024, 2024-05-01T00:00:00+00:00, version B", 5),
+    ]
+
+    assert superseded_feeds(feeds, datetime.date(2024, 5, 1)) == [feeds[0], feeds[3]]
+    assert superseded_feeds(feeds, datetime.date(2024, 4, 1)) == [feeds[0]]
+
+
+def test_drop_superseded_feed(db_manager: DatabaseManager, monkeypatch: pytest.MonkeyPatch) -> None:
+    """partitions of feed are dropped and export recorded, feed_version is quoted"""
+    exported: List[str] = []
+
+    def export_partition(_: DatabaseManager, partition: str, feed_prefix: str) -> str:
+        exported.append(partition)
+        return f"{feed_prefix}/{partition}.csv.gz"
+
+    monkeypatch.setattr(gtfs_retention, "export_partition", export_partition)
+
+    superseded = feed("Winter 2024, 2024-01-01T00:00:00+00:00, version 'A'", 1)
+    superseded["valid_start_date"] = datetime.date(2098, 1, 1)
+    superseded["valid_end_date"] = datetime.date(2098, 3, 31)
+    partition = "gtfs.agency_20980101_20980331"
+    db_manager.execute(sa.text(f"CREATE TABLE {partition} (LIKE gtfs.agency)"))
+
+    try:
+        reclaimed_bytes = drop_superseded_feed(db_manager, superseded, [partition], "s3://bucket/gtfs")
+
+        assert exported == [partition]
+        assert reclaimed_bytes > 0
+        assert db_manager.select_as_list(sa.text(f"SELECT to_regclass('{partition}') AS partition")) == [
+            {"partition": None}
+        ]
+        export_query = "SELECT feed_version, export_path FROM gtfs.feed_export WHERE valid_start_date = '2098-01-01'"
+        assert db_manager.select_as_list(sa.text(export_query)) == [
+            {"feed_version": superseded["feed_version"], "export_path": "s3://bucket/gtfs/20980101_20980331"}
+        ]
+    finally:
+        db_manager.execute(sa.text(f"DROP TABLE IF EXISTS {partition}"))
+        db_manager.execute(sa.text("DELETE FROM gtfs.feed_export WHERE valid_start_date = '2098-01-01'"))
@@ -0,0 +1,78 @@
+import datetime
+import zipfile
+from io import BytesIO
+from typing import Generator
+
+import pytest
+import sqlalchemy as sa
+
+from research_etl.utils.util_rds import DatabaseManager
+from research_etl.etl_gtfs.gtfs_archive import GTFSArchive
+from research_etl.etl_gtfs.gtfs_job import TABLES_TO_LOAD
+from research_etl.etl_gtfs.gtfs_job import load_gtfs_table
+from research_etl.etl_gtfs.gtfs_job import load_or_clone_partition
+from research_etl.etl_gtfs.gtfs_job import process_feed_info
+from research_etl.etl_gtfs.gtfs_staging import completed_tables
+
+VALID_START_DATE = datetime.date(2099, 1, 1)
+VALID_END_DATE = datetime.date(2099, 3, 31)
+
+AGENCY = TABLES_TO_LOAD[[table.table_name for table in TABLES_TO_LOAD].index("agency")]
+
+
+def gtfs_archive(feed_version: str, agency_name: str) -> GTFSArchive:
+    """GTFS archive of feed_info and agency tables, in memory"""
+    zip_bytes = BytesIO()
+    with zipfile.ZipFile(zip_bytes, "w") as zip_file:
+        zip_file.writestr(
+            "feed_info.txt",
+            "feed_publisher_name,feed_publisher_url,feed_lang,feed_start_date,feed_end_date,feed_version\n"
+            f'MBTA,http://www.mbta.com,EN,20990101,20990331,"{feed_version}"\n',
+        )
+        zip_file.writestr(
+            "agency.txt",
+            "agency_id,agency_name,agency_url,agency_timezone\n"
+            f"1,{agency_name},http://www.mbta.com,America/New_York\n",
+        )
+    return GTFSArchive(zip_bytes)
+
+
+def stage_agency(db_manager: DatabaseManager, archive: GTFSArchive) -> int:
+    """stage feed_info and the agency table of feed, as the feed load does"""
+    process_feed_info(db_manager, archive)
+    return load_or_clone_partition(
+        db_manager,
+        "agency",
+        archive.table_hash("agency"),
+        VALID_START_DATE,
+        VALID_END_DATE,
+        lambda: load_gtfs_table(db_manager, archive, AGENCY, VALID_START_DATE, VALID_END_DATE),
+    )
+
+
+@pytest.fixture(name="feed_db")
+def fixture_feed_db(db_manager: DatabaseManager) -> Generator[DatabaseManager, None, None]:
+    """test database, with partitions, staging tables and state of the test feed dropped after the test"""
+    yield db_manager
+    db_manager.execute(sa.text("SELECT gtfs.drop_feed('20990101', '20990331')"))
+    db_manager.execute(sa.text("DELETE FROM gtfs.feed_load_state WHERE valid_start_date = '2099-01-01'"))
+
+
+def test_new_version_replaces_failed_load(feed_db: DatabaseManager) -> None:
+    """feed version with the same dates as a failed partial load of another version is staged from scratch"""
+    with gtfs_archive("Winter 2099, 2098-12-20T10:00:00+00:00, version A", "MBTA") as archive_a:
+        stage_agency(feed_db, archive_a)
+    # load of version A fails before any other table is staged
+
+    with gtfs_archive("Winter 2099, 2098-12-21T10:00:00+00:00, version B", "MBTA Transit") as archive_b:
+        assert stage_agency(feed_db, archive_b) == 1
+        agency_hash = archive_b.table_hash("agency")
+
+    table_hashes = feed_db.select_as_list(
+        sa.text("SELECT table_name, content_hash FROM gtfs.feed_table_hash WHERE valid_start_date = '2099-01-01'")
+    )
+    assert table_hashes == [{"table_name": "agency", "content_hash": agency_hash}]
+    assert completed_tables(feed_db, VALID_START_DATE, VALID_END_DATE) == {"agency": 1}
+
+    agency_names = feed_db.select_as_list(sa.text("SELECT agency_name FROM gtfs.agency_20990101_20990331_stg"))
+    assert agency_names == [{"agency_name": "MBTA Transit"}]
@@ -0,0 +1,129 @@
+import pathlib
+import threading
+import time
+from typing import Any, Dict, Generator, List
+
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+from research_etl.utils import util_aws
+from research_etl.utils.util_aws import S3RangedReader
+from research_etl.utils.util_aws import get_s3_client
+
+BUCKET = "test-bucket"
+OBJECT_KEY = "afc/20240102_faregate_1.csv.gz"
+OBJECT_PATH = f"s3://{BUCKET}/{OBJECT_KEY}"
+OBJECT_BYTES = bytes(range(256)) * 41
+
+
+@pytest.fixture(name="s3_client")
+def fixture_s3_client(monkeypatch: pytest.MonkeyPatch) -> Generator[Any, None, None]:
+    """moto S3 client with BUCKET holding OBJECT_BYTES at OBJECT_KEY, client cache is emptied"""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.delenv("AWS_PROFILE", raising=False)
+    monkeypatch.delenv("AWS_ENDPOINT_URL_S3", raising=False)
+    monkeypatch.setattr(util_aws, "S3_CLIENTS", {})
+
+    with mock_aws():
+        s3_client = get_s3_client()
+        s3_client.create_bucket(Bucket=BUCKET)
+        s3_client.put_object(Bucket=BUCKET, Key=OBJECT_KEY, Body=OBJECT_BYTES)
+        yield s3_client
+
+
+class SlowFirstPartsClient:
+    """S3 client wrapper, ranged GETs of earlier bytes take longer, concurrent GETs are counted"""
+
+    def __init__(self, s3_client: Any) -> None:
+        self.s3_client = s3_client
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.ranges: List[str] = []
+
+    def head_object(self, **kwargs: Any) -> Dict[str, Any]:
+        """HEAD of object"""
+        return self.s3_client.head_object(**kwargs)
+
+    def get_object(self, **kwargs: Any) -> Dict[str, Any]:
+        """ranged GET of object, first byte 0 waits longest"""
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.ranges.append(kwargs["Range"])
+        first_byte = int(kwargs["Range"].replace("bytes=", "").split("-")[0])
+        time.sleep(max(0.0, 0.05 - first_byte / len(OBJECT_BYTES) * 0.05))
+        try:
+            return self.s3_client.get_object(**kwargs)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+@pytest.mark.usefixtures("s3_client")
+def test_ranged_reader_reads_object() -> None:
+    """reads of any size return object bytes in order, in part_size ranged GETs"""
+    with S3RangedReader(OBJECT_PATH, part_size=1000, max_parts_ahead=3) as reader:
+        chunks = [reader.read(777)]
+        while chunk := reader.read(777):
+            chunks.append(chunk)
+
+        assert b"".join(chunks) == OBJECT_BYTES
+        assert reader.read() == b""
+        assert reader.bytes_read == len(OBJECT_BYTES)
+        assert reader.part_count == 11
+
+
+def test_ranged_reader_read_ahead_order(s3_client: Any, monkeypatch: pytest.MonkeyPatch) -> None:
+    """parts finishing out of order are read in order, at most max_parts_ahead GETs run at a time"""
+    slow_client = SlowFirstPartsClient(s3_client)
+    monkeypatch.setattr(util_aws, "get_s3_client", lambda: slow_client)
+
+    with S3RangedReader(OBJECT_PATH, part_size=1000, max_parts_ahead=4) as reader:
+        assert reader.read() == OBJECT_BYTES
+
+    assert slow_client.max_running <= 4
+    assert sorted(slow_client.ranges, key=lambda r: int(r[6:].split("-")[0])) == [
+        f"bytes={offset}-{min(offset + 1000, len(OBJECT_BYTES)) - 1}" for offset in range(0, len(OBJECT_BYTES), 1000)
+    ]
+
+
+def test_ranged_reader_object_replaced(s3_client: Any) -> None:
+    """object replaced during read fails the read instead of mixing object versions"""
+    with S3RangedReader(OBJECT_PATH, part_size=1000, max_parts_ahead=1) as reader:
+        assert reader.read(1000) == OBJECT_BYTES[:1000]
+
+        s3_client.put_object(Bucket=BUCKET, Key=OBJECT_KEY, Body=OBJECT_BYTES[::-1])
+
+        with pytest.raises(ClientError) as client_error:
+            reader.read()
+
+    assert client_error.value.response["Error"]["Code"] == "PreconditionFailed"
+
+
+def test_s3_client_per_profile(s3_client: Any, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """one client is created per AWS profile and shared, including by concurrent callers"""
+    config_path = tmp_path / "config"
+    config_path.write_text("[profile research]\nregion = us-east-1\n")
+    monkeypatch.setenv("AWS_CONFIG_FILE", str(config_path))
+
+    assert get_s3_client() is s3_client
+
+    monkeypatch.setenv("AWS_PROFILE", "research")
+    monkeypatch.setattr(util_aws, "S3_CLIENTS", {None: s3_client})
+    clients: List[Any] = []
+    threads = [threading.Thread(target=lambda: clients.append(get_s3_client())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(client) for client in clients}) == 1
+    assert clients[0] is not s3_client
+    assert set(util_aws.S3_CLIENTS) == {None, "research"}
+
+    monkeypatch.delenv("AWS_PROFILE")
+    assert get_s3_client() is s3_client
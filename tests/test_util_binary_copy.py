@@ -0,0 +1,80 @@
+import datetime
+import struct
+
+import polars
+
+from research_etl.utils.util_binary_copy import BINARY_COPY_HEADER
+from research_etl.utils.util_binary_copy import BINARY_COPY_TRAILER
+from research_etl.utils.util_binary_copy import BinaryCopyStream
+from research_etl.utils.util_binary_copy import encode_binary_rows
+
+COLUMN_TYPES = {
+    "stop_sequence": "integer",
+    "stop_id": "text",
+    "service_date": "date",
+    "arrival_time": "interval",
+}
+
+
+def field(payload: bytes) -> bytes:
+    """binary COPY field, length prefixed payload"""
+    return struct.pack(">i", len(payload)) + payload
+
+
+NULL_FIELD = struct.pack(">i", -1)
+
+
+def test_encode_binary_rows() -> None:
+    """values and NULLs of each type are encoded as postgres binary COPY tuples"""
+    df = polars.DataFrame(
+        {
+            "stop_sequence": [1, None],
+            "stop_id": ["place-sstat", None],
+            "service_date": [datetime.date(2024, 1, 2), None],
+            "arrival_time": ["25:01:02", None],
+        }
+    )
+
+    # days since 2000-01-01
+    service_date = (datetime.date(2024, 1, 2) - datetime.date(2000, 1, 1)).days
+    # microseconds, days, months
+    arrival_time = struct.pack(">qii", (25 * 3600 + 60 + 2) * 1_000_000, 0, 0)
+
+    expected = (
+        struct.pack(">h", 4)
+        + field(struct.pack(">i", 1))
+        + field(b"place-sstat")
+        + field(struct.pack(">i", service_date))
+        + field(arrival_time)
+        + struct.pack(">h", 4)
+        + NULL_FIELD * 4
+    )
+
+    assert bytes(encode_binary_rows(df, COLUMN_TYPES)) == expected
+
+
+def test_encode_empty_text() -> None:
+    """empty string is encoded as zero length field, not NULL"""
+    df = polars.DataFrame({"stop_id": ["", None]})
+
+    expected = struct.pack(">h", 1) + field(b"") + struct.pack(">h", 1) + NULL_FIELD
+
+    assert bytes(encode_binary_rows(df, COLUMN_TYPES)) == expected
+
+
+def test_binary_copy_stream() -> None:
+    """stream is header, tuples of every frame in batch_rows batches, then trailer"""
+    frames = [
+        polars.DataFrame({"stop_sequence": [1, 2, 3]}),
+        polars.DataFrame({"stop_sequence": [4]}),
+    ]
+    stream = BinaryCopyStream(frames, COLUMN_TYPES, batch_rows=2)
+
+    tuples = b"".join(struct.pack(">h", 1) + field(struct.pack(">i", i)) for i in range(1, 5))
+
+    # small reads cross encoded chunk boundaries
+    data = b""
+    while chunk := stream.read(5):
+        data += chunk
+
+    assert data == BINARY_COPY_HEADER + tuples + BINARY_COPY_TRAILER